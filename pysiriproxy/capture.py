@@ -0,0 +1,572 @@
+# Copyright (C) 2012 Brett Ponsler, Pete Lamonica
+# This file is part of pysiriproxy.
+#
+# pysiriproxy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pysiriproxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pysiriproxy.  If not, see <http://www.gnu.org/licenses/>.
+'''The capture module contains the PacketCapture class which records the
+raw data received from the iPhone and from Apple's web server, so that
+sessions can be replayed and analyzed later.
+
+Capturing is enabled by setting the 'File' property in the 'Capture' section
+of the configuration file. Sessions with the clients listed in the 'Clients'
+property are always captured, and a 'SampleRate' percent of the other
+sessions are captured.
+
+Received data is appended to an in memory ring buffer by the twisted reactor
+thread, and a background thread writes the buffer to the capture file. The
+reactor never waits for the writer: once the buffer holds 'BufferRecords'
+records the oldest records are dropped.
+
+A capture file starts with an eight byte header containing the
+:attr:`CaptureFormat.Magic` string and the version of the format, and is
+followed by the records. Each record has a header containing the time the
+data was received, the id of the session, the direction of the data, and the
+length of the data, which is followed by the data itself. Once the writer is
+closed, an index with an entry for each record is written after the records,
+followed by a footer containing the location of the index. The
+:class:`CaptureFile` class reads capture files through a memory map, using
+the index to find the records of a session, or the records received at a
+given time, without reading the rest of the file.
+
+'''
+from mmap import mmap, ACCESS_READ
+from time import time, sleep
+from random import random
+from bisect import bisect_left
+from threading import Thread
+from collections import deque
+from os.path import exists, getsize
+from struct import Struct
+
+from twisted.internet import reactor
+
+from pysiriproxy.constants import Directions
+from pysiriproxy.options.options import Options
+from pysiriproxy.options.config import Ids, Sections
+
+
+class CaptureFormat:
+    '''The CaptureFormat class defines the layout of a capture file.'''
+
+    Magic = "PSPCAP"
+    '''The string that every capture file starts with.'''
+
+    Version = 2
+    '''The version of the capture file format.'''
+
+    Header = Struct(">6sH")
+    '''The header of the file: the magic string, and the version.'''
+
+    Record = Struct(">dIBI")
+    '''The header of each record: the time the data was received, the id of
+    the session, the direction of the data, and the length of the data.
+
+    '''
+
+    IndexEntry = Struct(">QdIBI")
+    '''An entry in the index: the offset of the data of the record, the
+    time the data was received, the id of the session, the direction of the
+    data, and the length of the data.
+
+    '''
+
+    IndexMagic = "PSPIDX"
+    '''The string that the footer of a file with an index ends with.'''
+
+    Footer = Struct(">QQ6s")
+    '''The footer of a file with an index: the offset of the index, the
+    number of records, and the index magic string.
+
+    '''
+
+    DirectionNames = [Directions.From_iPhone, Directions.From_Server]
+    '''The directions, indexed by the direction stored in a record.'''
+
+    DirectionCodes = dict((direction, code) for code, direction in \
+                              enumerate(DirectionNames))
+    '''The dictionary mapping directions to the value stored in a record.'''
+
+
+class PacketCapture:
+    '''The PacketCapture class decides which sessions are captured, and
+    buffers the data received by their connections until the writer thread
+    writes it to the capture file.
+
+    '''
+    # Implement the borg pattern
+    __shared_state = {}
+
+    DefaultBufferRecords = 4096
+    '''The default number of records the ring buffer holds.'''
+
+    FlushInterval = 0.5
+    '''The number of seconds between writes to the capture file.'''
+
+    def __init__(self):
+        self.__dict__ = self.__shared_state
+
+        if getattr(self, "enabled", None) is None:
+            self.enabled = False
+            self._clients = frozenset()
+            self._sampleRate = 0.0
+            self._buffer = deque()
+            self._buffered = 0
+            self._nextSession = 1
+            self._writer = None
+
+    def start(self, filename, clients=(), sampleRate=100.0,
+              bufferRecords=DefaultBufferRecords):
+        '''Start capturing sessions.
+
+        * filename -- The file the captured data is written to
+        * clients -- The list of addresses of clients which are always
+                     captured
+        * sampleRate -- The percent of other sessions which are captured
+        * bufferRecords -- The maximum number of records in the buffer
+
+        '''
+        self.stop()
+
+        self._clients = frozenset(clients)
+        self._sampleRate = sampleRate
+        self._buffer = deque(maxlen=bufferRecords)
+        self._buffered = 0
+
+        # Continue after the sessions already in the file, so that the
+        # sessions of each run can be told apart
+        self._nextSession = 1
+        if exists(filename) and getsize(filename) > 0:
+            existing = CaptureFile(filename)
+            self._nextSession += max(existing.getSessions() or [0])
+            existing.close()
+
+        self._writer = _CaptureWriter(filename, self._buffer,
+                                      self.FlushInterval)
+        self.enabled = True
+
+    def stop(self):
+        '''Stop capturing sessions, and write the remaining buffered data.'''
+        if self._writer is None:
+            return
+
+        self.enabled = False
+        self._writer.close()
+        self._writer = None
+
+    def startSession(self, address):
+        '''Decide whether a new session is captured, and return its session
+        id, or None if the session is not captured.
+
+        * address -- The address of the client
+
+        '''
+        if not self.enabled:
+            return None
+
+        if address not in self._clients and \
+                random() * 100 >= self._sampleRate:
+            return None
+
+        sessionId = self._nextSession
+        self._nextSession += 1
+        return sessionId
+
+    def record(self, sessionId, direction, data):
+        '''Record data received by a connection of a captured session.
+
+        * sessionId -- The id of the session
+        * direction -- The direction of the connection
+        * data -- The data
+
+        '''
+        # Appending to a deque is atomic, and drops the oldest record
+        # once the buffer is full
+        self._buffer.append((time(), sessionId,
+                             CaptureFormat.DirectionCodes[direction], data))
+        self._buffered += 1
+
+    def getDropped(self):
+        '''Get the number of records which were dropped because the buffer
+        was full.
+
+        '''
+        if self._writer is None:
+            return 0
+
+        return self._buffered - self._writer.written - len(self._buffer)
+
+
+class _CaptureWriter:
+    '''The _CaptureWriter class writes the records in the ring buffer to
+    the capture file from a background thread, and writes the index of the
+    records once it is closed.
+
+    '''
+
+    def __init__(self, filename, buffer, interval):
+        '''
+        * filename -- The file the records are written to
+        * buffer -- The ring buffer
+        * interval -- The number of seconds between writes
+
+        '''
+        self.__filename = filename
+        self.__buffer = buffer
+        self.__interval = interval
+        self.__running = True
+
+        self.written = 0
+
+        self.__thread = Thread(target=self.__run, name="CaptureWriter")
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def close(self):
+        '''Write the remaining records and the index, and close the
+        file.
+
+        '''
+        self.__running = False
+        self.__thread.join()
+
+    ##### Private functions #####
+
+    def __run(self):
+        '''Write the buffered records until the writer is closed.'''
+        captureFile, index, position = self.__open()
+
+        with captureFile:
+            running = True
+            while running:
+                # Check whether to stop before writing, so the records
+                # buffered before the writer was closed are written
+                running = self.__running
+                if running:
+                    sleep(self.__interval)
+
+                chunks = []
+                while True:
+                    try:
+                        received, sessionId, direction, data = \
+                            self.__buffer.popleft()
+                    except IndexError:
+                        break
+
+                    chunks.append(CaptureFormat.Record.pack(
+                            received, sessionId, direction, len(data)))
+                    chunks.append(data)
+
+                    position += CaptureFormat.Record.size
+                    index += CaptureFormat.IndexEntry.pack(
+                        position, received, sessionId, direction, len(data))
+                    position += len(data)
+
+                    self.written += 1
+
+                if len(chunks) > 0:
+                    captureFile.write(''.join(chunks))
+                    captureFile.flush()
+
+            # The index follows the records, and the footer locates it
+            numRecords = len(index) / CaptureFormat.IndexEntry.size
+            captureFile.write(index)
+            captureFile.write(CaptureFormat.Footer.pack(
+                    position, numRecords, CaptureFormat.IndexMagic))
+
+    def __open(self):
+        '''Open the capture file for writing. Returns the file, the index of
+        the records already in the file, and the offset to write the next
+        record at.
+
+        '''
+        if not exists(self.__filename) or getsize(self.__filename) == 0:
+            captureFile = open(self.__filename, "wb")
+            captureFile.write(CaptureFormat.Header.pack(
+                    CaptureFormat.Magic, CaptureFormat.Version))
+            return captureFile, bytearray(), CaptureFormat.Header.size
+
+        # Keep the index of the existing records, and overwrite the old
+        # index with the new records
+        existing = CaptureFile(self.__filename)
+        index = bytearray(existing.getIndex())
+        position = existing.getRecordsEnd()
+        existing.close()
+
+        captureFile = open(self.__filename, "r+b")
+        captureFile.seek(position)
+        captureFile.truncate()
+        return captureFile, index, position
+
+
+class CaptureFile:
+    '''The CaptureFile class reads a capture file through a memory map, so
+    that opening a large capture only reads its index, and each record is
+    only read when it is used.
+
+    Records can be read by their position in the file, by session, and by the
+    time they were received. A file which was not closed properly has no
+    index, in which case the index is created by reading the header of each
+    record.
+
+    '''
+
+    def __init__(self, filename):
+        '''
+        * filename -- The capture file
+
+        '''
+        self.__file = open(filename, "rb")
+        size = getsize(filename)
+
+        if size < CaptureFormat.Header.size:
+            self.__file.close()
+            raise Exception("Not a capture file: %s" % filename)
+
+        self.__map = mmap(self.__file.fileno(), 0, access=ACCESS_READ)
+
+        magic, version = CaptureFormat.Header.unpack_from(self.__map, 0)
+        if magic != CaptureFormat.Magic or version > CaptureFormat.Version:
+            self.close()
+            raise Exception("Not a capture file: %s" % filename)
+
+        if not self.__readIndex(size):
+            self.__createIndex(size)
+
+        # The dictionary mapping session ids to the list of positions of
+        # their records, which is created when it is first needed
+        self.__sessions = None
+
+    def __len__(self):
+        '''Get the number of records in the file.'''
+        return self.__numRecords
+
+    def close(self):
+        '''Close the file.'''
+        self.__map.close()
+        self.__file.close()
+
+    def getRecord(self, position):
+        '''Get a (time, session id, direction, data) tuple for a record.
+
+        * position -- The position of the record in the file
+
+        '''
+        offset, received, sessionId, direction, length = \
+            self.__getEntry(position)
+
+        return (received, sessionId, CaptureFormat.DirectionNames[direction],
+                self.__map[offset:offset + length])
+
+    def getTime(self, position):
+        '''Get the time a record was received.
+
+        * position -- The position of the record in the file
+
+        '''
+        return self.__getEntry(position)[1]
+
+    def getSessions(self):
+        '''Get the sorted list of the ids of the sessions in the file.'''
+        return sorted(self.__getSessions().keys())
+
+    def findTime(self, when):
+        '''Get the position of the first record received at, or after, the
+        given time.
+
+        * when -- The time
+
+        '''
+        return bisect_left(_Times(self), when)
+
+    def iterRecords(self, sessionId=None, start=None, end=None):
+        '''Iterate over the (time, session id, direction, data) tuples of the
+        records in the file, in the order they were received.
+
+        * sessionId -- Only include the records of this session
+        * start -- Only include records received at, or after, this time
+        * end -- Only include records received before this time
+
+        '''
+        if sessionId is not None:
+            positions = self.__getSessions().get(sessionId, [])
+        else:
+            first = 0 if start is None else self.findTime(start)
+            positions = xrange(first, self.__numRecords)
+
+        for position in positions:
+            received = self.getTime(position)
+            if start is not None and received < start:
+                continue
+            if end is not None and received >= end:
+                break
+
+            yield self.getRecord(position)
+
+    def getIndex(self):
+        '''Get the string containing the index entries of the records.'''
+        start = self.__indexStart
+        end = start + self.__numRecords * CaptureFormat.IndexEntry.size
+        return self.__index[start:end]
+
+    def getRecordsEnd(self):
+        '''Get the offset of the end of the last record in the file.'''
+        return self.__recordsEnd
+
+    ##### Private functions #####
+
+    def __getEntry(self, position):
+        '''Get the (offset, time, session id, direction, length) tuple in the
+        index for a record.
+
+        * position -- The position of the record in the file
+
+        '''
+        if position < 0 or position >= self.__numRecords:
+            raise IndexError("No record %d" % position)
+
+        return CaptureFormat.IndexEntry.unpack_from(
+            self.__index,
+            self.__indexStart + position * CaptureFormat.IndexEntry.size)
+
+    def __getSessions(self):
+        '''Get the dictionary mapping session ids to the list of positions
+        of their records.
+
+        '''
+        if self.__sessions is None:
+            self.__sessions = {}
+            for position in xrange(self.__numRecords):
+                sessionId = self.__getEntry(position)[2]
+                self.__sessions.setdefault(sessionId, []).append(position)
+
+        return self.__sessions
+
+    def __readIndex(self, size):
+        '''Read the location of the index from the footer of the file.
+        Returns False if the file does not have a valid index.
+
+        * size -- The size of the file
+
+        '''
+        footerSize = CaptureFormat.Footer.size
+        if size < CaptureFormat.Header.size + footerSize:
+            return False
+
+        indexStart, numRecords, magic = \
+            CaptureFormat.Footer.unpack_from(self.__map, size - footerSize)
+        indexSize = numRecords * CaptureFormat.IndexEntry.size
+
+        if magic != CaptureFormat.IndexMagic or \
+                indexStart + indexSize + footerSize != size:
+            return False
+
+        self.__index = self.__map
+        self.__indexStart = indexStart
+        self.__numRecords = numRecords
+        self.__recordsEnd = indexStart
+        return True
+
+    def __createIndex(self, size):
+        '''Create the index by reading the header of every record, ignoring
+        a record which was only partly written.
+
+        * size -- The size of the file
+
+        '''
+        index = bytearray()
+        numRecords = 0
+
+        position = CaptureFormat.Header.size
+        while position + CaptureFormat.Record.size <= size:
+            received, sessionId, direction, length = \
+                CaptureFormat.Record.unpack_from(self.__map, position)
+
+            offset = position + CaptureFormat.Record.size
+            if offset + length > size:
+                break
+
+            index += CaptureFormat.IndexEntry.pack(offset, received,
+                                                   sessionId, direction,
+                                                   length)
+            numRecords += 1
+            position = offset + length
+
+        self.__index = str(index)
+        self.__indexStart = 0
+        self.__numRecords = numRecords
+        self.__recordsEnd = position
+
+
+class _Times:
+    '''The _Times class is a sequence of the times the records in a capture
+    file were received, which is used to search for a time without reading
+    every time.
+
+    '''
+
+    def __init__(self, captureFile):
+        '''
+        * captureFile -- The CaptureFile
+
+        '''
+        self.__captureFile = captureFile
+
+    def __len__(self):
+        return len(self.__captureFile)
+
+    def __getitem__(self, position):
+        return self.__captureFile.getTime(position)
+
+
+def readRecords(filename):
+    '''Read the records in a capture file. Yields a (time, session id,
+    direction, data) tuple for each record.
+
+    * filename -- The capture file
+
+    '''
+    captureFile = CaptureFile(filename)
+    try:
+        for record in captureFile.iterRecords():
+            yield record
+    finally:
+        captureFile.close()
+
+
+def start(logger):
+    '''Start capturing sessions, if the 'File' property in the 'Capture'
+    section is not empty.
+
+    * logger -- The logger
+
+    '''
+    filename = Options.get(Sections.Capture, Ids.File, "")
+    if filename is None or len(filename.strip()) == 0:
+        return
+
+    clients = Options.get(Sections.Capture, Ids.Clients, "")
+    sampleRate = Options.get(Sections.Capture, Ids.SampleRate, 100.0)
+    bufferRecords = Options.get(Sections.Capture, Ids.BufferRecords,
+                                PacketCapture.DefaultBufferRecords)
+
+    clients = [client.strip() for client in clients.split(",") \
+                   if len(client.strip()) > 0]
+
+    log = logger.get("PacketCapture")
+    log.info("Capturing sessions to %s" % filename)
+
+    packetCapture = PacketCapture()
+    packetCapture.start(filename, clients, sampleRate, bufferRecords)
+
+    # Write the buffered data when pysiriproxy exits
+    reactor.addSystemEventTrigger("before", "shutdown", packetCapture.stop)
@@ -20,15 +20,21 @@ networked computers.
 '''
 import re
 import zlib
+from time import time
 from os.path import join
 from binascii import unhexlify
 from struct import unpack, pack
 
+from twisted.internet.defer import Deferred, succeed
 from twisted.protocols.basic import LineReceiver
 
 from pysiriproxy.plist import Plist
 from pysiriproxy.utils import toHex
+from pysiriproxy.metrics import Metrics
+from pysiriproxy.tracing import Tracer
+from pysiriproxy.capture import PacketCapture
 from pysiriproxy.interpreter import Interpreter
+from pysiriproxy.objects.baseObject import SiriObject
 from pysiriproxy.constants import Modes, HeaderKeys
 from pysiriproxy.plugins.manager import PluginManager
 from pysiriproxy.connections.manager import ConnectionManager
@@ -58,18 +64,43 @@ class Connection(LineReceiver):
     '''
 
     def __init__(self, name, direction, logger,
-                 logColor=Colors.Foreground.White):
+                 logColor=Colors.Foreground.White, connectionManager=None):
         '''
         * name -- The name of this Connection
         * direction -- The direction of the data coming into this Connection
         * logger -- The logger for this Connection
         * logColor -- The log color for this Connection
+        * connectionManager -- The ConnectionManager to connect this
+                               Connection to, or None to use the proxy's
 
         '''
         self.__direction = direction
+
+        # Create the labels for the metrics of this connection once, so
+        # recording a metric does not need to create them
+        self.__metrics = Metrics()
+        self.__labels = (("direction", direction),)
+        self.__compressedLabels = self.__labels + (("encoding", "compressed"),)
+        self.__decompressedLabels = \
+            self.__labels + (("encoding", "decompressed"),)
+        self.__compressLabels = self.__labels + (("operation", "compress"),)
+        self.__decompressLabels = \
+            self.__labels + (("operation", "decompress"),)
+
+        # The time the most recent data was received, which is used as the
+        # time each object in the data was received when tracing requests
+        self.__tracer = Tracer()
+        self.__receivedAt = None
+
+        # The id of the captured session this connection belongs to, or None
+        # if the session is not being captured
+        self.__packetCapture = PacketCapture()
+        self.__captureSession = None
     
         # Connect this connection to the connection manager
-        self.__connectionManager = ConnectionManager(logger)
+        if connectionManager is None:
+            connectionManager = ConnectionManager(logger)
+        self.__connectionManager = connectionManager
         self.__connectionManager.connect(self)
 
         # Grab an instance to the plugin manager
@@ -91,6 +122,14 @@ class Connection(LineReceiver):
         self.__unzippedInput = ""
         self.__unzippedOutput = ""
 
+        # The list of received objects waiting for the plugin filters of a
+        # previously received object to complete, or None if no object is
+        # waiting on the plugin filters
+        self.__waitingObjects = None
+
+        # The Deferreds waiting for the received objects to be forwarded
+        self.__idleDeferreds = []
+
         self.ssled = False
         self.__lastRefId = None
         self.__blockRestOfSession = False
@@ -142,6 +181,35 @@ class Connection(LineReceiver):
         '''
         self.log.error("Connection failed: %s" % str(reason))
 
+    def getCaptureSession(self):
+        '''Get the id of the captured session this connection belongs to, or
+        None if the session is not being captured.
+
+        '''
+        return self.__captureSession
+
+    def setCaptureSession(self, sessionId):
+        '''Set the id of the captured session this connection belongs to.
+
+        * sessionId -- The id of the session, or None to stop capturing the
+                       data received by this connection
+
+        '''
+        self.__captureSession = sessionId
+
+    def dataReceived(self, data):
+        '''This function is called when any data is received.
+
+        * data -- The data
+
+        '''
+        # Capture the data exactly as it was received
+        if self.__captureSession is not None:
+            self.__packetCapture.record(self.__captureSession,
+                                        self.__direction, data)
+
+        LineReceiver.dataReceived(self, data)
+
     def lineReceived(self, line):
         '''This function is called when a line of data is received.
 
@@ -178,6 +246,9 @@ class Connection(LineReceiver):
 
         '''
         self.log.debug("Received data: %d" % len(data), level=7)
+        self.__receivedAt = time()
+        self.__metrics.count(Metrics.ReceivedBytes, self.__compressedLabels,
+                             len(data))
 
         self.__inputBuffer += data
 
@@ -198,7 +269,12 @@ class Connection(LineReceiver):
 
         '''
         # Unzip the input stream
+        start = time()
         decomp = self.__zipStream.decompress(self.__inputBuffer)
+        self.__metrics.observe(Metrics.Zlib, time() - start,
+                               self.__decompressLabels)
+        self.__metrics.count(Metrics.ReceivedBytes, self.__decompressedLabels,
+                             len(decomp))
 
         self.__unzippedInput = ''.join(decomp)
         self.__inputBuffer = ""
@@ -226,12 +302,100 @@ class Connection(LineReceiver):
                     self.log.debug(obj, level=2)
                     self.log.debug("========== AddViews ==========", level=2)
 
-                # Give the world a chance to mess with folks
-                newObject = self.__prepReceivedObject(obj)
+                if self.__tracer.enabled:
+                    self.__tracer.received(obj, self.__direction,
+                                           self.__receivedAt)
+
+                self.__receiveObject(obj)
+
+    def __receiveObject(self, obj):
+        '''Prepare a received object and forward it to the destination
+        connection, while ensuring that objects are forwarded in the order
+        they were received.
+
+        * obj -- The object that was received
+
+        '''
+        # Objects must wait for any object whose plugin filters have not
+        # completed yet
+        if self.__waitingObjects is not None:
+            self.__waitingObjects.append(obj)
+            return
+
+        # Give the world a chance to mess with folks
+        newObject = self.__prepReceivedObject(obj)
+
+        # Wait for the plugin filters to complete before forwarding the object
+        if isinstance(newObject, Deferred):
+            self.__waitingObjects = []
+            newObject.addErrback(self.__prepFailed, obj)
+            newObject.addCallback(self.__finishReceivedObject)
+            newObject.addErrback(self.__forwardFailed)
+            return
+
+        # Might be nil if "the world" decides to rid us of the object
+        if newObject is not None:
+            self.injectObjectToOutputStream(newObject)
+
+    def __finishReceivedObject(self, newObject):
+        '''Forward an object once its plugin filters have completed, and then
+        process all of the objects that were waiting on it.
+
+        * newObject -- The prepared object
+
+        '''
+        waitingObjects = self.__waitingObjects
+
+        # Objects must not wait forever if forwarding this object fails
+        try:
+            if newObject is not None:
+                self.injectObjectToOutputStream(newObject)
+        finally:
+            self.__waitingObjects = None
+
+        for obj in waitingObjects:
+            self.__receiveObject(obj)
+
+        self.__flushOutputBuffer()
+
+        if self.__waitingObjects is None:
+            self.__notifyIdle()
 
-                # Might be nil if "the world" decides to rid us of the object
-                if newObject is not None:
-                    self.injectObjectToOutputStream(newObject)
+    def __forwardFailed(self, failure):
+        '''Called in the event that forwarding an object, or the objects
+        waiting on it, failed. The connection is dropped since the objects
+        of the session can no longer be forwarded in order.
+
+        * failure -- The failure
+
+        '''
+        self.log.error("Failed to forward objects, dropping the connection")
+        self.log.error(failure.getTraceback())
+
+        if self.transport is not None:
+            self.transport.loseConnection()
+
+        self.__notifyIdle()
+
+    def __notifyIdle(self):
+        '''Fire the Deferreds waiting for the received objects to be
+        forwarded.
+
+        '''
+        idleDeferreds, self.__idleDeferreds = self.__idleDeferreds, []
+        for deferred in idleDeferreds:
+            deferred.callback(None)
+
+    def __prepFailed(self, failure, obj):
+        '''Called in the event that preparing a received object failed.
+
+        * failure -- The failure
+        * obj -- The object that was received
+
+        '''
+        self.log.error("Failed to prepare object [%s]" % obj.get('class'))
+        self.log.error(failure.getTraceback())
+        return obj
 
     def __hasNextObject(self):
         '''Determine if there is an object waiting to be processed.'''
@@ -292,6 +456,8 @@ class Connection(LineReceiver):
             else:
                 objectType = "ClearContext"
 
+            self.__metrics.count(Metrics.Frames,
+                                 self.__labels + (("class", objectType),))
             self.log.debug("Received %s (%d)" % (objectType,
                                                  int(matched[1], 16)), level=7)
             self.__unzippedInput = self.__unzippedInput[5:]
@@ -305,7 +471,16 @@ class Connection(LineReceiver):
         self.__unzippedInput = self.__unzippedInput[objectSize + 5:]
 
         # Conver the object to a plist and return it
-        return Plist.convert(objectData)
+        start = time()
+        obj = Plist.convert(objectData)
+        self.__metrics.observe(Metrics.PlistDecode, time() - start,
+                               self.__labels)
+
+        if obj is not None:
+            labels = self.__labels + (("class", obj.get("class")),)
+            self.__metrics.count(Metrics.Frames, labels)
+
+        return obj
 
     def __prepReceivedObject(self, obj):
         '''Prep the object that was received.
@@ -333,23 +508,44 @@ class Connection(LineReceiver):
                 self.__blockRestOfSession = False
             self.__setRefId(aceId)
     
-        # Process the object filters for this object, and make sure an
-        # object was returned from the object filters
+        # Process the object filters for this object, and finish preparing
+        # the object once the filters have completed
         processedObject = self.__processObjectFilters(obj)
+        if isinstance(processedObject, Deferred):
+            return processedObject.addCallback(self.__prepFilteredObject, obj)
+
+        return self.__prepFilteredObject(processedObject, obj)
+
+    def __prepFilteredObject(self, processedObject, obj):
+        '''Finish preparing the received object once the object filters
+        have been processed.
+
+        * processedObject -- The object returned by the object filters
+        * obj -- The object that was received
+
+        '''
+        # Make sure an object was returned from the object filters
         if processedObject is None:
             self.log.debug("Dropping object [%s]" % obj["class"], level=2)
             return None
 
         # Block the rest of the session if a plugin claims ownership
-        speech = Interpreter.speechRecognized(obj)
-        if speech is not None:
-            self.log.info("Speech recognized: [%s]" % speech)
+        recognition = Interpreter.getRecognition(obj)
+        if recognition is not None:
+            self.log.info("Speech recognized: [%s]" % recognition.text)
             self.injectObjectToOutputStream(obj)
 
-            # Process the speech with all of the known plugin speech rules
-            if self.__pluginManager.processSpeechRules(speech):
+            # Process the speech with all of the known plugin speech rules,
+            # and try the alternative interpretations if none apply
+            alternatives = recognition.iterAlternativeTexts()
+            handled = self.__pluginManager.processSpeechRules(
+                recognition.text, alternatives, self.__connectionManager)
+            if handled:
                 self.__blockRestOfSession = True
 
+            if self.__tracer.enabled:
+                self.__tracer.decided(obj.get("refId"), bool(handled), time())
+
             return None
     
         return obj
@@ -360,7 +556,9 @@ class Connection(LineReceiver):
         * obj -- The received object
 
         '''
-        return self.__pluginManager.processFilters(obj, self.__direction)
+        # Responses created by the plugins are sent to this session
+        return self.__pluginManager.processFilters(obj, self.__direction,
+                                                   self.__connectionManager)
 
     def __unpackUnzippedInput(self, unzipped):
         '''Unpack the given unzipped object into a hexadecimal string.
@@ -375,10 +573,17 @@ class Connection(LineReceiver):
         connection. This effectively sends the object to the foward destination
         connection for this connection.
 
-        * obj -- The object to inject into the output stream
+        * obj -- The object (a dictionary or a :class:`.SiriObject`) to
+                 inject into the output stream
 
         '''
-        refId = obj.get("refId")
+        if SiriObject.isSiriObject(obj):
+            refId = obj.getRefId()
+            className = obj.getClassName()
+        else:
+            refId = obj.get("refId")
+            className = obj.get("class")
+
         if refId is not None and len(refId) > 0:
             # If the refIds have changed than this is a new session
             if self.__blockRestOfSession and self.__lastRefId != refId:
@@ -386,14 +591,17 @@ class Connection(LineReceiver):
             self.__setRefId(refId)
 
         # Convert the object to a binary plist
+        start = time()
         objectData = Plist.toBinary(obj, self.__logger)
+        self.__metrics.observe(Metrics.PlistEncode, time() - start,
+                               self.__labels)
 
         # Recalculate the size in case the object gets modified. If new size is
         # zero, then remove the object from the stream entirely
         objLen = len(objectData)
 
         self.log.debug("Forwarding object [%s] to %s, len: %d" % \
-                    (obj.get('class'),
+                    (className,
                     self.__connectionManager.getForwardName(self.__direction),
                     objLen), level=5)
     
@@ -410,12 +618,25 @@ class Connection(LineReceiver):
 
         self.__flushUnzippedOutput()
 
+        if self.__tracer.enabled:
+            self.__tracer.forwarded(refId, className, self.__direction, time())
+
     def __flushUnzippedOutput(self):
         '''Flush the unzipped output buffer.'''
         # Compress the unzipped output buffer
-        self.__outputBuffer += \
-            self.__compStream.compress(self.__unzippedOutput)
-        self.__outputBuffer += self.__compStream.flush(zlib.Z_SYNC_FLUSH)
+        start = time()
+        compressed = self.__compStream.compress(self.__unzippedOutput) + \
+            self.__compStream.flush(zlib.Z_SYNC_FLUSH)
+        self.__metrics.observe(Metrics.Zlib, time() - start,
+                               self.__compressLabels)
+
+        self.__metrics.count(Metrics.ForwardedBytes,
+                             self.__decompressedLabels,
+                             len(self.__unzippedOutput))
+        self.__metrics.count(Metrics.ForwardedBytes, self.__compressedLabels,
+                             len(compressed))
+
+        self.__outputBuffer += compressed
 
         self.__unzippedOutput = ""
     
@@ -436,6 +657,19 @@ class Connection(LineReceiver):
             self.log.debug("Buffering some data for later: %d bytes " \
                                "buffered" % len(self.__outputBuffer), level=5)
 
+    def whenIdle(self):
+        '''Get a Deferred which fires once none of the received objects are
+        waiting for plugin filters to complete, i.e., once every object
+        received so far has been forwarded or dropped.
+
+        '''
+        if self.__waitingObjects is None:
+            return succeed(None)
+
+        deferred = Deferred()
+        self.__idleDeferreds.append(deferred)
+        return deferred
+
     def getConnectionManager(self):
         '''Get the ConnectionManager object for this Connection.'''
         return self.__connectionManager
@@ -25,11 +25,14 @@ from os import getpid, system
 from twisted.internet import reactor, protocol, ssl
 from twisted.internet.ssl import DefaultOpenSSLContextFactory
 
+from pysiriproxy.metrics import Metrics
+from pysiriproxy.capture import PacketCapture
 from pysiriproxy.connections import server
 from pysiriproxy.constants import Directions
 from pysiriproxy.options.options import Options
 from pysiriproxy.options.config import Ids, Sections
 from pysiriproxy.connections.connection import Connection
+from pysiriproxy.connections.manager import ConnectionManager
 
 from pyamp.logging import Colors, LogLevel
 
@@ -49,13 +52,26 @@ class _iPhone(Connection):
         '''
         self.__serverConnection = None
         self.__logger = logger
+
+        # Each iPhone has its own connection to Apple's server, so the
+        # connections of each session are managed separately from those of
+        # any other session
+        connectionManager = ConnectionManager(logger, shared=False)
         Connection.__init__(self, "iPhone", Directions.From_iPhone,
-                            logger=logger, logColor=Colors.Foreground.Purple)
+                            logger=logger, logColor=Colors.Foreground.Purple,
+                            connectionManager=connectionManager)
 
     def connectionMade(self):
         '''Called when a connection is made.'''
         self.log.info("Connection made.")
         Connection.connectionMade(self)
+        Metrics().adjust(Metrics.ActiveSessions)
+
+        # Decide whether this session is captured (replayed sessions have
+        # no transport)
+        if self.transport is not None:
+            self.setCaptureSession(
+                PacketCapture().startSession(self.transport.getPeer().host))
         self.ssled = True
 
         # Initialize the connection to Apple's server
@@ -64,7 +80,8 @@ class _iPhone(Connection):
     def reconnectServer(self):
         '''Disconnect and then re-connect the server connection.'''
         self.__disconnectServer()
-        self.__serverConnection = server.connect(self.__logger)
+        self.__serverConnection = server.connect(self.__logger,
+                                                 self.getConnectionManager())
 
     def connectionLost(self, reason):
         '''Called when the connection is lost.
@@ -73,12 +90,13 @@ class _iPhone(Connection):
 
         '''
         self.log.info("Connection lost: %s" % reason)
+        Metrics().adjust(Metrics.ActiveSessions, amount=-1)
         self.__disconnectServer()
 
         # Signal the connection manager that the iPhone connection
         # has been closed
         connectionManager = self.getConnectionManager()
-        connectionManager.disconnect(Directions.From_iPhone)
+        connectionManager.disconnect(Directions.From_iPhone, self)
 
         # Determine if the server should exit due to the lost connection
         if Options.get(Sections.Debug, Ids.ExitOnConnectionLost):
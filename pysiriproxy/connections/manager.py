@@ -31,16 +31,22 @@ class ConnectionManager:
     connection direction which allows data to be forwarded from the
     direction to the connected direction.
 
+    All ConnectionManager objects share the connections of the proxy, except
+    for those created with shared set to False, which manage their own
+    connections (such as the connections of a replayed session).
+
     '''
     # Implement the borg pattern
     __shared_state = {}
 
-    def __init__(self, logger=None):
+    def __init__(self, logger=None, shared=True):
         '''
         * logger -- The logger
+        * shared -- False to manage connections separate from those of the
+                    proxy
 
         '''
-        self.__dict__ = self.__shared_state
+        self.__dict__ = self.__shared_state if shared else {}
 
         # If the manager has not been initialized, then initialize it
         if getattr(self, "_initialized", False) == False:
@@ -86,15 +92,23 @@ class ConnectionManager:
 
             self._connections[direction] = connection
 
-    def disconnect(self, direction):
+    def disconnect(self, direction, expected=None):
         '''Remove a directed connection from our set of connections.
 
         * direction -- The direction of the connection object to remove
+        * expected -- The connection to remove, or None to remove any
+                      connection with the given direction
 
         '''
         # Only remove the connection a single time
         if direction in self._connections:
             connection = self._connections[direction]
+
+            # A connection which is lost after the next session has started
+            # must not remove the connection of the next session
+            if expected is not None and connection is not expected:
+                return
+
             if connection is not None:
                 # Close the connection, and then remove it from the
                 # dictionary of connections
@@ -18,11 +18,13 @@ concrete connection which is responsible for managing the connection between
 pysiriproxy and Apple's web server.
 
 '''
+from time import time
 from os.path import join
 
 from OpenSSL import SSL
 from twisted.internet import protocol, reactor, ssl
 
+from pysiriproxy.metrics import Metrics
 from pysiriproxy.constants import Directions
 from pysiriproxy.options.options import Options
 from pysiriproxy.options.config import Ids, Sections
@@ -38,9 +40,11 @@ class _Server(Connection):
 
     '''
 
-    def __init__(self, logger):
+    def __init__(self, logger, connectionManager=None):
         '''
         * logger -- The logger
+        * connectionManager -- The ConnectionManager to connect this
+                               connection to, or None to use the proxy's
 
         '''
         # Grab the hostname of the Apple server to which we will be connecting
@@ -53,13 +57,20 @@ class _Server(Connection):
         hostname = hostname.capitalize()
 
         Connection.__init__(self, hostname, Directions.From_Server,
-                            logger=logger, logColor=Colors.Foreground.Blue)
+                            logger=logger, logColor=Colors.Foreground.Blue,
+                            connectionManager=connectionManager)
 
     def connectionMade(self):
         '''Called when the connection has been made successfully.'''
         self.log.debug("Connection made.", level=2)
         self.ssled = True
 
+        # Capture the data from Apple's server along with the iPhone's data
+        iPhone = self.getConnectionManager().getConnection(
+            Directions.From_iPhone)
+        if iPhone is not None:
+            self.setCaptureSession(iPhone.getCaptureSession())
+
         # Create the empty TLS context, and enable TLS mode
         ctx = ClientTLSContext()
         self.transport.startTLS(ctx, self.factory)
@@ -95,14 +106,18 @@ class _Factory(protocol.ClientFactory):
     name = "ServerFactory"
     logColor = Colors.Foreground.Blue
 
-    def __init__(self, logger=None):
+    def __init__(self, logger=None, connectionManager=None):
         '''
         * logger -- The logger
+        * connectionManager -- The ConnectionManager of the session, or None
+                               to use the proxy's
 
         '''
         # Get an instance to the connection manager so we can properly
         # disconnect Apple's server connection when it is lost
-        self.__connectionManager = ConnectionManager(logger)
+        if connectionManager is None:
+            connectionManager = ConnectionManager(logger)
+        self.__connectionManager = connectionManager
 
         # If no logger is given, be sure to create it
         if logger is None:
@@ -111,14 +126,24 @@ class _Factory(protocol.ClientFactory):
         self.log = logger.get(self.name)
         self.__logger = logger
 
+        # The time the connection to Apple's server was started
+        self.__started = time()
+
+        # The connection to Apple's server, once it has been made
+        self.__server = None
+
     def buildProtocol(self, _addr):
         '''Build the protocol for the _Server connection.
 
         * _addr -- The address
 
         '''
-        server = _Server(self.__logger)
+        # The protocol is built once the connection has been made
+        Metrics().observe(Metrics.UpstreamConnect, time() - self.__started)
+
+        server = _Server(self.__logger, self.__connectionManager)
         server.factory = self
+        self.__server = server
 
         return server
 
@@ -127,25 +152,32 @@ class _Factory(protocol.ClientFactory):
         protocol.ClientFactory.clientConnectionFailed(self, connector,
                                                       reason)
 
-        # Delete the server connection
-        self.__connectionManager.disconnect(Directions.From_Server)
+        # Delete the server connection, unless it belongs to a later session
+        if self.__server is not None:
+            self.__connectionManager.disconnect(Directions.From_Server,
+                                                self.__server)
 
     def clientConnectionLost(self, connector, reason):
         self.log.debug("Connection lost: %s" % reason, level=2)
         protocol.ClientFactory.clientConnectionLost(self, connector,
                                                     reason)
 
-        # Delete the server connection
-        self.__connectionManager.disconnect(Directions.From_Server)
+        # Delete the server connection, unless it belongs to a later session
+        if self.__server is not None:
+            self.__connectionManager.disconnect(Directions.From_Server,
+                                                self.__server)
 
 
-def connect(logger):
+def connect(logger, connectionManager=None):
     '''Connect the Siri server to handle server data.
 
     * logger -- The logger
+    * connectionManager -- The ConnectionManager of the session, or None to
+                           use the proxy's
 
     '''
     host = Options.get(Sections.Server, Ids.Host)
     port = Options.get(Sections.Server, Ids.Port)
 
-    return reactor.connectTCP(host, port, _Factory(logger))
+    return reactor.connectTCP(host, port,
+                              _Factory(logger, connectionManager))
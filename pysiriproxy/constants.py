@@ -151,6 +151,9 @@ class Keys:
     Class = "class"
     '''The class name for the object.'''
 
+    ConfidenceScore = "confidenceScore"
+    '''The confidenceScore key for an object.'''
+
     Data = "data"
     '''The key for the data property of an object. '''
 
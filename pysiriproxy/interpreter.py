@@ -16,18 +16,99 @@
 '''The interpreter module contains a class which provides the ability
 to find the recognized speech from a given object.
 
+Recognized speech is made up of phrases, and Siri provides several
+alternative interpretations of each phrase. The recognized speech is
+extracted from an object in a single pass, which joins the tokens of the
+best interpretation of each phrase once. The alternative interpretations
+of the whole speech, ranked by the confidence scores of their tokens, are
+only computed once they are needed. The extracted speech is remembered for
+the most recent objects so that extracting it again does not walk the
+object again.
+
 '''
+from threading import Lock
+from collections import deque
+
 from pysiriproxy.constants import ClassNames, Keys
 
 
+class Recognition:
+    '''The Recognition class contains the speech recognized in an object,
+    along with the alternative interpretations of the speech.
+
+    '''
+
+    def __init__(self, text, confidence, phrases, maxAlternatives):
+        '''
+        * text -- The recognized text
+        * confidence -- The mean confidence score of the recognized text
+        * phrases -- The list of phrase objects of the recognized speech
+        * maxAlternatives -- The maximum number of alternative
+                             interpretations
+
+        '''
+        self.text = text
+        self.confidence = confidence
+
+        self.__phrases = phrases
+        self.__maxAlternatives = maxAlternatives
+        self.__alternatives = None
+
+    def getAlternatives(self):
+        '''Get the list of (text, confidence) tuples for the alternative
+        interpretations of the recognized text, best first.
+
+        '''
+        if self.__alternatives is None:
+            self.__alternatives = _rankAlternatives(self.__phrases, self.text,
+                                                    self.__maxAlternatives)
+
+        return self.__alternatives
+
+    def getAlternativeTexts(self):
+        '''Get the list of alternative interpretations of the recognized
+        text, best first.
+
+        '''
+        return [text for text, _ in self.getAlternatives()]
+
+    def iterAlternativeTexts(self):
+        '''Iterate over the alternative interpretations of the recognized
+        text, best first. The alternatives are not computed until the first
+        one is needed.
+
+        '''
+        for text, _ in self.getAlternatives():
+            yield text
+
+
 class Interpreter:
     '''The Interpreter class provides the ability for determining if an
     object indicates that speech was recognized.
 
     '''
 
+    MaxAlternatives = 5
+    '''The maximum number of alternative interpretations of recognized
+    speech that are kept.
+
+    '''
+
+    CacheSize = 8
+    '''The number of objects for which the recognized speech is
+    remembered.
+
+    '''
+
+    # The recognized speech of the most recent objects, keyed by the id of
+    # the object, and the ids in the order they were added. The object is
+    # kept with its speech so that its id is not reused while it is cached.
+    __cache = {}
+    __cacheOrder = deque()
+    __cacheLock = Lock()
+
     @classmethod
-    def speechRecognized(self, obj):
+    def speechRecognized(cls, obj):
         '''Determine if this object contains recognized speech.
 
         This function returns the speech that was recognized if there was
@@ -35,6 +116,17 @@ class Interpreter:
 
         * obj -- The object to check
 
+        '''
+        recognition = cls.getRecognition(obj)
+        return recognition.text if recognition is not None else None
+
+    @classmethod
+    def getRecognition(cls, obj):
+        '''Get the :class:`Recognition` containing the speech recognized in
+        this object, or None if the object does not contain recognized speech.
+
+        * obj -- The object to check
+
         '''
         # Ensure that the object exists
         if obj is None:
@@ -45,28 +137,167 @@ class Interpreter:
         if classType is None or classType != ClassNames.SpeechRecognized:
             return None
 
-        phrase = ""
-      
+        cached = cls.__cache.get(id(obj))
+        if cached is not None and cached[0] is obj:
+            return cached[1]
+
+        recognition = cls.__extract(obj)
+
+        with cls.__cacheLock:
+            if id(obj) not in cls.__cache:
+                cls.__cacheOrder.append(id(obj))
+            cls.__cache[id(obj)] = (obj, recognition)
+
+            # Forget the oldest objects
+            while len(cls.__cacheOrder) > cls.CacheSize:
+                del cls.__cache[cls.__cacheOrder.popleft()]
+
+        return recognition
+
+    ##### Private functions #####
+
+    @classmethod
+    def __extract(cls, obj):
+        '''Extract the recognized speech from a speech recognized object.
+
+        * obj -- The speech recognized object
+
+        '''
         properties = obj.get(Keys.Properties)
         recognition = properties.get(Keys.Recognition)
         recogProperties = recognition.get(Keys.Properties)
         phrases = recogProperties.get(Keys.Phrases)
 
+        parts = []
+        total = 0.0
+        count = 0
+
+        # The best interpretation of each phrase is the first one
         for phraseObj in phrases:
             phraseProperties = phraseObj.get(Keys.Properties)
             interpretations = phraseProperties.get(Keys.Interpretations)
             firstProps = interpretations[0].get(Keys.Properties)
-            tokens = firstProps.get(Keys.Tokens)
 
-            for token in tokens:
+            for token in firstProps.get(Keys.Tokens):
                 tokenProps = token.get(Keys.Properties)
 
-                if tokenProps.get(Keys.RemoveSpaceBefore):
-                    phrase = phrase[0:-1]
+                if tokenProps.get(Keys.RemoveSpaceBefore) and \
+                        len(parts) > 0 and parts[-1] == " ":
+                    parts.pop()
 
-                phrase += tokenProps.get(Keys.Text)
+                parts.append(tokenProps.get(Keys.Text))
 
                 if not tokenProps.get(Keys.RemoveSpaceAfter):
-                    phrase += " "
-                
-        return phrase.strip()
+                    parts.append(" ")
+
+                confidence = tokenProps.get(Keys.ConfidenceScore)
+                if confidence is not None:
+                    total += confidence
+                    count += 1
+
+        return Recognition(''.join(parts).strip(),
+                           total / count if count > 0 else 0.0,
+                           phrases, cls.MaxAlternatives)
+
+
+def _rankAlternatives(phrases, text, maxAlternatives):
+    '''Get the list of (text, confidence) tuples for the most confident
+    alternative interpretations of the recognized speech, best first.
+
+    * phrases -- The list of phrase objects of the recognized speech
+    * text -- The best interpretation of the recognized speech
+    * maxAlternatives -- The maximum number of alternative interpretations
+
+    '''
+    # Each hypothesis is a (choices, total confidence, number of scored
+    # tokens) tuple, where the choices contain the index of the
+    # interpretation chosen for each phrase
+    hypotheses = [((), 0.0, 0)]
+    allInterpretations = []
+
+    for phraseObj in phrases:
+        phraseProperties = phraseObj.get(Keys.Properties)
+        interpretations = [_getInterpretation(interpretation) for \
+                               interpretation in \
+                               phraseProperties.get(Keys.Interpretations)]
+        allInterpretations.append(interpretations)
+
+        # Only the most confident hypotheses are extended, and the best
+        # interpretation may be one of them
+        hypotheses = [(choices + (index,), total + interpretation[1],
+                       count + interpretation[2]) \
+                          for choices, total, count in hypotheses \
+                          for index, interpretation in \
+                          enumerate(interpretations)]
+        hypotheses.sort(key=_getConfidence, reverse=True)
+        del hypotheses[maxAlternatives + 1:]
+
+    alternatives = []
+    seen = set([text])
+    for hypothesis in hypotheses:
+        tokens = []
+        for interpretations, index in zip(allInterpretations, hypothesis[0]):
+            tokens.extend(interpretations[index][0])
+
+        alternative = _joinTokens(tokens)
+        if alternative not in seen:
+            seen.add(alternative)
+            alternatives.append((alternative, _getConfidence(hypothesis)))
+
+    return alternatives[:maxAlternatives]
+
+
+def _getInterpretation(interpretation):
+    '''Get the (tokens, total confidence, number of scored tokens) tuple for
+    a single interpretation of a phrase, where each token is a (text, remove
+    space before, remove space after) tuple.
+
+    * interpretation -- The interpretation object
+
+    '''
+    tokens = []
+    total = 0.0
+    count = 0
+
+    for token in interpretation.get(Keys.Properties).get(Keys.Tokens):
+        tokenProps = token.get(Keys.Properties)
+        tokens.append((tokenProps.get(Keys.Text),
+                       tokenProps.get(Keys.RemoveSpaceBefore),
+                       tokenProps.get(Keys.RemoveSpaceAfter)))
+
+        confidence = tokenProps.get(Keys.ConfidenceScore)
+        if confidence is not None:
+            total += confidence
+            count += 1
+
+    return tokens, total, count
+
+
+def _getConfidence(hypothesis):
+    '''Get the mean confidence score of the tokens of a hypothesis.
+
+    * hypothesis -- The (tokens, total confidence, number of scored tokens)
+                    tuple
+
+    '''
+    return hypothesis[1] / hypothesis[2] if hypothesis[2] > 0 else 0.0
+
+
+def _joinTokens(tokens):
+    '''Join a list of (text, remove space before, remove space after)
+    tokens into a single string.
+
+    * tokens -- The list of tokens
+
+    '''
+    parts = []
+    for text, removeSpaceBefore, removeSpaceAfter in tokens:
+        if removeSpaceBefore and len(parts) > 0 and parts[-1] == " ":
+            parts.pop()
+
+        parts.append(text)
+
+        if not removeSpaceAfter:
+            parts.append(" ")
+
+    return ''.join(parts).strip()
@@ -0,0 +1,339 @@
+# Copyright (C) 2012 Brett Ponsler, Pete Lamonica
+# This file is part of pysiriproxy.
+#
+# pysiriproxy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pysiriproxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pysiriproxy.  If not, see <http://www.gnu.org/licenses/>.
+'''The metrics module contains the Metrics class which counts the data
+passing through pysiriproxy, and records how long decoding, encoding, and
+compressing the data takes.
+
+The metrics are served in the Prometheus text format by a small HTTP
+listener which is enabled by setting the 'Port' property in the 'Metrics'
+section of the configuration file. Along with the metrics recorded by the
+connections, the latencies of every plugin filter and speech rule are taken
+from the :class:`.PluginStatistics`, which already include the calls made by
+the plugin threads and by the worker processes hosting isolated plugins.
+
+Recording a metric only updates a dictionary entry, and is always done by the
+twisted reactor thread, so no locking is needed.
+
+'''
+from twisted.internet import reactor
+from twisted.web.server import Site
+from twisted.web.resource import Resource
+
+from pysiriproxy.options.options import Options
+from pysiriproxy.options.config import Ids, Sections
+from pysiriproxy.plugins.statistics import LatencyHistogram, PluginStatistics
+
+
+class Metrics:
+    '''The Metrics class stores the counters, gauges, and histograms for
+    pysiriproxy, keyed by the name of the metric and a tuple of (label, value)
+    tuples.
+
+    '''
+    # Implement the borg pattern
+    __shared_state = {}
+
+    ActiveSessions = "pysiriproxy_active_sessions"
+    '''The number of iPhone connections which are currently open.'''
+
+    ReceivedBytes = "pysiriproxy_received_bytes_total"
+    '''The number of bytes received by each connection.'''
+
+    ForwardedBytes = "pysiriproxy_forwarded_bytes_total"
+    '''The number of bytes forwarded by each connection.'''
+
+    Frames = "pysiriproxy_frames_total"
+    '''The number of objects received by each connection.'''
+
+    PlistDecode = "pysiriproxy_plist_decode_seconds"
+    '''The time taken to convert a binary plist into an object.'''
+
+    PlistEncode = "pysiriproxy_plist_encode_seconds"
+    '''The time taken to convert an object into a binary plist.'''
+
+    Zlib = "pysiriproxy_zlib_seconds"
+    '''The time taken to compress or decompress data.'''
+
+    UpstreamConnect = "pysiriproxy_upstream_connect_seconds"
+    '''The time taken to connect to Apple's web server.'''
+
+    PluginLatency = "pysiriproxy_plugin_seconds"
+    '''The time taken by each plugin filter and speech rule.'''
+
+    PluginExceptions = "pysiriproxy_plugin_exceptions_total"
+    '''The number of exceptions raised by each plugin filter and speech
+    rule.
+
+    '''
+
+    def __init__(self):
+        self.__dict__ = self.__shared_state
+
+        if getattr(self, "_counters", None) is None:
+            self.reset()
+
+    def count(self, name, labels=(), amount=1):
+        '''Add to a counter.
+
+        * name -- The name of the counter
+        * labels -- The tuple of (label, value) tuples
+        * amount -- The amount to add to the counter
+
+        '''
+        key = (name, labels)
+        self._counters[key] = self._counters.get(key, 0) + amount
+
+    def adjust(self, name, labels=(), amount=1):
+        '''Add to (or subtract from) a gauge.
+
+        * name -- The name of the gauge
+        * labels -- The tuple of (label, value) tuples
+        * amount -- The amount to add to the gauge
+
+        '''
+        key = (name, labels)
+        self._gauges[key] = self._gauges.get(key, 0) + amount
+
+    def observe(self, name, seconds, labels=()):
+        '''Record a duration in a histogram.
+
+        * name -- The name of the histogram
+        * seconds -- The duration in seconds
+        * labels -- The tuple of (label, value) tuples
+
+        '''
+        key = (name, labels)
+
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = LatencyHistogram()
+            self._histograms[key] = histogram
+
+        histogram.record(seconds)
+
+    def get(self, name, labels=()):
+        '''Get the value of a counter or gauge, or zero if it has not been
+        recorded.
+
+        * name -- The name of the counter or gauge
+        * labels -- The tuple of (label, value) tuples
+
+        '''
+        key = (name, labels)
+        return self._counters.get(key, self._gauges.get(key, 0))
+
+    def reset(self):
+        '''Clear all of the metrics.'''
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+
+    def render(self):
+        '''Get the string containing all of the metrics in the Prometheus
+        text format.
+
+        '''
+        lines = []
+
+        for name, metricType, helpText in _Descriptions:
+            lines.append("# HELP %s %s" % (name, helpText))
+            lines.append("# TYPE %s %s" % (name, metricType))
+
+            if metricType == "counter":
+                values = self._counters
+            elif metricType == "gauge":
+                values = self._gauges
+            else:
+                values = self._histograms
+
+            for (metricName, labels), value in sorted(values.items()):
+                if metricName != name:
+                    continue
+
+                if metricType == "histogram":
+                    lines.extend(_renderHistogram(name, labels, value.counts,
+                                                  value.total, value.count))
+                else:
+                    lines.append("%s%s %s" % (name, _renderLabels(labels),
+                                              _renderValue(value)))
+
+            if name == self.PluginLatency:
+                lines.extend(self.__renderPluginLatencies())
+            elif name == self.PluginExceptions:
+                lines.extend(self.__renderPluginExceptions())
+
+        return '\n'.join(lines) + '\n'
+
+    ##### Private functions #####
+
+    def __renderPluginLatencies(self):
+        '''Get the list of lines containing the latency histograms of every
+        plugin filter and speech rule.
+
+        '''
+        lines = []
+        for key, statistics in sorted(PluginStatistics().get().items()):
+            lines.extend(_renderHistogram(self.PluginLatency,
+                                          _getPluginLabels(key),
+                                          statistics["buckets"],
+                                          statistics["mean"] * \
+                                              statistics["calls"],
+                                          statistics["calls"]))
+
+        return lines
+
+    def __renderPluginExceptions(self):
+        '''Get the list of lines containing the number of exceptions raised by
+        every plugin filter and speech rule.
+
+        '''
+        return ["%s%s %d" % (self.PluginExceptions,
+                             _renderLabels(_getPluginLabels(key)),
+                             statistics["exceptions"]) \
+                    for key, statistics in \
+                    sorted(PluginStatistics().get().items())]
+
+
+# The name, type, and help text of every metric, in the order the metrics are
+# rendered
+_Descriptions = [
+    (Metrics.ActiveSessions, "gauge",
+     "The number of iPhone connections which are currently open."),
+    (Metrics.ReceivedBytes, "counter",
+     "The number of bytes received by each connection."),
+    (Metrics.ForwardedBytes, "counter",
+     "The number of bytes forwarded by each connection."),
+    (Metrics.Frames, "counter",
+     "The number of objects received by each connection."),
+    (Metrics.PlistDecode, "histogram",
+     "The time taken to convert a binary plist into an object."),
+    (Metrics.PlistEncode, "histogram",
+     "The time taken to convert an object into a binary plist."),
+    (Metrics.Zlib, "histogram",
+     "The time taken to compress or decompress data."),
+    (Metrics.UpstreamConnect, "histogram",
+     "The time taken to connect to Apple's web server."),
+    (Metrics.PluginLatency, "histogram",
+     "The time taken by each plugin filter and speech rule."),
+    (Metrics.PluginExceptions, "counter",
+     "The number of exceptions raised by each plugin filter and speech rule."),
+    ]
+
+
+def _getPluginLabels(key):
+    '''Get the labels for the statistics of a plugin function.
+
+    * key -- The (plugin name, function name, object class) tuple
+
+    '''
+    pluginName, functionName, objectClass = key
+    return (("plugin", pluginName), ("function", functionName),
+            ("class", objectClass or ""))
+
+
+def _renderLabels(labels):
+    '''Get the string containing the given labels.
+
+    * labels -- The tuple of (label, value) tuples
+
+    '''
+    if len(labels) == 0:
+        return ""
+
+    return "{%s}" % ','.join('%s="%s"' % (label, _escape(value)) \
+                                 for label, value in labels)
+
+
+def _renderValue(value):
+    '''Get the string for the value of a metric.
+
+    * value -- The value
+
+    '''
+    if isinstance(value, float):
+        return repr(value)
+
+    return str(value)
+
+
+def _renderHistogram(name, labels, counts, total, count):
+    '''Get the list of lines for a histogram.
+
+    * name -- The name of the histogram
+    * labels -- The tuple of (label, value) tuples
+    * counts -- The number of durations in each bucket
+    * total -- The sum of all of the durations
+    * count -- The number of durations
+
+    '''
+    lines = []
+
+    cumulative = 0
+    for bound, bucketCount in zip(LatencyHistogram.Bounds, counts):
+        cumulative += bucketCount
+        lines.append("%s_bucket%s %d" % \
+                         (name, _renderLabels(labels + (("le", repr(bound)),)),
+                          cumulative))
+
+    lines.append("%s_bucket%s %d" % \
+                     (name, _renderLabels(labels + (("le", "+Inf"),)), count))
+    lines.append("%s_sum%s %r" % (name, _renderLabels(labels), float(total)))
+    lines.append("%s_count%s %d" % (name, _renderLabels(labels), count))
+
+    return lines
+
+
+def _escape(value):
+    '''Escape the value of a label.
+
+    * value -- The value
+
+    '''
+    return str(value).replace("\\", "\\\\").replace('"', '\\"') \
+        .replace("\n", "\\n")
+
+
+class _MetricsResource(Resource):
+    '''The _MetricsResource class serves the metrics for every request.'''
+    isLeaf = True
+
+    def render_GET(self, request):
+        '''Render the metrics.
+
+        * request -- The request
+
+        '''
+        request.setHeader("Content-Type", "text/plain; version=0.0.4")
+        return Metrics().render()
+
+
+def listen(logger):
+    '''Start the HTTP listener which serves the metrics, if the 'Port'
+    property in the 'Metrics' section is not zero.
+
+    * logger -- The logger
+
+    '''
+    host = Options.get(Sections.Metrics, Ids.Host, "127.0.0.1")
+    port = Options.get(Sections.Metrics, Ids.Port, 0)
+
+    if port == 0:
+        return None
+
+    log = logger.get("Metrics")
+    log.info("Serving metrics on %s:%d" % (host, port))
+
+    return reactor.listenTCP(port, Site(_MetricsResource()), interface=host)
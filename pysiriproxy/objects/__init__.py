@@ -13,6 +13,7 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with pysiriproxy.  If not, see <http://www.gnu.org/licenses/>.
-__all__ = ['baseObject', 'commands', 'factory', 'dataObjects', 'views']
+__all__ = ['baseObject', 'commands', 'factory', 'dataObjects', 'identifiers',
+           'views']
 
 from factory import *
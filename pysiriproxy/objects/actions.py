@@ -28,6 +28,8 @@ class _CustomCommand(SiriObject):
 
     '''
 
+    Properties = ["utterance", "handsFree"]
+
     def __init__(self, command):
         '''
         * command -- The text command to issue
@@ -52,6 +54,8 @@ class _WebSearch(SiriObject):
 
     '''
 
+    Properties = ["utterance", "handsFree"]
+
     def __init__(self, query):
         '''
         * query -- The text to query on the web
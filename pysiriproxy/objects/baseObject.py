@@ -16,24 +16,189 @@
 '''The baseObject class contains the definition of the base class for
 all objects that can be sent to the iPhone, or to Apple's web server.
 
-'''
-from uuid import uuid4
+Each subclass of the :class:`SiriObject` class declares the names of its
+properties, which are stored in slots rather than in a dictionary for each
+object. A function which converts the objects of the class into a dictionary
+is compiled for each class, so converting an object only visits the declared
+properties, and only converts the properties which may contain other
+:class:`SiriObjects <SiriObject>`.
+
+Classes which do not declare any properties (such as the classes written
+for plugins before properties were declared) keep a dictionary for each
+object, and every attribute whose name does not start with an underscore is
+included in the dictionary created for the object, as it was before.
 
+'''
 from pysiriproxy.constants import Keys
+from pysiriproxy.objects.identifiers import randomAceId, randomRefId
+
+
+def _convertValue(value):
+    '''Convert a property which may contain SiriObjects into a value which
+    only contains Python dictionaries.
+
+    * value -- The value of the property
+
+    '''
+    if isinstance(value, SiriObject):
+        return value.toDict()
+    elif type(value) is list:
+        return [item.toDict() if isinstance(item, SiriObject) else item \
+                    for item in value]
+
+    return value
+
+
+def _getAttributes(obj):
+    '''Get the dictionary of attributes, whose names do not start with an
+    underscore, of an object which does not declare its properties.
+
+    * obj -- The SiriObject
+
+    '''
+    return dict((name, _convertValue(value)) for name, value in \
+                    obj.__dict__.iteritems() if not name.startswith("_"))
+
+
+def _compileToDict(cls):
+    '''Compile the function which converts an object of the given
+    SiriObject class into a Python dictionary.
+
+    * cls -- The SiriObject class
+
+    '''
+    lines = [
+        "def toDict(self):",
+        "    properties = {}",
+        "    dictionary = {%r: self._SiriObject__class, " \
+            "%r: self._SiriObject__group, %r: properties}" % \
+            (Keys.Class, Keys.Group, Keys.Properties),
+        ]
+
+    # Store the refId, aceId, and version values if we have one
+    for key, attr in ((Keys.RefId, "_SiriObject__refId"),
+                      (Keys.AceId, "_SiriObject__aceId"),
+                      (Keys.Version, "_SiriObject__version")):
+        lines.extend([
+                "    value = self.%s" % attr,
+                "    if value is not None:",
+                "        dictionary[%r] = value" % key,
+                ])
+
+    # Properties which are not set are left out of the dictionary
+    for name in cls.PropertyNames:
+        if name in cls.ObjectPropertyNames:
+            value = "_convertValue(value)"
+        else:
+            value = "value"
+
+        lines.extend([
+                "    value = self.%s" % name,
+                "    if value is not None:",
+                "        properties[%r] = %s" % (name, value),
+                ])
+
+    # Attributes which were not declared as properties are stored in the
+    # dictionary of the object
+    if cls.__dictoffset__ != 0:
+        lines.append("    properties.update(_getAttributes(self))")
+
+    lines.append("    return dictionary")
+
+    namespace = {"_convertValue": _convertValue,
+                 "_getAttributes": _getAttributes}
+    code = compile('\n'.join(lines), "<%s.toDict>" % cls.__name__, "exec")
+    exec code in namespace
+
+    toDict = namespace["toDict"]
+    toDict.__doc__ = "Convert this object into a Python dictionary."
+    return toDict
+
+
+class _SiriObjectType(type):
+    '''The _SiriObjectType class is the metaclass of the
+    :class:`SiriObject` class. It creates a slot for each of the properties
+    declared by a class, and compiles the toDict function of the class.
+    Classes which declare neither properties nor slots are given a
+    dictionary for each object, so that they can set any attribute.
+
+    '''
+
+    def __new__(mcs, name, bases, attributes):
+        '''
+        * name -- The name of the class
+        * bases -- The base classes of the class
+        * attributes -- The attributes of the class
+
+        '''
+        # Only the properties declared by this class need new slots, the
+        # properties of the base classes already have theirs
+        properties = tuple(attributes.get("Properties", ()))
+        objectProperties = tuple(attributes.get("ObjectProperties", ()))
+        slots = tuple(attributes.get("__slots__", ())) + properties + \
+            objectProperties
+
+        declared = "Properties" in attributes or \
+            "ObjectProperties" in attributes or "__slots__" in attributes
+        if not declared and all(base.__dictoffset__ == 0 for base in bases):
+            slots += ("__dict__",)
+
+        attributes["__slots__"] = slots
+
+        cls = type.__new__(mcs, name, bases, attributes)
 
+        # The names of all the properties, including inherited ones
+        propertyNames = properties + objectProperties
+        for base in bases:
+            propertyNames = getattr(base, "PropertyNames", ()) + propertyNames
+            objectProperties = getattr(base, "ObjectPropertyNames", ()) + \
+                objectProperties
 
-class SiriObject:
+        cls.PropertyNames = propertyNames
+        cls.ObjectPropertyNames = objectProperties
+
+        # Allow a class to provide its own conversion, which is then also
+        # used to write its objects into binary plists
+        cls.ConvertsItself = "toDict" in attributes
+        if not cls.ConvertsItself:
+            cls.toDict = _compileToDict(cls)
+
+        return cls
+
+
+class SiriObject(object):
     '''The SiriObject class encapsulates the base functionality for all
     object being sent to the iPhone or to Apple's web server.
 
+    Subclasses declare the names of their properties in the Properties list,
+    and the names of their properties which may contain other SiriObjects (or
+    lists of SiriObjects) in the ObjectProperties list. Only the declared
+    properties can be set on an object, and properties whose value is None
+    are not included in the dictionary created by :func:`toDict`.
+
+    Subclasses which provide their own toDict function are written into
+    binary plists as the dictionary it creates.
+
     .. note:: This class is meant to be subclassed to provide the
               implementation for a specific object.
 
     '''
+    __metaclass__ = _SiriObjectType
+
+    __slots__ = ("__class", "__group", "__refId", "__aceId", "__version")
 
     ProtocolVersion = "2.0"
     '''The identifier which indicates the version of the protocol.'''
-  
+
+    Properties = []
+    '''The list of names of the properties declared by the class.'''
+
+    ObjectProperties = []
+    '''The list of names of the properties declared by the class which may
+    contain other SiriObjects.
+
+    '''
+
     def __init__(self, className, group):
         '''
         * className -- The class name for the object
@@ -47,6 +212,10 @@ class SiriObject:
         self.__aceId = None
         self.__version = None
 
+        # All properties start out unset
+        for name in self.PropertyNames:
+            setattr(self, name, None)
+
     def setNonNoneArguments(self, argumentNames, localVars):
         '''Takes a list of strings which represent names of input variables and
         sets properties of the same name on the current object if the value of
@@ -63,50 +232,53 @@ class SiriObject:
             # Only set the argument if its value is not None
             if argValue is not None:
                 setattr(self, argName, argValue)
-  
-    def toDict(self):
-        '''Convert this object into a Python dictionary.'''
-        dictionary = {
-            Keys.Class: self.__class,
-            Keys.Group: self.__group,
-            Keys.Properties: {},
-            }
-      
-        # Store the refId, aceId, and version values if we have one
+
+    def getClassName(self):
+        '''Get the class name for this object.'''
+        return self.__class
+
+    def getRefId(self):
+        '''Get the ref id for this object, or None if it does not have one.'''
+        return self.__refId
+
+    def getHeader(self):
+        '''Get the list of (key, value) tuples for the class name and group
+        of this object, along with its refId, aceId, and version if it has
+        them.
+
+        '''
+        header = [(Keys.Class, self.__class), (Keys.Group, self.__group)]
+
         if self.__refId is not None:
-            dictionary[Keys.RefId] = self.__refId
+            header.append((Keys.RefId, self.__refId))
         if self.__aceId is not None:
-            dictionary[Keys.AceId] = self.__aceId
+            header.append((Keys.AceId, self.__aceId))
         if self.__version is not None:
-            dictionary[Keys.Version] = self.__version
-
-        # Traverse all of the object's properties to add them each to
-        # the output dictionary object
-        for key, item in self.__getProperties().iteritems():
-            # Determine how to handle the current property type
-            if type(item) == type(list()):
-                itemList = []
-
-                # Convert all the items in the list to a dictionary, and keep
-                # only the properties that are successfully converted
-                for val in item:
-                    try:
-                        val = val.toDict()
-                    except:
-                        pass
-                    itemList.append(val)
-
-                dictionary[Keys.Properties][key] = itemList
-            else:
-                # Attempt to conver the current property into a dictionary
-                try:
-                    item = item.toDict()
-                except:
-                    pass
-
-                dictionary[Keys.Properties][key] = item
-
-        return dictionary
+            header.append((Keys.Version, self.__version))
+
+        return header
+
+    def getProperties(self):
+        '''Get the list of (name, value) tuples for the properties of this
+        object which are set, followed by the attributes whose names do not
+        start with an underscore, for objects which do not declare their
+        properties. The values are not converted.
+
+        '''
+        properties = []
+        for name in self.PropertyNames:
+            value = getattr(self, name)
+            if value is not None:
+                properties.append((name, value))
+
+        # Attributes which were not declared as properties are stored in the
+        # dictionary of the object, the same as for toDict
+        if type(self).__dictoffset__ != 0:
+            properties.extend((name, value) for name, value in \
+                                  self.__dict__.iteritems() \
+                                  if not name.startswith("_"))
+
+        return properties
 
     def makeRoot(self, refId=None, aceId=None):
         '''Make the SiriObject the root object.
@@ -137,20 +309,15 @@ class SiriObject:
         '''
         self.__aceId = aceId if aceId is not None else self.__randomAceId()
 
-    def __getProperties(self):
-        '''Get all of the properties for this SiriObject.'''
-        return dict((k, p) for k, p in self.__dict__.iteritems() \
-                        if not k.startswith("_"))
-
     @classmethod
     def __randomRefId(cls):
         '''Create a random refId.'''
-        return str(uuid4()).upper()
+        return randomRefId()
 
     @classmethod
     def __randomAceId(cls):
         '''Create a random aceId.'''
-        return str(uuid4())
+        return randomAceId()
 
     @classmethod
     def isArgumentList(cls, obj):
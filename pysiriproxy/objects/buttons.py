@@ -27,6 +27,10 @@ class _Button(SiriObject):
     button on the iPhone Siri view.
 
     '''
+
+    Properties = ["text"]
+    ObjectProperties = ["commands"]
+
     def __init__(self, buttonText, commands=None):
         '''
         * buttonText -- The text displayed on the button
@@ -43,6 +47,8 @@ class _Custom(_Button):
     custom command to the event that it is pressed.
 
     '''
+    Properties = []
+
     def __init__(self, buttonText, command):
         '''
         * buttonText -- The text displayed on the button
@@ -59,6 +65,8 @@ class _WebSearchButton(_Button):
     pressed.
 
     '''
+    Properties = []
+
     def __init__(self, buttonText, query):
         '''
         * buttonText -- The text displayed on the button
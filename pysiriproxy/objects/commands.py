@@ -27,6 +27,8 @@ class _SendCommands(SiriObject):
 
     '''
 
+    ObjectProperties = ["commands"]
+
     def __init__(self, commands=None):
         '''
         * commands -- The list of commands to execute
@@ -43,6 +45,11 @@ class _ConfirmationOptions(SiriObject):
 
     '''
 
+    Properties = ["denyText", "cancelLabel", "submitLabel", "confirmText",
+                  "cancelTrigger"]
+    ObjectProperties = ["submitCommands", "cancelCommands", "denyCommands",
+                        "confirmCommands"]
+
     def __init__(self, submitCmds=None, cancelCmds=None, denyCmds=None,
                  confirmCmds=None, denyText="Cancel", cancelLabel="Cancel",
                  submitLabel="Send", confirmText="Send", cancelTrigger="Deny"):
@@ -80,6 +87,8 @@ class _ConfirmationOptions(SiriObject):
 class _ConfirmSnippetCommand(SiriObject):
     '''The _ConfirmSnippetCommand class creates a confirmation command.'''
 
+    Properties = ["request_id"]
+
     def __init__(self, requestId=""):
         '''
         * request_id -- The request id for this object
@@ -92,6 +101,8 @@ class _ConfirmSnippetCommand(SiriObject):
 class _CancelSnippetCommand(SiriObject):
     '''The _CancelSnippetCommand class creates a cancel command.'''
 
+    Properties = ["request_id"]
+
     def __init__(self, requestId=""):
         '''
         * request_id -- The request id for this object
@@ -107,6 +118,8 @@ class _CancelRequest(SiriObject):
 
     '''
 
+    Properties = ["request_id"]
+
     def __init__(self, requestId):
         '''
         * request_id -- The request id for this object
@@ -114,12 +127,15 @@ class _CancelRequest(SiriObject):
         '''
         SiriObject.__init__(self, "CancelRequest", "com.apple.ace.system")
 
-        self.request_id = refId
+        self.request_id = requestId
 
 
 class _ResultCallback(SiriObject):
     '''The _ResultCallback class creates a result callback Siri object.'''
 
+    Properties = ["code"]
+    ObjectProperties = ["commands"]
+
     def __init__(self, commands, code=0):
         '''
         * commands -- The commands for the result callback
@@ -28,6 +28,9 @@ class _Location(SiriObject):
 
     '''
 
+    Properties = ["label", "street", "city", "stateCode", "countryCode",
+                  "postalCode", "latitude", "longitude"]
+
     def __init__(self, label=None, street=None, city=None, stateCode=None,
                  countryCode=None, postalCode=None, latitude=None,
                  longitude=None):
@@ -57,6 +60,9 @@ class _Answer(SiriObject):
 
     '''
 
+    Properties = ["title"]
+    ObjectProperties = ["lines"]
+
     def __init__(self, title="", lines=None):
         '''
         * title -- The title for the answer
@@ -74,6 +80,8 @@ class _AnswerLine(SiriObject):
 
     '''
 
+    Properties = ["text", "image"]
+
     def __init__(self, text="", image=""):
         '''
         * text -- The text to display
@@ -90,6 +98,10 @@ class _MapItem(SiriObject):
     map item.
 
     '''
+
+    Properties = ["detailType", "label"]
+    ObjectProperties = ["location"]
+
     def __init__(self, label=None, location=None, detailType="BUSINESS_ITEM"):
         '''
         * label -- The label for the map item
@@ -113,6 +125,7 @@ class _CurrentLocation(_MapItem):
 
     '''
     __DetailType = 'CURRENT_LOCATION'
+    Properties = []
     
     def __init__(self, label=None):
         '''
@@ -210,7 +210,7 @@ class ResponseFactory:
 
     @classmethod
     def directions(cls, refId, directionsType, source, destination,
-                   utterance=None):
+                   utterance=None, asObject=False):
         '''Create directions to be sent to the iPhone.
 
         * refId -- The reference id
@@ -218,12 +218,14 @@ class ResponseFactory:
         * source -- The source location
         * destination -- The destination location
         * utterance -- The utterance to speak
+        * asObject -- True to return the :class:`.SiriObject` rather than
+                      a dictionary
 
         '''
         directions = ObjectFactory.directions(directionsType, source,
                                               destination, utterance=utterance)
         directions.makeRoot(refId)
-        return directions.toDict()
+        return directions if asObject else directions.toDict()
 
     @classmethod
     def drivingDirections(cls, refId, source, destination, utterance=None):
@@ -266,23 +268,27 @@ class ResponseFactory:
                               destination, utterance=utterance)
 
     @classmethod
-    def view(cls, refId, subObjects, dialogPhase="Completion"):
+    def view(cls, refId, subObjects, dialogPhase="Completion",
+             asObject=False):
         '''Create an utterance view composed of several sub objects.
 
         * refId -- The reference id
         * subObjects -- The list of SiriObjects the view will be composed of
                         or a list of tuple arguments to create SiriObjects
         * dialogPhase -- The dialogPhase
+        * asObject -- True to return the :class:`.SiriObject` rather than
+                      a dictionary
 
         '''
         addViews = Views.create(Views.AddViews, dialogPhase=dialogPhase,
                                 views=subObjects)
         addViews.makeRoot(refId)
-        return addViews.toDict()
+        return addViews if asObject else addViews.toDict()
 
     @classmethod
     def utterance(cls, refId, displayText, spokenText=None,
-                  listenAfterSpeaking=False, identifier="Misc#ident"):
+                  listenAfterSpeaking=False, identifier="Misc#ident",
+                  asObject=False):
         '''Create an utterance with the given display text, and spoken text.
 
         * refId -- The reference id
@@ -290,22 +296,26 @@ class ResponseFactory:
         * spokenText -- The text to be spoken by Siri
         * listenAfterSpeaking -- True for Siri to listen for a response
                                  after speaking, False otherwise
+        * asObject -- True to return the :class:`.SiriObject` rather than
+                      a dictionary
 
         '''
         utterance = ObjectFactory.utterance(displayText, spokenText,
                                             listenAfterSpeaking, identifier)
-        return ResponseFactory.view(refId, [utterance])
+        return ResponseFactory.view(refId, [utterance], asObject=asObject)
 
     @classmethod
-    def requestCompleted(cls, refId, callbacks=None):
+    def requestCompleted(cls, refId, callbacks=None, asObject=False):
         '''Create a request completed object.
 
         * refId -- The reference id
         * callbacks -- The list of callbacks
+        * asObject -- True to return the :class:`.SiriObject` rather than
+                      a dictionary
 
         '''
         completed = Requests.create(Requests.RequestCompleted,
                                     callbacks=callbacks)
         completed.makeRoot(refId)
 
-        return completed.toDict()
+        return completed if asObject else completed.toDict()
@@ -0,0 +1,122 @@
+# Copyright (C) 2012 Brett Ponsler, Pete Lamonica
+# This file is part of pysiriproxy.
+#
+# pysiriproxy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pysiriproxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pysiriproxy.  If not, see <http://www.gnu.org/licenses/>.
+'''The identifiers module contains the IdGenerator class which creates the
+random refIds and aceIds of :class:`.SiriObjects <.SiriObject>`.
+
+The ids are random (version 4) UUID strings. Rather than reading random
+bytes for every id, the random bytes for a whole batch of ids are read at
+once and converted into hexadecimal digits in a single call. Seeding the
+generator makes it create the same ids every time, which is useful for
+benchmarks and for comparing responses against saved copies.
+
+'''
+from os import urandom
+from random import Random
+from threading import Lock
+from binascii import hexlify
+
+
+# The variant digit of a UUID for each possible random hexadecimal digit
+_VARIANTS = dict((digit, "89ab"[int(digit, 16) & 3]) \
+                     for digit in "0123456789abcdef")
+
+
+class IdGenerator:
+    '''The IdGenerator class creates random UUID strings in batches.'''
+
+    DefaultBatchSize = 256
+    '''The default number of ids created at once.'''
+
+    def __init__(self, seed=None, batchSize=DefaultBatchSize):
+        '''
+        * seed -- The seed used to create the same ids every time, or None
+                  to create ids from the operating system's random source
+        * batchSize -- The number of ids created at once
+
+        '''
+        self.__batchSize = batchSize
+        self.__lock = Lock()
+        self.seed(seed)
+
+    def seed(self, seed=None):
+        '''Seed the generator, and discard any ids which were created but
+        not used.
+
+        * seed -- The seed used to create the same ids every time, or None
+                  to create ids from the operating system's random source
+
+        '''
+        with self.__lock:
+            self.__random = None if seed is None else Random(seed)
+            self.__ids = []
+
+    def nextId(self):
+        '''Get the next random UUID string.'''
+        with self.__lock:
+            if len(self.__ids) == 0:
+                self.__ids = self.__createBatch()
+
+            return self.__ids.pop()
+
+    ##### Private functions #####
+
+    def __createBatch(self):
+        '''Create a batch of random UUID strings, in the reverse of the order
+        they are used in.
+
+        '''
+        numBytes = 16 * self.__batchSize
+        if self.__random is None:
+            digits = hexlify(urandom(numBytes))
+        else:
+            digits = "%0*x" % (2 * numBytes,
+                               self.__random.getrandbits(8 * numBytes))
+
+        ids = []
+        for start in xrange(0, len(digits), 32):
+            d = digits[start:start + 32]
+
+            # Set the version and variant digits of a random UUID
+            ids.append("%s-%s-4%s-%s%s-%s" % (d[:8], d[8:12], d[13:16],
+                                              _VARIANTS[d[16]], d[17:20],
+                                              d[20:]))
+
+        ids.reverse()
+        return ids
+
+
+# The generator used for the ids of all SiriObjects
+_generator = IdGenerator()
+
+
+def seedIds(seed=None):
+    '''Seed the generator of the refIds and aceIds of all SiriObjects.
+
+    * seed -- The seed used to create the same ids every time, or None
+              to create ids from the operating system's random source
+
+    '''
+    _generator.seed(seed)
+
+
+def randomRefId():
+    '''Create a random refId.'''
+    return _generator.nextId().upper()
+
+
+def randomAceId():
+    '''Create a random aceId.'''
+    return _generator.nextId()
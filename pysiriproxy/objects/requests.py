@@ -26,6 +26,9 @@ class _RequestCompleted(SiriObject):
     request can be completed.
 
     '''
+
+    ObjectProperties = ["callbacks"]
+
     def __init__(self, callbacks=None):
         '''
         * callbacks -- The list of callbacks
@@ -39,6 +42,9 @@ class _StartRequest(SiriObject):
     '''The _StartRequest object signifies that a request is being started.
 
     '''
+
+    Properties = ["utterance", "handsFree", "proxyOnly"]
+
     def __init__(self, utterance="Testing", handsFree=False, proxyOnly=False):
         '''
         * utterance -- The utterance to perform
@@ -59,6 +65,8 @@ class _GetRequestOrigin(SiriObject):
 
     '''
 
+    Properties = ["desiredAccuracy", "searchTimeout", "maxAge"]
+
     def __init__(self, desiredAccuracy="HundredMeters", searchTimeout=8.0,
                  maxAge=1800):
         '''
@@ -79,6 +87,10 @@ class _SetRequestOrigin(SiriObject):
 
     '''
 
+    Properties = ["longitude", "latitude", "desiredAccuracy", "altitude",
+                  "speed", "direction", "age", "horizontalAccuracy",
+                  "verticalAccuracy"]
+
     def __init__(self, longitude=-122.030089795589, latitude=37.3317031860352,
                  desiredAccuracy="HundredMeters", altitude=0.0, speed=1.0,
                  direction=1.0, age=0, horizontalAccuracy=50.0,
@@ -28,6 +28,9 @@ class _AddViews(SiriObject):
 
     '''
 
+    Properties = ["scrollToTop", "temporary", "dialogPhase"]
+    ObjectProperties = ["views", "callbacks"]
+
     def __init__(self, scrollToTop=False, temporary=False,
                  dialogPhase="Completion", views=None, callbacks=None):
         '''
@@ -55,6 +58,9 @@ class _Utterance(SiriObject):
 
     '''
 
+    Properties = ["text", "speakableText", "dialogIdentifier",
+                  "listenAfterSpeaking"]
+
     def __init__(self, displayText="", spokenText=None,
                  listenAfterSpeaking=False, dialogIdentifier="Misc#ident"):
         '''
@@ -79,6 +85,10 @@ class _MapItemSnippet(SiriObject):
     to the iPhone user.
 
     '''
+
+    Properties = ["useCurrentLocation"]
+    ObjectProperties = ["items"]
+
     def __init__(self, useCurrentLocation=True, items=None):
         '''
         * useCurrentLocation -- True to use the user's current location
@@ -98,6 +108,9 @@ class _ShowMapPoints(SiriObject):
 
     '''
 
+    Properties = ["showDirections", "showTraffic", "directionsType"]
+    ObjectProperties = ["callbacks", "itemSource", "itemDestination"]
+
     def __init__(self, showDirections=True, showTraffic=False,
                  directionsType=DirectionTypes.Driving, callbacks=None,
                  source=None, destination=None):
@@ -127,6 +140,8 @@ class _AnswerSnippet(SiriObject):
 
     '''
 
+    ObjectProperties = ["answers", "confirmationOptions"]
+
     def __init__(self, answers=None, confirmationOptions=None):
         '''
         * answers -- The list of answers to display
@@ -56,6 +56,19 @@ class Directories:
     Etc = _Directory(join("/", "etc"))
     '''The Etc property contains the path to the system etc directory.'''
 
+    FakeServer = Config.getFile("fakeServer")
+    '''The FakeServer property contains the directory within the user's siri
+    proxy configuration directory where the key and certificate of the fake
+    Apple server are created.
+
+    '''
+
+    Profiles = Config.getFile("profiles")
+    '''The Profiles property contains the directory within the user's siri
+    proxy configuration directory where profiles are written.
+
+    '''
+
     Scripts = Config.getFile("scripts")
     '''The Scripts property contains the scripts directory within the user's
     siri proxy configuration directory.
@@ -117,6 +130,12 @@ class Files:
 
     '''
 
+    PluginManifest = join(Directories.Config, "pluginManifest.json")
+    '''The PluginManifest property contains the path to the file which caches
+    the descriptions of the filters and speech rules of all the plugins.
+
+    '''
+
 
 class Ids:
     '''The Ids class defines various configuration settings.
@@ -125,12 +144,31 @@ class Ids:
 
     '''
 
+    BufferRecords = "bufferrecords"
+    '''The name of the configuration property that stores the number of
+    records held in the buffer of captured data.
+
+    '''
+
     CertFile = "certfile"
     '''The name of the configuration property that stores the certification
     file.
 
     '''
 
+    Clients = "clients"
+    '''The name of the configuration property that stores the comma
+    separated list of addresses of clients whose sessions are captured.
+
+    '''
+
+    ConversationTimeout = "conversationtimeout"
+    '''The name of the configuration property that stores the number of
+    seconds a conversation may wait for a response from the Siri user before
+    it is closed.
+
+    '''
+
     DebugLevel = "debuglevel"
     '''The name of the configuration property that stores the debug level for
     the system.
@@ -152,6 +190,12 @@ class Ids:
 
     '''
 
+    File = "file"
+    '''The name of the configuration property that stores the path to the
+    file that data is written to.
+
+    '''
+
     GenCerts = "gencerts"
     '''The name of the command line property that determines if the SSL
     certificates should be generated.
@@ -170,12 +214,31 @@ class Ids:
 
     '''
 
+    IntentThreshold = "intentthreshold"
+    '''The name of the configuration property that stores the minimum
+    similarity score recognized speech must have with the template phrase of
+    an *@intent* speech rule for the speech rule to apply.
+
+    '''
+
+    IsolatedPlugins = "isolatedplugins"
+    '''The name of the configuration property that stores the comma separated
+    list of names of plugins which are hosted by a pool of worker processes.
+
+    '''
+
     KeyFile = "keyfile"
     '''The name of the configuration property that stores the path to the key
     file to use for the system.
 
     '''
 
+    LazyPlugins = "lazyplugins"
+    '''The name of the configuration property that determines whether plugins
+    are only imported once one of their filters or speech rules is applied.
+
+    '''
+
     LogFile = "logFile"
     '''The name of the configuration property that stores the path to the log
     file to use for the system.
@@ -188,6 +251,37 @@ class Ids:
 
     '''
 
+    MaxConversations = "maxconversations"
+    '''The name of the configuration property that stores the maximum
+    number of conversations kept waiting for a response.
+
+    '''
+
+    PluginProcesses = "pluginprocesses"
+    '''The name of the configuration property that stores the number of
+    worker processes used to host each isolated plugin.
+
+    '''
+
+    PluginTimeout = "plugintimeout"
+    '''The name of the configuration property that stores the number of
+    seconds each call to an isolated plugin is allowed to take.
+
+    '''
+
+    PluginReloadInterval = "pluginreloadinterval"
+    '''The name of the configuration property that stores the number of
+    seconds between checks for plugins which have been added, changed, or
+    removed.
+
+    '''
+
+    PluginThreads = "pluginthreads"
+    '''The name of the configuration property that stores the maximum number
+    of threads used to execute blocking plugin filters and speech rules.
+
+    '''
+
     PluginsDir = "pluginsdir"
     '''The name of the configuration property that stores the path to the
     directory containing the plugin scripts.
@@ -200,17 +294,63 @@ class Ids:
 
     '''
 
+    ProfileSeconds = "profileseconds"
+    '''The name of the configuration property that stores the number of
+    seconds pysiriproxy is profiled for when it receives the SIGUSR2 signal.
+
+    '''
+
+    ProfileStacks = "profilestacks"
+    '''The name of the configuration property that determines whether the
+    stack is sampled while pysiriproxy is being profiled.
+
+    '''
+
+    SampleRate = "samplerate"
+    '''The name of the configuration property that stores the percent of
+    sessions which are captured.
+
+    '''
+
+    SpeechAlternatives = "speechalternatives"
+    '''The name of the configuration property that stores the number of
+    alternative interpretations of recognized speech which are tried when no
+    speech rule applies to the recognized speech.
+
+    '''
+
+    SpeechCacheSize = "speechcachesize"
+    '''The name of the configuration property that stores the maximum number
+    of recognized phrases for which the speech rule that applies is cached.
+
+    '''
+
     Timestamp = "timestamp"
     '''The name of the configuration property that stores the boolean
     indicating whether logged messages should be timestamped or not.
 
     '''
 
+    TraceFile = "tracefile"
+    '''The name of the configuration property that stores the path to the
+    file that traces of Siri requests are written to.
+
+    '''
+
+    TraceFormat = "traceformat"
+    '''The name of the configuration property that stores the format that
+    traces of Siri requests are written in.
+
+    '''
+
 class Sections:
     '''The Sections class defines the names of the sections that can be
     used within the configuration file.
 
     '''
+    Capture = "Capture"
+    '''The section containing settings pertaining to capturing sessions.'''
+
     Debug = "Debug"
     '''The section containing debugging configuration settings.'''
 
@@ -226,6 +366,9 @@ class Sections:
     Logging = "Logging"
     '''The section containing settings pertaining to logging the system.'''
 
+    Metrics = "Metrics"
+    '''The section containing settings pertaining to serving metrics.'''
+
     Responses = "Responses"
     '''The section containing settings pertaining to creating responses.'''
 
@@ -64,6 +64,15 @@ class Settings:
 
     '''
 
+    ConversationTimeout = Option(Ids.ConversationTimeout, defaultValue=60.0,
+                                 typeFn=float)
+    '''This setting should contain the number of seconds a conversation
+    started by a speech rule may wait for a response from the Siri user
+    before it is closed. A value of zero allows conversations to wait
+    forever.
+
+    '''
+
     DebugLevel = Option(Ids.DebugLevel)
     '''This setting should contain the debug level which will be used by the
     system.
@@ -115,6 +124,30 @@ class Settings:
 
     '''
 
+    IntentThreshold = Option(Ids.IntentThreshold, defaultValue=0.7,
+                             typeFn=float)
+    '''This setting should contain the minimum similarity score (between 0
+    and 1) that recognized speech must have with the template phrase of an
+    *@intent* speech rule for the speech rule to apply.
+
+    '''
+
+    IsolatedPlugins = Option(Ids.IsolatedPlugins, defaultValue="",
+                             typeFn=conversions.string)
+    '''This setting should contain a comma separated list of the names of
+    plugins which are hosted by a pool of worker processes, rather than
+    within the pysiriproxy process.
+
+    '''
+
+    LazyPlugins = Option(Ids.LazyPlugins, defaultValue=True,
+                         typeFn=conversions.boolean)
+    '''This setting should contain True if plugins are only imported once
+    one of their filters or speech rules is applied, or False to import all
+    plugins when pysiriproxy starts.
+
+    '''
+
     KeyFile = Option(Ids.KeyFile, defaultValue=Files.KeyFile,
                      typeFn=conversions.string)
     '''The setting should contain the path to the file that is used as
@@ -141,12 +174,141 @@ class Settings:
 
     '''
 
+    CaptureFile = Option(Ids.File, defaultValue="",
+                         typeFn=conversions.string)
+    '''This setting should contain the path to the file that the data
+    received by captured sessions is written to. An empty string disables
+    capturing sessions.
+
+    '''
+
+    CaptureClients = Option(Ids.Clients, defaultValue="",
+                            typeFn=conversions.string)
+    '''This setting should contain a comma separated list of the addresses
+    of clients whose sessions are always captured.
+
+    '''
+
+    CaptureSampleRate = Option(Ids.SampleRate, defaultValue=100.0,
+                               typeFn=float)
+    '''This setting should contain the percent (between 0 and 100) of the
+    sessions with other clients which are captured.
+
+    '''
+
+    CaptureBufferRecords = Option(Ids.BufferRecords, defaultValue=4096,
+                                  typeFn=int)
+    '''This setting should contain the maximum number of records of
+    captured data held in memory until they are written. The oldest records
+    are dropped when the buffer is full.
+
+    '''
+
+    MetricsHost = Option(Ids.Host, defaultValue="127.0.0.1",
+                         typeFn=conversions.string)
+    '''This setting should contain the address of the interface on which
+    the metrics are served.
+
+    '''
+
+    MetricsPort = Option(Ids.Port, defaultValue=0, typeFn=int)
+    '''This setting should contain the port number on which the metrics are
+    served. A value of zero disables serving the metrics.
+
+    '''
+
+    MaxConversations = Option(Ids.MaxConversations, defaultValue=16,
+                              typeFn=int)
+    '''This setting should contain the maximum number of conversations
+    (across all sessions, and within each worker process hosting isolated
+    plugins) kept waiting for a response. The oldest conversation is closed
+    when another one is started.
+
+    '''
+
     PluginsDir = Option(Ids.PluginsDir, typeFn=conversions.string)
     '''This setting should contain the path to the system directory that
     contains the plugins which pysiriproxy should load.
 
     '''
 
+    PluginThreads = Option(Ids.PluginThreads, defaultValue=4, typeFn=int)
+    '''This setting should contain the maximum number of threads that are
+    used to execute plugin filters and speech rules which are decorated with
+    the *@blocking* decorator.
+
+    '''
+
+    ProfileSeconds = Option(Ids.ProfileSeconds, defaultValue=30.0,
+                            typeFn=float)
+    '''This setting should contain the number of seconds pysiriproxy is
+    profiled for each time it receives the SIGUSR2 signal.
+
+    '''
+
+    ProfileStacks = Option(Ids.ProfileStacks, defaultValue=True,
+                           typeFn=conversions.boolean)
+    '''This setting should contain True if the stack is sampled while
+    pysiriproxy is being profiled, and written in the collapsed stack format
+    used to create flame graphs.
+
+    '''
+
+    PluginProcesses = Option(Ids.PluginProcesses, defaultValue=2, typeFn=int)
+    '''This setting should contain the number of worker processes used to
+    host isolated plugins.
+
+    '''
+
+    PluginReloadInterval = Option(Ids.PluginReloadInterval, defaultValue=2.0,
+                                  typeFn=float)
+    '''This setting should contain the number of seconds between checks for
+    plugins which have been added, changed, or removed. Changed plugins are
+    reloaded without restarting pysiriproxy. A value of zero disables
+    reloading plugins.
+
+    '''
+
+    PluginTimeout = Option(Ids.PluginTimeout, defaultValue=5.0,
+                           typeFn=float)
+    '''This setting should contain the number of seconds each call to an
+    isolated plugin is allowed to take before Siri responds with the error
+    response.
+
+    '''
+
+    SpeechAlternatives = Option(Ids.SpeechAlternatives, defaultValue=3,
+                                typeFn=int)
+    '''This setting should contain the number of alternative interpretations
+    of recognized speech which are tried, best first, when no speech rule
+    applies to the recognized speech. A value of zero only tries the
+    recognized speech.
+
+    '''
+
+    SpeechCacheSize = Option(Ids.SpeechCacheSize, defaultValue=256,
+                             typeFn=int)
+    '''This setting should contain the maximum number of recognized phrases
+    for which the speech rule that applies is cached. A value of zero
+    disables the cache.
+
+    '''
+
+    TraceFile = Option(Ids.TraceFile, defaultValue="",
+                       typeFn=conversions.string)
+    '''This setting should contain the path to the file that a trace of
+    every Siri request is written to. An empty string disables tracing.
+
+    '''
+
+    TraceFormat = Option(Ids.TraceFormat, defaultValue="jsonl",
+                         typeFn=conversions.string)
+    '''This setting should contain the format that traces are written in,
+    either 'jsonl' to write each trace as a JSON object on a single line, or
+    'chrome' to write the traces in the Chrome trace event format.
+
+    '''
+
     Timestamp = Option(Ids.Timestamp, typeFn=conversions.string)
     '''This setting should contain a string which is the format for the
     timestamp which will be applied to all logged messages. See the man
@@ -190,9 +352,24 @@ class Options(OptionsParser):
     Options = {
         Sections.General: [
             Settings.PluginsDir,
+            Settings.PluginThreads,
+            Settings.IsolatedPlugins,
+            Settings.PluginProcesses,
+            Settings.PluginTimeout,
+            Settings.PluginReloadInterval,
+            Settings.LazyPlugins,
+            Settings.SpeechCacheSize,
+            Settings.SpeechAlternatives,
+            Settings.IntentThreshold,
+            Settings.ConversationTimeout,
+            Settings.MaxConversations,
             ],
         Sections.Debug: [
             Settings.ExitOnConnectionLost,
+            Settings.TraceFile,
+            Settings.TraceFormat,
+            Settings.ProfileSeconds,
+            Settings.ProfileStacks,
             ],
         Sections.Server: [
             Settings.ServerHost,
@@ -209,6 +386,16 @@ class Options(OptionsParser):
             Settings.LogFile,
             Settings.Timestamp,
             ],
+        Sections.Metrics: [
+            Settings.MetricsHost,
+            Settings.MetricsPort,
+            ],
+        Sections.Capture: [
+            Settings.CaptureFile,
+            Settings.CaptureClients,
+            Settings.CaptureSampleRate,
+            Settings.CaptureBufferRecords,
+            ],
         Sections.Responses: [
             Settings.ErrorResponse,
             ],
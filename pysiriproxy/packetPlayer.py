@@ -13,63 +13,73 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with pysiriproxy.  If not, see <http://www.gnu.org/licenses/>.
-'''Contains the Player class.'''
-from pysiriproxy.utils import toHex
-from pysiriproxy.constants import Modes
+'''Contains the Player class, and the Replayer class which replays captured
+sessions within the twisted reactor.
+
+'''
+from time import time
+
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, gatherResults
+
+from pysiriproxy.constants import Directions
+from pysiriproxy.capture import CaptureFile
+from pysiriproxy.connections.connection import Connection
+from pysiriproxy.plugins.statistics import LatencyHistogram
+from pysiriproxy.connections.manager import ConnectionManager
 
 from pyamp.processes.threading import Thread
 
 
 class Player(Thread):
-    '''The Player class loads a file containing data which it proceeds
-    to send to the given protocol class using the same interface used
+    '''The Player class loads a capture file containing data which it
+    proceeds to send to the given protocol class using the same interface used
     to handle connections to the server. This allows us to save incoming
     data to the server and replay it for testing purposes.
 
+    Only the data received from the iPhone during a single session of the
+    capture file is sent to the protocol.
+
+    .. note:: The Player sends data to the protocol from its own thread, about
+              once per second. The :class:`Replayer` class replays captures
+              within the twisted reactor instead.
+
     '''
 
-    def __init__(self, protocol, filename, logger):
+    def __init__(self, protocol, filename, logger, sessionId=None):
         '''
         * protocol -- The server protocol class
-        * filename -- The filename containing to data to replay
+        * filename -- The capture file containing the data to replay
         * logger -- The logger
+        * sessionId -- The id of the session to replay, or None to replay
+                       the first session in the file
 
         '''
         Thread.__init__(self)
         self.__log = logger.get("PacketPlayer")
         self.__protocol = protocol(logger=logger)
 
-        self.__content = file(filename).read()
-        self.__lines = self.__content.split("-END_OF_DATA-")
-        self.__index = 0
-
-        # Start in Line mode
-        self.__setMode(Modes.Line)
+        self.__captureFile = CaptureFile(filename)
+        if sessionId is None:
+            sessions = self.__captureFile.getSessions()
+            sessionId = sessions[0] if len(sessions) > 0 else None
 
-        # Map the fuction to call based on the current mode
-        self.__modeMap = {Modes.Line: self.__sendLineData,
-                          Modes.Raw: self.__sendRawData}
+        self.__records = self.__captureFile.iterRecords(sessionId)
 
     def onCycle(self, i):
         '''Called during each cycle of the thread.'''
-        if self.__index >= len(self.__lines):
-            self.shutdown()
-            return
-
         # The first cycle corresponds to a created connection
         if i == 1:
             self.__protocol.connectionMade()
 
         # Only send data once per second
         if i % 10 == 0:
-            # Call the data sending function for the current mode
-            modeFn = self.__modeMap.get(self.__protocol.getMode())
-            if modeFn is not None:
-                modeFn()
+            self.__sendData()
 
     def onShutdown(self):
         '''Called in the event that the thread is shutdown.'''
         self.__protocol.connectionLost("Player thread shutdown")
+        self.__captureFile.close()
 
     def onException(self, e, traceback):
         '''An exception occurred.
@@ -83,35 +93,296 @@ class Player(Thread):
 
     ##### Private functions #####
 
-    def __sendLineData(self):
-        '''Send a line of data to the server.'''
-        data = self.__lines[self.__index]
-        self.__protocol.lineReceived(data)
-        self.__index += 1
+    def __sendData(self):
+        '''Send the next data received from the iPhone to the server.'''
+        for _received, _sessionId, direction, data in self.__records:
+            if direction == Directions.From_iPhone:
+                # The protocol splits the data into lines, or handles it as
+                # raw data, depending on its current mode
+                self.__protocol.dataReceived(data)
+                return
+
+        self.shutdown()
+
+
+class _SinkTransport:
+    '''The _SinkTransport class stands in for the transport of a replayed
+    connection, and counts the data written to it.
+
+    '''
+    disconnecting = False
+
+    def __init__(self):
+        self.written = 0
+
+    def write(self, data):
+        '''Count the data written to the transport.
+
+        * data -- The data
+
+        '''
+        self.written += len(data)
+
+    def loseConnection(self):
+        '''Disconnect the transport.'''
+        self.disconnecting = True
+
+    def getPeer(self):
+        '''Get the address of the replayed client.'''
+        return None
+
+
+class ReplaySession:
+    '''The ReplaySession class replays both directions of a captured session
+    into a pair of connections of its own, and measures how long the
+    connections take to process each record. A record is processed once
+    every object in it has been forwarded or dropped, so plugin filters
+    which complete later (e.g., blocking filters, or the filters of isolated
+    plugins) are included, and the next record is replayed after that.
 
-    def __sendRawData(self):
-        '''Send raw data to the server.'''
-        # True to send all remaining data, else to send parts
-        _SEND_ALL = False
-
-        # The two ways of choosing data to send
-        if _SEND_ALL:
-            # Send all remaining data at once
-            lines = self.__lines[self.__index:]
-            self.__index = len(self.__lines)
-            data = '\n'.join(lines)
+    The connections of each ReplaySession are managed by their own
+    :class:`.ConnectionManager`, so many sessions can be replayed at once.
+    Responses created by plugins are sent to the connections of the session
+    whose objects the plugins processed.
+
+    '''
+
+    def __init__(self, name, records, speed, logger):
+        '''
+        * name -- The name of the session
+        * records -- The list of (time, session id, direction, data) tuples
+        * speed -- The number of times faster than it was captured to replay
+                   the session, or zero to replay it as fast as possible
+        * logger -- The logger
+
+        '''
+        self.name = name
+        self.__records = records
+        self.__speed = speed
+
+        manager = ConnectionManager(logger, shared=False)
+        self.__connections = {}
+        for direction in (Directions.From_iPhone, Directions.From_Server):
+            connection = Connection("%s %s" % (name, direction), direction,
+                                    logger, connectionManager=manager)
+            connection.transport = _SinkTransport()
+            self.__connections[direction] = connection
+
+        self.__index = 0
+        self.__started = None
+        self.__finished = None
+        self.__deferred = None
+
+        self.processing = LatencyHistogram()
+        self.lag = LatencyHistogram()
+        self.bytes = 0
+
+    def start(self):
+        '''Start replaying the session. Returns a Deferred which is called
+        back with this session once every record has been replayed.
+
+        '''
+        self.__deferred = Deferred()
+        self.__started = time()
+        self.__scheduleNext()
+        return self.__deferred
+
+    def getElapsed(self):
+        '''Get the number of seconds the replay took, or has taken so
+        far.
+
+        '''
+        finished = self.__finished if self.__finished is not None else time()
+        return finished - self.__started if self.__started is not None else 0
+
+    def getForwarded(self, direction):
+        '''Get the number of bytes forwarded by the connection with the
+        given direction.
+
+        * direction -- The direction
+
+        '''
+        forwardDirection = Directions.From_Server \
+            if direction == Directions.From_iPhone else Directions.From_iPhone
+        return self.__connections[forwardDirection].transport.written
+
+    def report(self):
+        '''Get a line summarizing the replay of this session.'''
+        elapsed = max(self.getElapsed(), 1e-9)
+        latency = self.processing
+        return "%s: records=%d bytes=%d elapsed=%.3fs records/s=%.1f " \
+            "KB/s=%.1f mean=%.3fms p50=%.3fms p95=%.3fms p99=%.3fms " \
+            "max=%.3fms lag=%.3fms" % \
+            (self.name, latency.count, self.bytes, elapsed,
+             latency.count / elapsed, self.bytes / elapsed / 1024,
+             latency.mean() * 1000, latency.percentile(50) * 1000,
+             latency.percentile(95) * 1000, latency.percentile(99) * 1000,
+             latency.maximum * 1000, self.lag.percentile(99) * 1000)
+
+    ##### Private functions #####
+
+    def __scheduleNext(self):
+        '''Schedule the next record to be replayed.'''
+        if self.__index >= len(self.__records):
+            self.__finished = time()
+            self.__deferred.callback(self)
+            return
+
+        if self.__speed > 0:
+            # Replay the record at the same time after the first record as
+            # it was captured, scaled by the speed
+            offset = (self.__records[self.__index][0] - \
+                          self.__records[0][0]) / self.__speed
+            delay = max(0, self.__started + offset - time())
         else:
-            # Send parts of the remaining data
-            lines = self.__lines[self.__index]
-            self.__index += 1
-            data = lines
+            offset = None
+            delay = 0
+
+        reactor.callLater(delay, self.__replayNext, offset)
+
+    def __replayNext(self, offset):
+        '''Replay the next record.
+
+        * offset -- The number of seconds after the start of the replay that
+                    the record should be replayed, or None
+
+        '''
+        _received, _sessionId, direction, data = self.__records[self.__index]
+        self.__index += 1
+
+        start = time()
+        if offset is not None:
+            self.lag.record(max(0, start - self.__started - offset))
+
+        connection = self.__connections[direction]
+        try:
+            connection.dataReceived(data)
+        except:
+            # Stop replaying a session which can no longer be processed
+            self.__finished = time()
+            self.__deferred.errback()
+            return
+
+        # Objects whose plugin filters have not completed (e.g., blocking
+        # filters, or filters of isolated plugins) are still being processed
+        idle = connection.whenIdle()
+        idle.addCallback(self.__finishRecord, start, len(data))
+
+    def __finishRecord(self, _result, start, numBytes):
+        '''Record the time taken to process a record once every object in
+        it has been forwarded, and then replay the next record.
+
+        * _result -- The result of the Deferred
+        * start -- The time the record was replayed
+        * numBytes -- The number of bytes in the record
+
+        '''
+        self.processing.record(time() - start)
+        self.bytes += numBytes
+
+        self.__scheduleNext()
+
+
+class Replayer:
+    '''The Replayer class replays any number of captured sessions at once
+    within the twisted reactor.
+
+    Example::
+
+        replayer = Replayer(logger, speed=0)
+        replayer.addCapture("capture.data", copies=10)
+        replayer.start().addCallback(lambda sessions: reactor.stop())
+        reactor.run()
+
+        for line in replayer.report():
+            print line
+
+    '''
+
+    def __init__(self, logger, speed=1.0):
+        '''
+        * logger -- The logger
+        * speed -- The number of times faster than they were captured to
+                   replay the sessions, or zero to replay them as fast as
+                   possible
+
+        '''
+        self.__logger = logger
+        self.__speed = speed
+        self.__sessions = []
+        self.__started = None
+        self.__finished = None
+
+    def addCapture(self, filename, sessionIds=None, copies=1):
+        '''Add the sessions in a capture file to be replayed.
+
+        * filename -- The capture file
+        * sessionIds -- The list of ids of the sessions to replay, or None
+                        to replay every session in the file
+        * copies -- The number of times to replay each session at once
+
+        '''
+        captureFile = CaptureFile(filename)
+        try:
+            if sessionIds is None:
+                sessionIds = captureFile.getSessions()
+
+            for sessionId in sessionIds:
+                records = list(captureFile.iterRecords(sessionId))
+                for copy in range(copies):
+                    name = "%s:%d" % (filename, sessionId)
+                    if copies > 1:
+                        name += "#%d" % (copy + 1)
+
+                    self.__sessions.append(ReplaySession(
+                            name, records, self.__speed, self.__logger))
+        finally:
+            captureFile.close()
 
-        self.__protocol.rawDataReceived(data)
+    def getSessions(self):
+        '''Get the list of ReplaySessions.'''
+        return self.__sessions
+
+    def start(self):
+        '''Start replaying every session. Returns a Deferred which is called
+        back with the list of ReplaySessions once they have all finished.
+
+        '''
+        self.__started = time()
+
+        deferred = gatherResults([session.start() \
+                                      for session in self.__sessions],
+                                 consumeErrors=True)
+        deferred.addCallback(self.__onFinished)
+        return deferred
+
+    def report(self):
+        '''Get the list of lines summarizing the replay of every session,
+        followed by a line summarizing all of them.
+
+        '''
+        lines = [session.report() for session in self.__sessions]
+
+        finished = self.__finished if self.__finished is not None else time()
+        elapsed = max(finished - (self.__started or finished), 1e-9)
+
+        records = sum(session.processing.count \
+                          for session in self.__sessions)
+        numBytes = sum(session.bytes for session in self.__sessions)
+        lines.append("Total: sessions=%d records=%d bytes=%d elapsed=%.3fs " \
+                         "records/s=%.1f KB/s=%.1f" % \
+                         (len(self.__sessions), records, numBytes, elapsed,
+                          records / elapsed, numBytes / elapsed / 1024))
+
+        return lines
+
+    ##### Private functions #####
 
-    def __setMode(self, mode):
-        '''Set the data sending mode.
+    def __onFinished(self, sessions):
+        '''Called once every session has been replayed.
 
-        * mode -- The mode
+        * sessions -- The list of ReplaySessions
 
         '''
-        self.__mode = mode
+        self.__finished = time()
+        return sessions
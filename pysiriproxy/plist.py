@@ -13,24 +13,56 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with pysiriproxy.  If not, see <http://www.gnu.org/licenses/>.
-'''The plist module contains the Plist, and BinaryPlist classes.
+'''The plist module contains the Plist, BinaryPlist, and ObjectPlist classes.
 
 These classes are designed to encapsulate a plist object, and be able
-to convert a standard plist into a binary formatted plist.
+to convert a standard plist, or a :class:`.SiriObject`, into a binary
+formatted plist.
 
 '''
 import re
 import biplist
 from string import printable
+from struct import pack
 from StringIO import StringIO
 from datetime import datetime, timedelta
 from CFPropertyList import CFPropertyList, native_types
 
 from pysiriproxy.constants import Keys
+from pysiriproxy.objects.baseObject import SiriObject
 
 from pyamp.util import getStackTrace
 
 
+# The date from which the dates in a binary plist are measured
+_REFERENCE_DATE = datetime(2001, 1, 1)
+
+# The string containing every printable character
+_PRINTABLE = printable
+
+
+def _toDate(seconds):
+    '''Convert the number of seconds since the epoch, as used by Siri, into
+    a date.
+
+    * seconds -- The number of seconds
+
+    '''
+    # @todo: I have still seen this fail to properly determine
+    #        the date. The speakable text date can be different
+    #        than the displayed date.
+
+    # Convert the number of seconds since the epoch into
+    # an actual date
+    # NOTE: This works better than just passing the time to the
+    # fromtimestamp function as that throws exceptions sometimes
+    date = datetime.fromtimestamp(0) + timedelta(seconds=seconds)
+
+    # The epoch that these dates use is thirty one years in the
+    # future from the standard epoch date
+    return date.replace(year=date.year + 31)
+
+
 class BinaryPlist:
     '''The BinaryPlist class takes in a dictionary containing data and
     provides the ability to convert the dictionary into a binary plist.
@@ -112,21 +144,7 @@ class BinaryPlist:
                                          (type(item), item))
                     self.__log.error(getStackTrace())
             elif key in self.DateKeys:
-                # @todo: I have still seen this fail to properly determine
-                #        the date. The speakable text date can be different
-                #        than the displayed date.
-
-                # Convert the number of seconds since the epoch into
-                # an actual date
-                # NOTE: This works better than just passing the time to the
-                # fromtimestamp function as that throws exceptions sometimes
-                date = datetime.fromtimestamp(0) + timedelta(seconds=item)
-
-                # The epoch that these dates use is thirty one years in the
-                # future from the standard epoch date
-                date = date.replace(year=date.year + 31)
-
-                data[key] = date
+                data[key] = _toDate(item)
             else:
                 data[key] = self.__fixItem(item)
 
@@ -192,6 +210,285 @@ class BinaryPlist:
             return True
 
 
+class ObjectPlist:
+    '''The ObjectPlist class converts a :class:`.SiriObject` directly into a
+    binary plist, without first converting the object into a dictionary.
+
+    Each item of the object is visited once and written straight into the
+    object table of the binary plist. Dictionaries contained in the object
+    (such as the objects received from Siri) are written in the same way.
+    Strings and dates are converted in the same way as by the
+    :class:`BinaryPlist` class, and equal strings and numbers are only
+    stored once.
+
+    '''
+
+    DateKeys = frozenset(BinaryPlist.DateKeys)
+    '''The set of object keys whose values are dates.'''
+
+    UnicodeKeys = frozenset(BinaryPlist.UnicodeKeys)
+    '''The set of object keys whose values are unicode strings.'''
+
+    def __init__(self, obj, logger):
+        '''
+        * obj -- The SiriObject to convert into a binary plist
+        * logger -- The logger
+
+        '''
+        self.__log = logger.get("ObjectPlist")
+        self.__obj = obj
+
+        self.__objects = []
+        self.__uniques = {}
+
+    def toBinary(self):
+        '''Convert the object into a binary plist.'''
+        self.__objects = []
+        self.__uniques = {}
+
+        self.__add(self.__obj)
+
+        return self.__write()
+
+    ##### Private functions #####
+
+    def __add(self, item, key=None):
+        '''Add an item to the object table, and get the index of the item
+        within the table.
+
+        * item -- The item
+        * key -- The dictionary key of the item, if it has one
+
+        '''
+        if isinstance(item, SiriObject):
+            return self.__addObject(item)
+
+        itemType = type(item)
+        if itemType is dict:
+            return self.__addDictionary(item.iteritems())
+        elif itemType is list or itemType is tuple:
+            return self.__addArray(item)
+        elif itemType is str and key in self.UnicodeKeys:
+            try:
+                item = unicode(item, "utf-8")
+            except UnicodeDecodeError:
+                self.__log.error("Error translating to unicode: %s, %s" % \
+                                     (itemType, item))
+        elif itemType in (int, long, float) and key in self.DateKeys:
+            item = _toDate(item)
+
+        return self.__addScalar(item)
+
+    def __addScalar(self, item):
+        '''Add an item which is not a container to the object table, and get
+        the index of the item within the table.
+
+        * item -- The item
+
+        '''
+        encoded = _encodeScalar(item)
+
+        # Equal items are only stored once
+        index = self.__uniques.get(encoded)
+        if index is None:
+            index = len(self.__objects)
+            self.__objects.append(encoded)
+            self.__uniques[encoded] = index
+
+        return index
+
+    def __addObject(self, obj):
+        '''Add a SiriObject to the object table, and get the index of the
+        object within the table.
+
+        * obj -- The SiriObject
+
+        '''
+        # Objects which provide their own conversion are written as the
+        # dictionary they convert into
+        if obj.ConvertsItself:
+            return self.__addDictionary(obj.toDict().iteritems())
+
+        index = self.__reserve()
+
+        keys = [self.__addScalar(Keys.Properties)]
+        values = [self.__addDictionary(obj.getProperties())]
+        for key, value in obj.getHeader():
+            keys.append(self.__addScalar(key))
+            values.append(self.__addScalar(value))
+
+        self.__objects[index] = (_encodeHeader(0xD, len(keys)), keys + values)
+        return index
+
+    def __addDictionary(self, items):
+        '''Add a dictionary to the object table, and get the index of the
+        dictionary within the table.
+
+        * items -- The (key, value) tuples of the dictionary
+
+        '''
+        index = self.__reserve()
+
+        keys = []
+        values = []
+        for key, value in items:
+            keys.append(self.__addScalar(key))
+            values.append(self.__add(value, key))
+
+        self.__objects[index] = (_encodeHeader(0xD, len(keys)), keys + values)
+        return index
+
+    def __addArray(self, items):
+        '''Add an array to the object table, and get the index of the array
+        within the table.
+
+        * items -- The items in the array
+
+        '''
+        index = self.__reserve()
+
+        references = [self.__add(item) for item in items]
+
+        self.__objects[index] = (_encodeHeader(0xA, len(references)),
+                                 references)
+        return index
+
+    def __reserve(self):
+        '''Reserve the next entry in the object table for a container whose
+        contents have not been added yet, and get the index of the entry.
+
+        '''
+        self.__objects.append(None)
+        return len(self.__objects) - 1
+
+    def __write(self):
+        '''Write the object table, the offset table, and the trailer of the
+        binary plist.
+
+        '''
+        referenceSize, referenceFormat = _getSizeFormat(len(self.__objects))
+
+        output = ["bplist00"]
+        offsets = []
+        position = len(output[0])
+
+        for entry in self.__objects:
+            # Containers are written once the size of a reference is known
+            if type(entry) is tuple:
+                header, references = entry
+                entry = header + pack(">%d%s" % (len(references),
+                                                 referenceFormat), *references)
+
+            offsets.append(position)
+            output.append(entry)
+            position += len(entry)
+
+        offsetSize, offsetFormat = _getSizeFormat(position)
+        output.append(pack(">%d%s" % (len(offsets), offsetFormat), *offsets))
+        output.append(pack(">6xBBQQQ", offsetSize, referenceSize,
+                           len(offsets), 0, position))
+
+        return ''.join(output)
+
+
+def _getSizeFormat(value):
+    '''Get the number of bytes, and the struct format, needed to store
+    unsigned integers up to the given value.
+
+    * value -- The largest value
+
+    '''
+    if value <= 0xFF:
+        return 1, "B"
+    elif value <= 0xFFFF:
+        return 2, "H"
+
+    return 4, "L"
+
+
+def _encodeHeader(marker, length):
+    '''Encode the marker byte of a binary plist object which has a length.
+
+    * marker -- The type of the object
+    * length -- The length of the object
+
+    '''
+    if length < 0xF:
+        return chr(marker << 4 | length)
+
+    return chr(marker << 4 | 0xF) + _encodeInteger(length)
+
+
+def _encodeInteger(value):
+    '''Encode an integer as a binary plist object.
+
+    * value -- The integer
+
+    '''
+    if value < 0:
+        return "\x13" + pack(">q", value)
+    elif value <= 0xFF:
+        return "\x10" + chr(value)
+    elif value <= 0xFFFF:
+        return "\x11" + pack(">H", value)
+    elif value <= 0xFFFFFFFF:
+        return "\x12" + pack(">L", value)
+    elif value <= 0x7FFFFFFFFFFFFFFF:
+        return "\x13" + pack(">q", value)
+
+    raise Exception("Integer is too large for a binary plist: %d" % value)
+
+
+def _encodeString(string):
+    '''Encode a byte string as a binary plist object. Strings containing
+    non-printable characters are stored as data.
+
+    * string -- The string
+
+    '''
+    if len(string.translate(None, _PRINTABLE)) == 0:
+        return _encodeHeader(0x5, len(string)) + string
+
+    return _encodeHeader(0x4, len(string)) + string
+
+
+def _encodeScalar(item):
+    '''Encode an item which is not a container as a binary plist object.
+
+    * item -- The item
+
+    '''
+    itemType = type(item)
+    if itemType is str:
+        return _encodeString(item)
+    elif itemType is unicode:
+        try:
+            encoded = item.encode("ascii")
+            return _encodeHeader(0x5, len(encoded)) + encoded
+        except UnicodeEncodeError:
+            encoded = item.encode("utf_16_be")
+            return _encodeHeader(0x6, len(encoded) / 2) + encoded
+    elif itemType is bool:
+        return "\x09" if item else "\x08"
+    elif itemType is int or itemType is long:
+        return _encodeInteger(item)
+    elif itemType is float:
+        return "\x23" + pack(">d", item)
+    elif itemType is datetime:
+        delta = item - _REFERENCE_DATE
+        seconds = delta.days * 86400 + delta.seconds + \
+            delta.microseconds / 1000000.0
+        return "\x33" + pack(">d", seconds)
+    elif item is None:
+        return "\x00"
+    elif isinstance(item, biplist.Data):
+        return _encodeHeader(0x4, len(item)) + item
+    elif isinstance(item, str):
+        return _encodeString(item)
+
+    raise Exception("Cannot store %s in a binary plist" % itemType.__name__)
+
+
 class Plist:
     '''The Plist class contains methods pertaining to converting objects
     to plist objects and manipulating them.
@@ -216,9 +513,14 @@ class Plist:
     def toBinary(cls, data, logger, logFile="/dev/null"):
         '''Convert an object into a binary plist.
 
-        * data -- The data to convert into a binary plist
+        * data -- The dictionary or :class:`.SiriObject` to convert into a
+                  binary plist
         * logger -- The logger
         * logFile -- The file to which output will be logged
 
         '''
+        # SiriObjects are written without converting them into dictionaries
+        if SiriObject.isSiriObject(data):
+            return ObjectPlist(data, logger).toBinary()
+
         return BinaryPlist(data, logger, logFile).toBinary()
@@ -13,12 +13,20 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with pysiriproxy.  If not, see <http://www.gnu.org/licenses/>.
-__all__ = ['directions', 'objectClasses', 'speechRules', 'manager', 'plugin',
-           'responses']
+__all__ = ['directions', 'execution', 'intents', 'isolation', 'manifest',
+           'objectClasses', 'registry', 'speechRules', 'speechIndex',
+           'statistics', 'manager', 'plugin', 'responses']
 
 from responses import *
 from directions import *
+from intents import *
 from speechRules import *
+from speechIndex import *
+from execution import *
+from statistics import *
 from objectClasses import *
+from registry import *
 from plugin import *
+from manifest import *
+from isolation import *
 from manager import *
@@ -0,0 +1,209 @@
+# Copyright (C) 2012 Brett Ponsler, Pete Lamonica
+# This file is part of pysiriproxy.
+#
+# pysiriproxy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pysiriproxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pysiriproxy.  If not, see <http://www.gnu.org/licenses/>.
+'''The execution module contains functions and classes which control where
+plugin code is executed.
+
+Plugin filters and speech rules are normally called from within the twisted
+reactor, which means that a plugin which performs a slow operation stalls
+all of the traffic passing through pysiriproxy. Plugin functions that
+perform slow operations can either return a twisted Deferred, or they can be
+decorated with the *@blocking* decorator, which causes them to be executed
+in a bounded pool of threads.
+
+Every filter and speech rule is called on behalf of the session (the iPhone
+connection) whose object or recognized speech it is processing. The session
+is kept in the twisted context of the call, which follows the call into the
+pool of threads, so the responses created by the plugin are sent to the
+session which made the call, even if they are sent once another session has
+started to use the plugin.
+
+'''
+from twisted.internet import reactor, threads
+from twisted.python import context
+from twisted.python.threadable import isInIOThread
+from twisted.python.threadpool import ThreadPool
+
+
+# The name of the property used to mark a function as blocking
+_BLOCKING_PROP = "Blocking"
+
+# The key of the session a plugin function is called for in the context
+_SESSION_KEY = "pysiriproxy.plugins.session"
+
+
+def blocking(function):
+    '''The blocking function is a decorator which indicates that a plugin
+    filter or speech rule performs a slow operation and must be executed
+    outside of the twisted reactor.
+
+    * function -- The function
+
+    '''
+    setattr(function, _BLOCKING_PROP, True)
+    return function
+
+
+def isBlocking(function):
+    '''Determine if the given function is marked as blocking.
+
+    * function -- The function
+
+    '''
+    return getattr(function, _BLOCKING_PROP, False)
+
+
+def isReactorRunning():
+    '''Determine if the twisted reactor is currently running.'''
+    return reactor.running
+
+
+def callInSession(session, function, *args, **kwargs):
+    '''Call the function on behalf of the given session, and get the result
+    of the function.
+
+    * session -- The session
+    * function -- The function to call
+    * args -- The arguments
+    * kwargs -- The keyword arguments
+
+    '''
+    return context.call({_SESSION_KEY: session}, function, *args, **kwargs)
+
+
+def getSession():
+    '''Get the session the current function is called on behalf of, or
+    None if it is not called on behalf of a session.
+
+    '''
+    return context.get(_SESSION_KEY)
+
+
+def bindSession(function):
+    '''Get a function which calls the given function on behalf of the
+    session of the current call. Plugins use this function to wrap the
+    callbacks of a Deferred which respond to Siri once the Deferred fires,
+    since the callbacks are not called on behalf of any session.
+
+    * function -- The function
+
+    '''
+    session = getSession()
+
+    def wrapper(*args, **kwargs):
+        '''Call the function on behalf of the session.
+
+        * args -- The arguments
+        * kwargs -- The keyword arguments
+
+        '''
+        return callInSession(session, function, *args, **kwargs)
+
+    wrapper.__name__ = function.__name__
+    wrapper.__doc__ = function.__doc__
+    return wrapper
+
+
+def reactorThread(function):
+    '''The reactorThread function is a decorator which ensures that the
+    decorated function is always executed by the twisted reactor thread.
+
+    Calls made from any other thread are scheduled to run in the reactor
+    thread, in the order in which they were made, on behalf of the same
+    session, and return None.
+
+    * function -- The function
+
+    '''
+    def wrapper(*args, **kwargs):
+        '''Call the function, or schedule it to be called within the
+        reactor thread.
+
+        * args -- The arguments
+        * kwargs -- The keyword arguments
+
+        '''
+        if isReactorRunning() and not isInIOThread():
+            reactor.callFromThread(callInSession, getSession(), function,
+                                   *args, **kwargs)
+            return None
+
+        return function(*args, **kwargs)
+
+    wrapper.__name__ = function.__name__
+    wrapper.__doc__ = function.__doc__
+    return wrapper
+
+
+class PluginThreadPool:
+    '''The PluginThreadPool class manages a bounded pool of threads which is
+    used to execute blocking plugin functions.
+
+    The threads are only started once the first blocking function is called
+    while the reactor is running, and they are stopped when the reactor
+    shuts down. When the reactor is not running (e.g., while testing plugins)
+    blocking functions are called directly.
+
+    '''
+
+    # The name given to the pool of threads
+    Name = "PluginThreadPool"
+
+    def __init__(self, maxThreads):
+        '''
+        * maxThreads -- The maximum number of threads to use
+
+        '''
+        self.__maxThreads = max(1, maxThreads)
+        self.__pool = None
+
+    def call(self, function, *args, **kwargs):
+        '''Call the given function in the pool of threads.
+
+        This function returns a Deferred which fires with the result of the
+        function if the reactor is running, otherwise it returns the result
+        of calling the function directly.
+
+        * function -- The function to call
+        * args -- The arguments
+        * kwargs -- The keyword arguments
+
+        '''
+        if not isReactorRunning():
+            return function(*args, **kwargs)
+
+        return threads.deferToThreadPool(reactor, self.__getPool(), function,
+                                         *args, **kwargs)
+
+    def stop(self):
+        '''Stop all of the threads in the pool.'''
+        if self.__pool is not None:
+            self.__pool.stop()
+            self.__pool = None
+
+    def __getPool(self):
+        '''Get the pool of threads, and start it if it has not been
+        started.
+
+        '''
+        if self.__pool is None:
+            self.__pool = ThreadPool(minthreads=0,
+                                     maxthreads=self.__maxThreads,
+                                     name=self.Name)
+            self.__pool.start()
+
+            reactor.addSystemEventTrigger("during", "shutdown", self.stop)
+
+        return self.__pool
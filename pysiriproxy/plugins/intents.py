@@ -0,0 +1,334 @@
+# Copyright (C) 2012 Brett Ponsler, Pete Lamonica
+# This file is part of pysiriproxy.
+#
+# pysiriproxy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pysiriproxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pysiriproxy.  If not, see <http://www.gnu.org/licenses/>.
+'''The intents module contains the IntentIndex class which scores recognized
+speech against the template phrases of all the *@intent* speech rules at
+once.
+
+Each template phrase is converted into a vector of the words and pairs of
+adjacent words it contains, weighted by their TF-IDF (term frequency times
+inverse document frequency) so that words shared by many templates count
+for less than words which identify a single template. The recognized speech
+is converted into a vector in the same way, and the score of each template
+is the cosine similarity between the two vectors. Every word of the
+recognized speech counts towards its length, including words which are not
+in any template, except for the words spoken for the slots of a template
+which the speech ends with word for word. Those words are replaced by the
+slots they were spoken for, so that speech which leaves a slot out is less
+similar to the template.
+
+The vectors are stored in an inverted index mapping each word to the
+templates containing it, so scoring only touches the templates which share
+a word with the recognized speech. When numpy is installed, the scores of
+every template are accumulated in a single vectorized operation.
+
+'''
+import re
+from math import log, sqrt
+from bisect import bisect_left
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Regular expression matching a single word of speech
+_WORD_REGEX = re.compile(r"[a-z0-9']+")
+
+# Regular expression matching a named slot within a template phrase
+_SLOT_REGEX = re.compile(r"\{(\w+)\}")
+
+
+def getFeatures(text):
+    '''Get the list of words, and pairs of adjacent words, contained in the
+    recognized text.
+
+    * text -- The recognized text
+
+    '''
+    return _getNGrams(_WORD_REGEX.findall(text.lower()))
+
+
+def getTemplateFeatures(template):
+    '''Get the list of words, and pairs of adjacent words, contained in a
+    template phrase. Each slot counts as a single word, named after the slot
+    in braces, since the words spoken for the slot are not known.
+
+    * template -- The template phrase
+
+    '''
+    words = []
+
+    # Splitting on the slots leaves the slot names at the odd indices
+    for index, part in enumerate(_SLOT_REGEX.split(template)):
+        if index % 2 == 1:
+            words.append("{%s}" % part)
+        else:
+            words.extend(_WORD_REGEX.findall(part.lower()))
+
+    return _getNGrams(words)
+
+
+def compileTemplate(template):
+    '''Compile a template phrase into a regular expression which captures
+    the text spoken for each slot in a group named after the slot.
+
+    * template -- The template phrase
+
+    '''
+    template = ' '.join(template.split())
+
+    parts = []
+    for index, part in enumerate(_SLOT_REGEX.split(template)):
+        if index % 2 == 1:
+            parts.append("(?P<%s>.+?)" % part)
+        else:
+            parts.append(re.escape(part).replace("\\ ", r"\s+"))
+
+    return re.compile(r"\s*\b%s\W*$" % ''.join(parts), re.IGNORECASE)
+
+
+class IntentIndex:
+    '''The IntentIndex class finds the template phrase which is most similar
+    to recognized speech.
+
+    Template phrases are added along with the ordinal of the speech rule
+    function they belong to, and must be added in ascending ordinal order.
+    The index must be built, by calling :func:`build`, after all of the
+    template phrases have been added.
+
+    '''
+
+    def __init__(self):
+        self.__templates = []
+        self.__ordinals = []
+        self.__slotRegexes = []
+        self.__slotRows = []
+        self.__vectors = []
+        self.__idf = {}
+        self.__unknownIdf = 1.0
+        self.__postings = {}
+
+    def __len__(self):
+        '''Get the number of template phrases in this index.'''
+        return len(self.__templates)
+
+    def add(self, ordinal, template):
+        '''Add a template phrase to the index.
+
+        * ordinal -- The ordinal of the speech rule function
+        * template -- The template phrase
+
+        '''
+        self.__templates.append(getTemplateFeatures(template))
+        self.__ordinals.append(ordinal)
+        self.__slotRegexes.append(compileTemplate(template) \
+                                      if _SLOT_REGEX.search(template) \
+                                      else None)
+
+    def build(self):
+        '''Compute the weighted vector of every template phrase, and store
+        the vectors in the inverted index.
+
+        '''
+        numTemplates = len(self.__templates)
+
+        # Count the number of templates which contain each feature
+        frequencies = {}
+        for features in self.__templates:
+            for feature in set(features):
+                frequencies[feature] = frequencies.get(feature, 0) + 1
+
+        self.__idf = dict((feature, log((1.0 + numTemplates) / \
+                                            (1.0 + frequency)) + 1.0) \
+                              for feature, frequency in frequencies.items())
+
+        # Words which are not in any template are weighted as if they were
+        # in none of them
+        self.__unknownIdf = log(1.0 + numTemplates) + 1.0
+
+        self.__vectors = [self.__getVector(features) \
+                              for features in self.__templates]
+        self.__slotRows = [row for row, regex in \
+                               enumerate(self.__slotRegexes) \
+                               if regex is not None]
+
+        postings = {}
+        for row, vector in enumerate(self.__vectors):
+            for feature, weight in vector.items():
+                rows, weights = postings.setdefault(feature, ([], []))
+                rows.append(row)
+                weights.append(weight)
+
+        if numpy is not None:
+            for feature, (rows, weights) in postings.items():
+                postings[feature] = (numpy.array(rows, dtype=numpy.intp),
+                                     numpy.array(weights))
+
+        self.__postings = postings
+
+    def match(self, text, start=0):
+        '''Get an (ordinal, score) tuple for the template phrase (with an
+        ordinal of at least start) which is most similar to the recognized
+        text, or None if no template phrase shares a word with the text.
+        Ties are won by the lowest ordinal.
+
+        * text -- The recognized text
+        * start -- The lowest ordinal to consider
+
+        '''
+        # Words which are not in any template make the recognized speech
+        # less similar to every template, but only the words it shares with
+        # a template need to be scored
+        query = self.__getVector(getFeatures(text))
+        query = dict((feature, weight) for feature, weight in query.items() \
+                         if feature in self.__postings)
+        if len(query) == 0:
+            return None
+
+        firstRow = bisect_left(self.__ordinals, start)
+        if firstRow == len(self.__ordinals):
+            return None
+
+        if numpy is not None:
+            row, score = self.__scoreArrays(query, text, firstRow)
+        else:
+            row, score = self.__scoreLists(query, text, firstRow)
+
+        return (self.__ordinals[row], score) if score > 0.0 else None
+
+    ##### Private functions #####
+
+    def __getVector(self, features):
+        '''Get the normalized TF-IDF vector, as a dictionary mapping features
+        to weights, for the given features.
+
+        * features -- The list of features
+
+        '''
+        vector = {}
+        for feature in features:
+            vector[feature] = vector.get(feature, 0.0) + \
+                self.__idf.get(feature, self.__unknownIdf)
+
+        norm = sqrt(sum(weight * weight for weight in vector.values()))
+        if norm == 0.0:
+            return {}
+
+        return dict((feature, weight / norm) \
+                        for feature, weight in vector.items())
+
+    def __getSlotScore(self, row, text):
+        '''Get the score of a template phrase with slots, replacing the
+        words spoken for its slots with the slots, or None if the recognized
+        text does not end with the template phrase word for word.
+
+        * row -- The row of the template phrase
+        * text -- The recognized text
+
+        '''
+        regex = self.__slotRegexes[row]
+        matched = regex.search(text)
+        if matched is None:
+            return None
+
+        names = dict((group, name) for name, group in \
+                         regex.groupindex.items())
+
+        words = []
+        end = 0
+        for group in range(1, regex.groups + 1):
+            words.extend(_WORD_REGEX.findall(
+                    text[end:matched.start(group)].lower()))
+            words.append("{%s}" % names[group])
+            end = matched.end(group)
+        words.extend(_WORD_REGEX.findall(text[end:].lower()))
+
+        vector = self.__vectors[row]
+        return sum(weight * vector.get(feature, 0.0) for feature, weight \
+                       in self.__getVector(_getNGrams(words)).items())
+
+    def __scoreArrays(self, query, text, firstRow):
+        '''Score every template phrase using numpy, and get a (row, score)
+        tuple for the best template phrase at or after the given row.
+
+        * query -- The normalized query vector
+        * text -- The recognized text
+        * firstRow -- The first row to consider
+
+        '''
+        rows = []
+        weights = []
+        for feature, weight in query.items():
+            featureRows, featureWeights = self.__postings[feature]
+            rows.append(featureRows)
+            weights.append(featureWeights * weight)
+
+        scores = numpy.bincount(numpy.concatenate(rows),
+                                weights=numpy.concatenate(weights),
+                                minlength=len(self.__ordinals))
+
+        for row in self.__slotRows:
+            if row >= firstRow and scores[row] > 0.0:
+                score = self.__getSlotScore(row, text)
+                if score is not None:
+                    scores[row] = score
+
+        scores = scores[firstRow:]
+
+        # The first maximum is returned, which has the lowest ordinal
+        best = int(scores.argmax())
+        return firstRow + best, float(scores[best])
+
+    def __scoreLists(self, query, text, firstRow):
+        '''Score the template phrases which share a feature with the query,
+        and get a (row, score) tuple for the best template phrase at or after
+        the given row.
+
+        * query -- The normalized query vector
+        * text -- The recognized text
+        * firstRow -- The first row to consider
+
+        '''
+        scores = {}
+        for feature, weight in query.items():
+            rows, weights = self.__postings[feature]
+            for row, rowWeight in zip(rows, weights):
+                scores[row] = scores.get(row, 0.0) + rowWeight * weight
+
+        for row in scores.keys():
+            if row >= firstRow and self.__slotRegexes[row] is not None:
+                score = self.__getSlotScore(row, text)
+                if score is not None:
+                    scores[row] = score
+
+        bestRow, bestScore = firstRow, 0.0
+        for row, score in scores.items():
+            if row >= firstRow and \
+                    (score > bestScore or \
+                         (score == bestScore and row < bestRow)):
+                bestRow, bestScore = row, score
+
+        return bestRow, bestScore
+
+
+def _getNGrams(words):
+    '''Get the list of words followed by the pairs of adjacent words.
+
+    * words -- The list of words
+
+    '''
+    return words + ["%s %s" % pair for pair in zip(words, words[1:])]
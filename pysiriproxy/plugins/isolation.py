@@ -0,0 +1,724 @@
+# Copyright (C) 2012 Brett Ponsler, Pete Lamonica
+# This file is part of pysiriproxy.
+#
+# pysiriproxy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pysiriproxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pysiriproxy.  If not, see <http://www.gnu.org/licenses/>.
+'''The isolation module contains classes which allow plugins to be hosted in
+a pool of worker processes, rather than within the pysiriproxy process.
+
+A plugin that is stuck (e.g., in an infinite loop, or within a C extension)
+freezes the entire pysiriproxy process, even when it is executed in a thread.
+Hosting the plugin in a separate process, and giving every call to the
+plugin a deadline, ensures that a slow or crashing plugin only affects its
+own requests.
+
+Objects and recognized speech are sent to the worker processes, and the
+commands issued by the plugin (e.g., say, makeView, completeRequest) are sent
+back to pysiriproxy where they are executed in the order they were issued.
+
+'''
+import sys
+import cPickle
+from os import environ
+from struct import pack, unpack
+
+from twisted.internet import protocol, reactor
+from twisted.internet.defer import Deferred, fail
+
+from pysiriproxy.plugins.execution import _BLOCKING_PROP, bindSession
+from pysiriproxy.plugins.manifest import _COMMANDS_PROP, commandApplies, \
+    createStub, getCommandFilter
+from pysiriproxy.plugins.statistics import PluginStatistics
+
+from pyamp.logging import Colors
+
+
+class Messages:
+    '''The Messages class contains the types of messages that are sent to the
+    plugin worker processes, and the functions used to encode and decode
+    the messages.
+
+    '''
+
+    Filter = "filter"
+    '''Process a filter for an object.'''
+
+    SpeechRule = "speech"
+    '''Process a speech rule for the recognized speech.'''
+
+    Send = "send"
+    '''Send recognized speech to a plugin waiting for a response.'''
+
+    Close = "close"
+    '''Close a conversation with a plugin waiting for a response.'''
+
+    Commands = ["showDirections", "showDrivingDirections",
+                "showWalkingDirections", "showPublicTransitDirections",
+                "makeView", "ask", "resetContext", "say", "completeRequest"]
+    '''The list of PluginManager functions that plugins executed by worker
+    processes are allowed to call.
+
+    '''
+
+    RequestFd = 3
+    '''The file descriptor the worker processes read requests from.'''
+
+    ReplyFd = 4
+    '''The file descriptor the worker processes write replies to.'''
+
+    # The format of the header containing the length of a message
+    __HeaderFormat = "!I"
+    __HeaderLength = 4
+
+    @classmethod
+    def encode(cls, message):
+        '''Encode a message so that it can be written to a stream.
+
+        * message -- The message
+
+        '''
+        data = cPickle.dumps(message, cPickle.HIGHEST_PROTOCOL)
+        return pack(cls.__HeaderFormat, len(data)) + data
+
+    @classmethod
+    def decode(cls, data):
+        '''Decode the first message from the given data. This function
+        returns a tuple containing the message (or None if the data does not
+        contain an entire message), and the remaining data.
+
+        * data -- The data read from a stream
+
+        '''
+        if len(data) < cls.__HeaderLength:
+            return None, data
+
+        length = unpack(cls.__HeaderFormat, data[:cls.__HeaderLength])[0]
+        end = cls.__HeaderLength + length
+        if len(data) < end:
+            return None, data
+
+        return cPickle.loads(data[cls.__HeaderLength:end]), data[end:]
+
+    @classmethod
+    def read(cls, stream):
+        '''Read a single message from the given stream, or return None if
+        the end of the stream has been reached.
+
+        * stream -- The stream
+
+        '''
+        header = stream.read(cls.__HeaderLength)
+        if len(header) < cls.__HeaderLength:
+            return None
+
+        length = unpack(cls.__HeaderFormat, header)[0]
+        return cPickle.loads(stream.read(length))
+
+
+class _WorkerProtocol(protocol.ProcessProtocol):
+    '''The _WorkerProtocol class manages the communication with a single
+    plugin worker process.
+
+    '''
+
+    def __init__(self, pool, moduleName):
+        '''
+        * pool -- The PluginProcessPool
+        * moduleName -- The name of the module containing the plugin hosted
+                        by the worker
+
+        '''
+        self.__pool = pool
+        self.__buffer = ""
+        self.moduleName = moduleName
+
+        # The number of calls waiting on this worker
+        self.pending = 0
+        self.__closed = False
+
+    def send(self, message):
+        '''Send a message to the worker process.
+
+        * message -- The message
+
+        '''
+        self.transport.writeToChild(Messages.RequestFd,
+                                    Messages.encode(message))
+
+    def kill(self):
+        '''Kill the worker process.'''
+        try:
+            self.transport.signalProcess("KILL")
+        except:
+            # The process has already exited
+            pass
+
+    def close(self):
+        '''Close the request stream, which causes the worker to exit.'''
+        if not self.__closed:
+            self.__closed = True
+            self.transport.closeChildFD(Messages.RequestFd)
+
+    def childDataReceived(self, childFD, data):
+        '''Called when data is received from the worker process.
+
+        * childFD -- The file descriptor the data was received from
+        * data -- The data
+
+        '''
+        if childFD != Messages.ReplyFd:
+            return
+
+        self.__buffer += data
+
+        message, self.__buffer = Messages.decode(self.__buffer)
+        while message is not None:
+            self.__pool.replyReceived(self, message)
+            message, self.__buffer = Messages.decode(self.__buffer)
+
+    def processEnded(self, reason):
+        '''Called when the worker process has ended.
+
+        * reason -- The reason the process ended
+
+        '''
+        self.__pool.workerEnded(self, reason)
+
+
+class PluginProcessPool:
+    '''The PluginProcessPool class manages a pool of worker processes that
+    host plugins, and dispatches calls to the plugins to the workers. Each
+    isolated plugin is hosted by workers of its own, which are started when
+    the plugin is first called.
+
+    Every call is given a deadline. A worker which does not reply to a call
+    before its deadline is killed (failing all of the calls it has not
+    replied to, and closing its conversations) and replaced with a new
+    worker, which only affects the plugin that timed out.
+
+    '''
+
+    # The module that is executed by the worker processes
+    WorkerModule = "pysiriproxy.plugins.worker"
+
+    def __init__(self, pluginsDirectory, processes, timeout, logger):
+        '''
+        * pluginsDirectory -- The directory containing the plugins
+        * processes -- The number of worker processes for each plugin
+        * timeout -- The number of seconds each call is allowed to take
+        * logger -- The logger
+
+        '''
+        self.__pluginsDirectory = pluginsDirectory
+        self.__processes = max(1, processes)
+        self.__timeout = timeout
+        self.log = logger.get("PluginProcessPool",
+                              color=Colors.Foreground.Orange)
+
+        self.__workers = {}
+        self.__retired = []
+        self.__started = False
+        self.__stopping = False
+
+        self.__callId = 0
+        self.__pending = {}
+        self.__conversations = {}
+
+        # The functions called when a worker closes one of its conversations
+        # on its own, mapped from the id of the conversation
+        self.__closedCallbacks = {}
+
+    def call(self, messageType, *args):
+        '''Send a call to one of the worker processes. This function returns
+        a Deferred which fires with a tuple containing: True if the call
+        succeeded, the result of the call, and the list of commands issued
+        by the plugin during the call.
+
+        * messageType -- The type of message
+        * args -- The arguments for the message, starting with the name of
+                  the module containing the plugin
+
+        '''
+        self.__start()
+
+        workers = self.__getWorkers(args[0])
+        worker = min(workers, key=lambda worker: worker.pending)
+        return self.__call(worker, messageType, args)
+
+    def send(self, conversationId, text):
+        '''Send recognized speech to a conversation with a plugin which is
+        waiting for a response.
+
+        * conversationId -- The id of the conversation
+        * text -- The recognized speech
+
+        '''
+        worker = self.__conversations.get(conversationId)
+        if worker is None:
+            return fail(Exception("Conversation [%s] no longer exists" % \
+                                      conversationId))
+
+        return self.__call(worker, Messages.Send, (conversationId, text))
+
+    def close(self, conversationId):
+        '''Close a conversation with a plugin which is waiting for a response.
+
+        * conversationId -- The id of the conversation
+
+        '''
+        self.__closedCallbacks.pop(conversationId, None)
+        worker = self.__conversations.pop(conversationId, None)
+        if worker is not None:
+            self.__call(worker, Messages.Close, (conversationId,))
+            self.__stopIfIdle(worker)
+
+    def startConversation(self, conversationId, closed=None):
+        '''Keep track of the worker that hosts a conversation started by the
+        call with the given id.
+
+        * conversationId -- The id of the call which started the conversation
+        * closed -- The function called with the reason ('expired' or
+                    'abandoned') if the worker closes the conversation on its
+                    own, or None
+
+        '''
+        worker = self.__pending.get(conversationId, (None,))[0]
+        if worker is not None:
+            self.__conversations[conversationId] = worker
+            if closed is not None:
+                self.__closedCallbacks[conversationId] = closed
+
+    def restart(self):
+        '''Replace all of the worker processes with new worker processes,
+        e.g., once the plugins have been reloaded.
+
+        The previous workers continue to host their conversations, and are
+        stopped once they have completed all of their calls and
+        conversations.
+
+        '''
+        if self.__started:
+            retired, self.__workers = self.__workers, {}
+
+            # New workers are started when each plugin is next called
+            for workers in retired.values():
+                for worker in workers:
+                    self.__retired.append(worker)
+                    self.__stopIfIdle(worker)
+
+    def stop(self):
+        '''Stop all of the worker processes.'''
+        self.__stopping = True
+
+        for workers in self.__workers.values():
+            for worker in workers:
+                worker.close()
+
+        for worker in self.__retired:
+            worker.close()
+
+    def replyReceived(self, worker, message):
+        '''Called when a reply is received from a worker process.
+
+        * worker -- The worker
+        * message -- The reply message
+
+        '''
+        callId, succeeded, result, commands, closed = message
+
+        # Forget the conversations the worker closed on its own
+        for conversationId, reason in closed:
+            self.__conversations.pop(conversationId, None)
+            callback = self.__closedCallbacks.pop(conversationId, None)
+            if callback is not None:
+                callback(reason)
+
+        # Replies without a call only report closed conversations
+        if callId is None:
+            self.__stopIfIdle(worker)
+            return
+
+        entry = self.__pending.get(callId)
+        if entry is None:
+            # The call has already timed out
+            return
+
+        _worker, deferred, timer = entry
+        timer.cancel()
+        worker.pending -= 1
+
+        # The entry is removed after the callback so that the worker for
+        # a conversation started by this call can still be found
+        deferred.callback((succeeded, result, commands))
+        del self.__pending[callId]
+
+        self.__stopIfIdle(worker)
+
+    def workerEnded(self, worker, reason):
+        '''Called when a worker process has ended.
+
+        * worker -- The worker
+        * reason -- The reason the process ended
+
+        '''
+        workers = self.__workers.get(worker.moduleName, [])
+        retired = worker in self.__retired
+        if retired:
+            self.__retired.remove(worker)
+        elif worker in workers:
+            workers.remove(worker)
+
+        # Fail all of the calls waiting on the worker
+        for callId, (callWorker, deferred, timer) in self.__pending.items():
+            if callWorker is worker:
+                del self.__pending[callId]
+                timer.cancel()
+                deferred.errback(Exception("Plugin worker exited: %s" % \
+                                               reason.getErrorMessage()))
+
+        # Forget all of the conversations hosted by the worker
+        for conversationId, conversationWorker in \
+                self.__conversations.items():
+            if conversationWorker is worker:
+                del self.__conversations[conversationId]
+                self.__closedCallbacks.pop(conversationId, None)
+
+        if not self.__stopping and not retired:
+            self.log.error("Plugin worker for [%s] exited: %s" % \
+                               (worker.moduleName, reason.getErrorMessage()))
+            if worker.moduleName in self.__workers:
+                self.__spawnWorker(worker.moduleName)
+
+    ##### Private functions #####
+
+    def __call(self, worker, messageType, args):
+        '''Send a call to the given worker process.
+
+        * worker -- The worker
+        * messageType -- The type of message
+        * args -- The arguments for the message
+
+        '''
+        self.__callId += 1
+        callId = self.__callId
+
+        deferred = Deferred()
+        timer = reactor.callLater(self.__timeout, self.__timedOut, callId)
+        self.__pending[callId] = (worker, deferred, timer)
+
+        worker.pending += 1
+        worker.send((callId, messageType, args))
+
+        return deferred
+
+    def __stopIfIdle(self, worker):
+        '''Stop the given worker if it has been replaced, and it is no longer
+        handling any calls or conversations.
+
+        * worker -- The worker
+
+        '''
+        if worker in self.__retired and worker.pending == 0 and \
+                worker not in self.__conversations.values():
+            worker.close()
+
+    def __timedOut(self, callId):
+        '''Called when a call did not complete before its deadline.
+
+        * callId -- The id of the call
+
+        '''
+        worker, deferred, _timer = self.__pending.pop(callId)
+        self.log.error("Call to plugin [%s] timed out after %s seconds" % \
+                           (worker.moduleName, self.__timeout))
+        deferred.errback(Exception("Plugin call timed out"))
+
+        # The worker is stuck, so replace it. The worker only hosts the
+        # plugin which timed out, so the other plugins are not affected.
+        worker.kill()
+
+    def __start(self):
+        '''Start using worker processes if they have not been used.'''
+        if not self.__started:
+            self.__started = True
+            reactor.addSystemEventTrigger("before", "shutdown", self.stop)
+
+    def __getWorkers(self, moduleName):
+        '''Get the list of workers hosting the given plugin, and start them
+        if they have not been started.
+
+        * moduleName -- The name of the module containing the plugin
+
+        '''
+        if moduleName not in self.__workers:
+            self.__workers[moduleName] = []
+            for _ in range(self.__processes):
+                self.__spawnWorker(moduleName)
+
+        return self.__workers[moduleName]
+
+    def __spawnWorker(self, moduleName):
+        '''Spawn a new worker process.
+
+        * moduleName -- The name of the module containing the plugin hosted
+                        by the worker
+
+        '''
+        worker = _WorkerProtocol(self, moduleName)
+
+        args = [sys.executable, "-m", self.WorkerModule,
+                self.__pluginsDirectory]
+        childFDs = {0: 0, 1: 1, 2: 2,
+                    Messages.RequestFd: "w", Messages.ReplyFd: "r"}
+
+        reactor.spawnProcess(worker, sys.executable, args, env=environ,
+                             childFDs=childFDs)
+        self.__workers[moduleName].append(worker)
+
+
+class RemoteResponse:
+    '''The RemoteResponse class represents a conversation with a plugin,
+    hosted by a worker process, which is waiting for a response from the
+    Siri user.
+
+    '''
+
+    def __init__(self, plugin, conversationId):
+        '''
+        * plugin -- The RemotePlugin
+        * conversationId -- The id of the conversation
+
+        '''
+        self.__plugin = plugin
+        self.conversationId = conversationId
+
+    def send(self, text):
+        '''Send the recognized speech to the plugin.
+
+        * text -- The recognized speech
+
+        '''
+        self.__plugin.sendResponse(self, text)
+
+    def close(self):
+        '''Close the conversation.'''
+        self.__plugin.closeResponse(self)
+
+
+class RemotePlugin:
+    '''The RemotePlugin class stands in for a plugin which is hosted by the
+    worker processes of a :class:`PluginProcessPool`. It provides the same
+    functions that the :class:`.PluginManager` uses to process the filters
+    and speech rules of a :class:`.BasePlugin`, except that the filters and
+    speech rules return a Deferred.
+
+    '''
+
+    def __init__(self, manager, pool, description, moduleName, logger):
+        '''
+        * manager -- The PluginManager object
+        * pool -- The PluginProcessPool hosting the plugin
+        * description -- The PluginDescription
+        * moduleName -- The name of the module containing the plugin
+        * logger -- The logger
+
+        '''
+        self.__manager = manager
+        self.__pool = pool
+        self.__moduleName = moduleName
+
+        self.name = description.name
+        self.log = logger.get(self.name, color=description.logColor)
+        self.__registry = description.registry
+
+        # Remote functions are executed by the worker processes, and never
+        # by the pool of threads
+        exclude = [_BLOCKING_PROP]
+        self.__filters = [createStub(function, exclude)
+                          for function in description.filters]
+        self.__speechRules = [createStub(function, exclude)
+                              for function in description.speechRules]
+
+    def getName(self):
+        '''Get the name of this Plugin.'''
+        return self.name
+
+    def getFilterFunctions(self):
+        '''Get the list of filter functions for this Plugin in the order
+        in which they are processed.
+
+        '''
+        return list(self.__filters)
+
+    def getCommandFilter(self):
+        '''Get the filter function which handles the custom commands of
+        this Plugin, or None if this Plugin overrides the custom command
+        filter.
+
+        '''
+        return getCommandFilter(self.__filters)
+
+    def getCustomCommands(self):
+        '''Get the list of custom command names handled by this Plugin.'''
+        function = self.getCommandFilter()
+        return [] if function is None else getattr(function, _COMMANDS_PROP)
+
+    def getSpeechRuleFunctions(self):
+        '''Get the list of speech rule functions for this Plugin in the order
+        in which they are processed.
+
+        '''
+        return list(self.__speechRules)
+
+    def filterApplies(self, function, direction, obj):
+        '''Determine if the given filter function applies to either the
+        given direction or the class of the given object.
+
+        * function -- The filter function
+        * direction -- The direction
+        * obj -- The object
+
+        '''
+        registry = self.__registry
+        return registry.applies(function, direction, obj.get('class')) and \
+            commandApplies(function, obj)
+
+    def processFilter(self, filterFunction, obj, direction):
+        '''Apply a single filter function to the object in a worker process.
+        This function returns a Deferred which fires with the response of the
+        filter, or None if the filter failed.
+
+        * filterFunction -- The filter function
+        * obj -- The object
+        * direction -- The direction the object traveled to be received
+
+        '''
+        deferred = self.__pool.call(Messages.Filter, self.__moduleName,
+                                    filterFunction.__name__, obj, direction)
+        deferred.addCallback(bindSession(self.__finishCall))
+        deferred.addErrback(self.__filterFailed, filterFunction,
+                            obj.get('class'))
+        return deferred
+
+    def processSpeechRule(self, ruleFunction, text):
+        '''Apply a single speech rule function to the recognized speech in a
+        worker process. This function returns a Deferred which fires with
+        True, or with a :class:`RemoteResponse` if the speech rule is waiting
+        for a response.
+
+        * ruleFunction -- The speech rule function
+        * text -- The recognized speech text
+
+        '''
+        deferred = self.__pool.call(Messages.SpeechRule, self.__moduleName,
+                                    ruleFunction.__name__, text)
+        deferred.addCallback(bindSession(self.__finishCall))
+        deferred.addCallback(self.__finishSpeechRule)
+        return deferred
+
+    def sendResponse(self, response, text):
+        '''Send recognized speech to a conversation with this plugin.
+
+        * response -- The RemoteResponse
+        * text -- The recognized speech
+
+        '''
+        deferred = self.__pool.send(response.conversationId, text)
+        deferred.addCallback(bindSession(self.__finishCall))
+        deferred.addCallback(self.__finishSend, response)
+        deferred.addErrback(bindSession(self.__sendFailed), response)
+
+    def closeResponse(self, response):
+        '''Close a conversation with this plugin.
+
+        * response -- The RemoteResponse
+
+        '''
+        self.__pool.close(response.conversationId)
+
+    ##### Private functions #####
+
+    def __finishCall(self, reply):
+        '''Execute the commands issued by the plugin during a call, on behalf
+        of the session the call was made for, and then get the result of the
+        call.
+
+        * reply -- The tuple containing: True if the call succeeded, the
+                   result of the call, and the list of commands
+
+        '''
+        succeeded, result, commands = reply
+
+        for name, args, kwargs in commands:
+            if name in Messages.Commands:
+                getattr(self.__manager, name)(*args, **kwargs)
+
+        if not succeeded:
+            raise Exception(result)
+
+        return result
+
+    def __finishSpeechRule(self, result):
+        '''Get the response for a speech rule once it has completed.
+
+        * result -- The id of the conversation if the speech rule is waiting
+                    for a response, otherwise None
+
+        '''
+        if result is None:
+            return True
+
+        response = RemoteResponse(self, result)
+        self.__pool.startConversation(
+            result, lambda reason: self.__manager.responseClosed(response,
+                                                                 reason))
+        return response
+
+    def __finishSend(self, finished, response):
+        '''Called when sending recognized speech to a conversation completes.
+
+        * finished -- True if the conversation has ended
+        * response -- The RemoteResponse
+
+        '''
+        if finished:
+            self.__pool.close(response.conversationId)
+            self.__manager.responseFinished(response)
+
+    def __filterFailed(self, failure, function, objectClass):
+        '''Called in the event that a filter failed.
+
+        * failure -- The failure
+        * function -- The filter function
+        * objectClass -- The class of the object
+
+        '''
+        self.log.error("Error in filter [%s]: %s" % \
+                           (function.__name__, failure.getErrorMessage()))
+        PluginStatistics().recordException(self.name, function.__name__,
+                                           objectClass)
+
+        # The failed filter ignores the object
+        return None
+
+    def __sendFailed(self, failure, response):
+        '''Called in the event that sending recognized speech to a
+        conversation failed.
+
+        * failure -- The failure
+        * response -- The RemoteResponse
+
+        '''
+        self.log.error("Error in response: %s" % failure.getErrorMessage())
+        self.__manager.responseFinished(response)
+        self.__manager.sayErrorResponse()
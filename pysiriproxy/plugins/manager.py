@@ -19,19 +19,74 @@ PluginManager is also responsible for processing the speech rules and object
 filters for all the loaded plugins.
 
 '''
-from sys import path
-from os import listdir
-from os.path import join, split, splitext
+from sys import path, modules
+from os import listdir, remove
+from os.path import getmtime, join, split, splitext
+from time import time
+from itertools import islice
+from types import GeneratorType
+from collections import OrderedDict
+
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, maybeDeferred, succeed
+from twisted.internet.task import LoopingCall
+from twisted.python.failure import Failure
 
 from pysiriproxy.objects import ResponseFactory
-from pysiriproxy.options import Options, Ids, Sections
-from pysiriproxy.plugins import BasePlugin, handleResponse
-from pysiriproxy.constants import Directions, DirectionTypes
+from pysiriproxy.options import Options, Ids, Files, Sections
+from pysiriproxy.plugins import BasePlugin, SpeechRuleIndex, \
+    SpeechRuleCache, PluginThreadPool, PluginProcessPool, RemotePlugin, \
+    RemoteResponse, PluginManifest, PluginDescription, LazyPlugin, \
+    PluginStatistics, handleResponse, isBlocking, isReactorRunning, \
+    reactorThread, bindSession, callInSession, getSession
+from pysiriproxy.constants import ClassNames, Directions, DirectionTypes, \
+    Keys
 
 from pyamp.logging import LogData
 from pyamp.util import getStackTrace
 
 
+class _Session:
+    '''The _Session class describes the session which a plugin filter or
+    speech rule is called for: the ConnectionManager of the session, and the
+    reference id of the request the session was handling when the call was
+    made.
+
+    '''
+
+    def __init__(self, connectionManager):
+        '''
+        * connectionManager -- The ConnectionManager of the session
+
+        '''
+        self.connectionManager = connectionManager
+        self.refId = connectionManager.getRefId(Directions.From_Server)
+
+
+class _Conversation:
+    '''The _Conversation class describes a conversation, started by a
+    speech rule, which is waiting for a response from the Siri user of a
+    session.
+
+    '''
+
+    def __init__(self, connectionManager, response, blocking):
+        '''
+        * connectionManager -- The ConnectionManager of the session
+        * response -- The response waiting for a response from Siri
+        * blocking -- True if the response belongs to a blocking speech rule
+
+        '''
+        self.connectionManager = connectionManager
+        self.response = response
+        self.blocking = blocking
+
+        # The Deferred used to send responses to blocking speech rules one
+        # at a time, and the call which expires the conversation
+        self.chain = succeed(None)
+        self.timer = None
+
+
 class PluginManager:
     '''The PluginManager is responsible for loading all of the available
     plugins as well as processing the object filters and speech rules for
@@ -44,6 +99,35 @@ class PluginManager:
     # The class name that all plugins must have
     PluginClassName = "Plugin"
 
+    # The default number of threads used to execute blocking plugin functions
+    DefaultPluginThreads = 4
+
+    # The default number of processes used to host each isolated plugin, and
+    # the default number of seconds each call to an isolated plugin may take
+    DefaultPluginProcesses = 2
+    DefaultPluginTimeout = 5.0
+
+    # The default number of seconds between checks for changed plugins
+    DefaultPluginReloadInterval = 2.0
+
+    # By default plugins are only imported once they are used
+    DefaultLazyPlugins = True
+
+    # The default number of recognized phrases whose speech rule is cached
+    DefaultSpeechCacheSize = 256
+
+    # The default minimum score for an intent speech rule to apply
+    DefaultIntentThreshold = 0.7
+
+    # The default number of seconds a conversation may wait for a response,
+    # and the default number of conversations that may wait at once
+    DefaultConversationTimeout = 60.0
+    DefaultMaxConversations = 16
+
+    # The default number of alternative interpretations of recognized speech
+    # tried when no speech rule applies to the recognized speech
+    DefaultSpeechAlternatives = 3
+
     def __init__(self, connectionManager, logger=None):
         '''
         * connectionManager -- An instance of the ConnectionManager
@@ -67,16 +151,92 @@ class PluginManager:
             self.log = logger.get("PluginManager")
             self._logger = logger
 
+            # Keep the plugins in the order they were loaded so that filters
+            # and speech rules are always processed in the same order
+            self._plugins = []
             self._pluginMap = {}
+            self._pluginModules = {}
+            self._pluginMtimes = {}
+
+            # The list of (plugin, filters) tuples for the plugins that have
+            # filters, and the dictionary of custom command names mapped to
+            # the (plugin, filter) tuple which handles the command
+            self._filterChain = []
+            self._commands = {}
+
+            # Cache which speech rule applies to recently recognized speech
+            cacheSize = Options.get(Sections.General, Ids.SpeechCacheSize,
+                                    self.DefaultSpeechCacheSize)
+            self._speechCache = SpeechRuleCache(cacheSize) \
+                if cacheSize > 0 else None
+            self._intentThreshold = Options.get(Sections.General,
+                                                Ids.IntentThreshold,
+                                                self.DefaultIntentThreshold)
+            self._speechIndex = SpeechRuleIndex(
+                cache=self._speechCache,
+                intentThreshold=self._intentThreshold)
+            self._speechAlternatives = Options.get(
+                Sections.General, Ids.SpeechAlternatives,
+                self.DefaultSpeechAlternatives)
+
+            # Create the pool of threads used to execute blocking plugin
+            # filters and speech rules outside of the reactor
+            pluginThreads = Options.get(Sections.General, Ids.PluginThreads,
+                                        self.DefaultPluginThreads)
+            self._threadPool = PluginThreadPool(pluginThreads)
+
+            # Record the latency of every filter and speech rule, and log a
+            # summary of the statistics when pysiriproxy shuts down
+            self._statistics = PluginStatistics()
+            reactor.addSystemEventTrigger("before", "shutdown",
+                                          self.logStatistics)
+
+            # The list of (plugin name, function name) tuples for the
+            # filters and speech rules which matched the last object or
+            # recognized speech that was processed
+            self._matches = []
+
+            # The pool of processes used to host isolated plugins is only
+            # created if any plugins are isolated
+            self._processPool = None
+
+            # The manifest caches the descriptions of the plugins so that
+            # plugins do not need to be imported until they are used
+            self._manifest = PluginManifest(Files.PluginManifest,
+                                            self.PluginsDirectory, logger)
 
             self._options = Options()
             self.loadPlugins(self.PluginsDirectory)
 
-            # The Response object waiting for a response from Siri
-            self._response = None
+            # Reload plugins when they change so that plugins can be updated
+            # without restarting pysiriproxy
+            self._watcher = None
+            self.__watchPlugins()
+
+            # The conversations waiting for a response from Siri, mapped
+            # from the ConnectionManager of their session, in the order in
+            # which they last received a response
+            self._conversations = OrderedDict()
+
+            # Conversations which wait too long for a response are closed
+            # so they do not capture speech meant for other speech rules, and
+            # the oldest conversation is closed when too many are waiting
+            self._conversationTimeout = Options.get(
+                Sections.General, Ids.ConversationTimeout,
+                self.DefaultConversationTimeout)
+            self._maxConversations = Options.get(
+                Sections.General, Ids.MaxConversations,
+                self.DefaultMaxConversations)
+            self._conversationCounts = {
+                "started": 0,
+                "finished": 0,
+                "expired": 0,
+                "abandoned": 0,
+                }
 
     ##### Interacting with Siri #####
 
+    @reactorThread
     def showDirections(self, directionsType, source, destination,
                        utterance=None):
         '''Show the given type of directions between the two locations to the
@@ -88,16 +248,15 @@ class PluginManager:
         * utterance -- The utterance to speak
 
         '''
-        server = Directions.From_Server
-        connection = self._connectionManager.getConnection(server)
+        connection, refId = self.__getConnection()
 
         if connection is not None:
             self.log.debug("Making directions [%s]" % directionsType, level=3)
-            refId = connection.getRefId()
 
             directions = ResponseFactory.directions(refId, directionsType,
                                                     source, destination,
-                                                    utterance=utterance)
+                                                    utterance=utterance,
+                                                    asObject=True)
             connection.injectObjectToOutputStream(directions)
 
     def showDrivingDirections(self, source, destination, utterance=None):
@@ -134,21 +293,21 @@ class PluginManager:
         self.showDirections(DirectionTypes.PublicTransit, source, destination,
                             utterance=utterance)
 
+    @reactorThread
     def makeView(self, views):
         '''Create a view and send it to the iPhone.
 
         * views -- The list of views to create
 
         '''
-        server = Directions.From_Server
-        connection = self._connectionManager.getConnection(server)
+        connection, refId = self.__getConnection()
         if connection is not None:
             self.log.debug("Making view", level=3)
-            refId = connection.getRefId()
 
-            view = ResponseFactory.view(refId, views)
+            view = ResponseFactory.view(refId, views, asObject=True)
             connection.injectObjectToOutputStream(view)
 
+    @reactorThread
     def ask(self, question, spoken=None):
         '''Command Siri to ask the user a question.
 
@@ -162,34 +321,38 @@ class PluginManager:
         # but be sure not to reset the context
         self.completeRequest(resetContext=False)
 
+    @reactorThread
     def completeRequest(self, refId=None, resetContext=True):
         '''Complete a request to Siri.
 
         * refId -- The reference ID
 
         '''
-        server = Directions.From_Server
-        connection = self._connectionManager.getConnection(server)
+        connection, sessionRefId = self.__getConnection()
         if connection is not None:
             self.log.debug("Sending Request Completed", level=3)
 
-            refId = connection.getRefId() if refId is None else refId
-            completed = ResponseFactory.requestCompleted(refId)
+            refId = sessionRefId if refId is None else refId
+            completed = ResponseFactory.requestCompleted(refId,
+                                                         asObject=True)
             connection.injectObjectToOutputStream(completed)
 
             # Reset the connection context
             if resetContext:
-                self._connectionManager.resetConnections()
+                self.__getSession().connectionManager.resetConnections()
 
+    @reactorThread
     def resetContext(self):
         '''Reset the context.'''
-        self._connectionManager.resetConnections()
+        connectionManager = self.__getSession().connectionManager
+        connectionManager.resetConnections()
 
-        # Clear the current plugin that is waiting for a response
-        if self._response is not None:
-            self._response.close()
-            self._response = None
+        # Clear the plugin of this session that is waiting for a response
+        conversation = self._conversations.get(connectionManager)
+        if conversation is not None:
+            self.__closeConversation(conversation)
 
+    @reactorThread
     def say(self, text, spoken=None, prompt=False, refId=None):
         '''Command Siri to speak a piece of text.
 
@@ -198,69 +361,182 @@ class PluginManager:
         * prompt -- True to have Siri prompt for a response
 
         '''
-        server = Directions.From_Server
-        connection = self._connectionManager.getConnection(server)
+        connection, sessionRefId = self.__getConnection()
 
         if connection is not None:
             self.log.debug("Saying:", level=3, text=text, spoken=spoken,
                            prompt=prompt)
 
-            refId = connection.getRefId() if refId is None else refId
+            refId = sessionRefId if refId is None else refId
 
             # Create the utterance
             utterance = ResponseFactory.utterance(refId, text,
-                                                  spoken, prompt)
+                                                  spoken, prompt,
+                                                  asObject=True)
             connection.injectObjectToOutputStream(utterance)
 
+    def sayErrorResponse(self):
+        '''Have Siri respond with the error response.'''
+        self.say(self._options.get(Sections.Responses, Ids.ErrorResponse))
+        self.completeRequest()
+
     ##### Plugin processing functions #####
 
-    def processFilters(self, obj, direction):
+    def processFilters(self, obj, direction, connectionManager=None):
         '''Process all the plugin filters for this object and data direction.
 
         * obj -- The object
         * direction -- The data direction
+        * connectionManager -- The ConnectionManager of the session the
+                               object belongs to, or None to use the
+                               ConnectionManager of this PluginManager
 
         '''
         response = None
+        self._matches = []
         try:
-            response = self.__processFilters(obj, direction)
+            # Responses created by the filters are sent to the session which
+            # the object belongs to, even once the filters have completed
+            session = self.__createSession(connectionManager)
+            response = callInSession(session, self.__processFilters, obj,
+                                     direction)
         except:
             self.log.error("Failed processing filters")
             self.log.error(getStackTrace())
 
-        # Determine if the response should be used
-        if response is not None:
-            # If the response is False, then the object should be dropped
-            # If the object has the same class as the original object, then
-            # it should be returning
-            if response == False:
-                obj = None
-            elif response.get('class') == obj.get('class'):
-                obj = response
+        # Filters that have not completed yet return a Deferred which will
+        # fire with the processed object once all the filters complete
+        if isinstance(response, Deferred):
+            response.addErrback(self.__filtersFailed)
+            response.addCallback(self.__useFilterResponse, obj)
+            return response
 
-        return obj
+        return self.__useFilterResponse(response, obj)
 
-    def processSpeechRules(self, text):
+    def processSpeechRules(self, text, alternatives=None,
+                           connectionManager=None):
         '''Process all the plugin speech rules for this recognized text.
 
         * text -- The recognized text
+        * alternatives -- The list (or iterator) of alternative
+                          interpretations of the recognized text, best
+                          first, which are tried in the event that no speech
+                          rule applies to the text
+        * connectionManager -- The ConnectionManager of the session the
+                               text was recognized for, or None to use the
+                               ConnectionManager of this PluginManager
 
         '''
+        self._matches = []
+        session = self.__createSession(connectionManager)
         try:
             # Speech rules return True to indicate that the response from
             # Apple's server should be overriden. The speech rules return
             # False to indicate that the response from Apple's server should
             # be used.
-            return self.__processSpeechRules(text)
+            return callInSession(session, self.__processSpeechRules, text,
+                                 alternatives)
         except:
             self.log.error("Failed processing speech rules")
             self.log.error(getStackTrace())
 
             # Have Siri respond with the the error response
-            self.say(self._options.get(Sections.Responses, Ids.ErrorResponse))
-            self.completeRequest()
+            callInSession(session, self.sayErrorResponse)
             return True
 
+    def getMatches(self):
+        '''Get the list of (plugin name, function name) tuples for the
+        filters and speech rules which matched the last object or recognized
+        speech that was processed, in the order they matched. Filters which
+        have not completed yet are added once they complete.
+
+        '''
+        return list(self._matches)
+
+    def getStatistics(self, pluginName=None):
+        '''Get the statistics for all of the plugin filters and speech rules.
+        See :func:`.PluginStatistics.get`.
+
+        * pluginName -- Only get the statistics for this plugin
+
+        '''
+        return self._statistics.get(pluginName)
+
+    def logStatistics(self):
+        '''Log a summary of the statistics for all of the plugin filters and
+        speech rules.
+
+        '''
+        self.log.info("Plugin statistics:")
+        for line in self._statistics.report():
+            self.log.info("    %s" % line)
+
+        self.log.info("Conversations: started=%(started)d " \
+                          "finished=%(finished)d expired=%(expired)d " \
+                          "abandoned=%(abandoned)d" % self._conversationCounts)
+
+        if self._speechCache is not None:
+            self.log.info("Speech rule cache: hits=%d misses=%d " \
+                              "hitRate=%.1f%%" % \
+                              (self._speechCache.hits,
+                               self._speechCache.misses,
+                               self._speechCache.hitRate() * 100))
+
+    def getSpeechCacheStatistics(self):
+        '''Get a dictionary containing the number of entries, hits, misses,
+        and the hit rate of the cache of speech rules that apply to recently
+        recognized speech, or None if the cache is disabled.
+
+        '''
+        cache = self._speechCache
+        if cache is None:
+            return None
+
+        return {
+            "size": len(cache),
+            "maxSize": cache.maxSize,
+            "hits": cache.hits,
+            "misses": cache.misses,
+            "hitRate": cache.hitRate(),
+            }
+
+    def getConversationStatistics(self):
+        '''Get a dictionary containing the number of conversations which
+        were started, finished, expired because they waited too long for a
+        response, and abandoned because another conversation replaced them
+        (or too many conversations were waiting), as well as the number of
+        conversations that are waiting for a response.
+
+        '''
+        statistics = dict(self._conversationCounts)
+        statistics["pending"] = len(self._conversations)
+        return statistics
+
+    def responseFinished(self, response):
+        '''Called when a response which was waiting for a response from Siri
+        has finished.
+
+        * response -- The response
+
+        '''
+        conversation = self.__findConversation(response)
+        if conversation is not None:
+            self.__endConversation(conversation)
+
+    def responseClosed(self, response, reason):
+        '''Called when a response which was waiting for a response from Siri
+        has been closed by the worker process hosting it.
+
+        * response -- The response
+        * reason -- The reason the response was closed, either 'expired' or
+                    'abandoned'
+
+        '''
+        conversation = self.__findConversation(response)
+        if conversation is not None:
+            self._conversationCounts[reason] += 1
+            self.__endConversation(conversation, finished=False)
+
     def loadPlugins(self, directory):
         '''Load all of the plugins from the plugins directory.
 
@@ -269,41 +545,89 @@ class PluginManager:
         '''
         self.__addPluginsToPath(directory)
 
-        # Traverse through all of the plugins
-        for filename in listdir(directory):
-            if not filename.startswith("__") and filename.endswith(".py"):
-                # Get the module name from the filename by removing the
-                # file extension
-                pluginName = splitext(filename)[0]
+        mtimes = self.__getPluginModules(directory)
+        plugins, pluginModules = self.__createPlugins(mtimes, {})
+        self.__swapPlugins(mtimes, plugins, pluginModules)
 
-                try:
-                    self.log.debug("Loading plugin [%s]" % pluginName,
-                                   level=10)
-
-                    # Get the plugin class, and create the plugin object
-                    pluginClass = self.__importPlugin(pluginName)
-                    plugin = pluginClass(self, self._logger)
-
-                    # Ensure that all plugins subclass the base plugin
-                    if isinstance(plugin, BasePlugin):
-                        # Force plugins to have unique names
-                        if plugin.name not in self._pluginMap:
-                            self._pluginMap[plugin.name] = plugin
-                        else:
-                            self.log.error("Plugin in file [%s] has name " \
-                                               "[%s] which already exists!" % \
-                                               (pluginName, plugin.name))
-                    else:
-                        self.log.error("Plugin [%s] must be a subclass of " \
-                                            "the BasePlugin class!" % \
-                                            plugin.name)
-                except:
-                    self.log.error("Failed to load plugin [%s]" % pluginName)
-                    self.log.error(getStackTrace())
-                    continue
+    def reloadPlugins(self):
+        '''Reload all of the plugin modules which have been added, changed,
+        or removed since the plugins were loaded. This function returns True
+        if any plugins were reloaded.
+
+        The filters and speech rules of the reloaded plugins replace those of
+        the previously loaded plugins all at once. Any plugin that is waiting
+        for a response from Siri continues to use its previous version until
+        its response has finished.
+
+        '''
+        mtimes = self.__getPluginModules(self.PluginsDirectory)
+        if mtimes == self._pluginMtimes:
+            return False
+
+        # Only create new plugin objects for modules that have changed
+        unchanged = {}
+        for moduleName, plugin in self._pluginModules.iteritems():
+            if mtimes.get(moduleName) == self._pluginMtimes.get(moduleName):
+                unchanged[moduleName] = plugin
+
+        changed = set(mtimes.keys() + self._pluginMtimes.keys())
+        changed.difference_update(unchanged.keys())
+        self.log.info("Reloading plugins: %s" % ', '.join(sorted(changed)))
+
+        plugins, pluginModules = self.__createPlugins(mtimes, unchanged)
+        self.__swapPlugins(mtimes, plugins, pluginModules)
+
+        # Isolated plugins are hosted by new worker processes
+        if self._processPool is not None:
+            self._processPool.restart()
+
+        return True
 
     ##### Private functions #####
 
+    def __createSession(self, connectionManager):
+        '''Create the session for a call to the plugin filters or speech
+        rules.
+
+        * connectionManager -- The ConnectionManager of the session, or None
+                               to use the ConnectionManager of this
+                               PluginManager
+
+        '''
+        if connectionManager is None:
+            connectionManager = self._connectionManager
+
+        return _Session(connectionManager)
+
+    def __getSession(self):
+        '''Get the session the current plugin call is made on behalf of, or
+        the session of the ConnectionManager of this PluginManager if no
+        plugin call is being made.
+
+        '''
+        session = getSession()
+        if session is None:
+            session = _Session(self._connectionManager)
+
+        return session
+
+    def __getConnection(self):
+        '''Get a tuple containing the connection which forwards objects to
+        the iPhone of the current session (or None if it is not connected),
+        and the reference id of the request the session was handling when
+        the plugin call was made.
+
+        '''
+        session = self.__getSession()
+        connection = session.connectionManager.getConnection(
+            Directions.From_Server)
+
+        refId = session.refId
+        if refId is None and connection is not None:
+            refId = connection.getRefId()
+
+        return connection, refId
+
     def __processFilters(self, obj, direction):
         '''Process all the plugin filters for this object and data direction.
 
@@ -311,9 +635,50 @@ class PluginManager:
         * direction -- The data direction
 
         '''
-        responses = []
-        for plugin in self._pluginMap.values():
-            response = plugin.processFilters(obj, direction)
+        # Filters which have not completed continue with the plugins that
+        # were loaded when processing started, even if plugins are reloaded
+        return self.__runFilters(self._filterChain, obj, direction, 0, 0, [])
+
+    def __runFilters(self, chain, obj, direction, pluginIndex, filterIndex,
+                     responses):
+        '''Process the plugin filters for this object and data direction
+        starting with the given filter of the given plugin.
+
+        This function returns the response of the filters, or a Deferred
+        which fires with the response of the filters in the event that one
+        of the filters has not completed.
+
+        * chain -- The list of (plugin, filters) tuples
+        * obj -- The object
+        * direction -- The data direction
+        * pluginIndex -- The index of the first plugin to process
+        * filterIndex -- The index of the first filter of the first plugin
+        * responses -- The list of responses from previous plugins
+
+        '''
+        while pluginIndex < len(chain):
+            plugin, filters = chain[pluginIndex]
+
+            # Each plugin responds with its first filter that does not
+            # ignore the object
+            response = None
+            while response is None and filterIndex < len(filters):
+                function = filters[filterIndex]
+                filterIndex += 1
+
+                if plugin.filterApplies(function, direction, obj) and \
+                        self.__commandApplies(plugin, function, obj):
+                    response = self.__applyFilter(plugin, function, obj,
+                                                  direction)
+
+                    # Continue processing once the filter completes
+                    if isinstance(response, Deferred):
+                        response.addErrback(self.__filterFailed, plugin,
+                                            function, obj.get('class'))
+                        response.addCallback(
+                            bindSession(self.__resumeFilters), chain, obj,
+                            direction, pluginIndex, filterIndex, responses)
+                        return response
 
             # Plugins return False to drop the packet, None to ignore
             # the packet, or an object to respond to the packet
@@ -322,53 +687,789 @@ class PluginManager:
             elif response is not None:
                 responses.append(response)
 
+            pluginIndex += 1
+            filterIndex = 0
+
         # Now, we need to rank the responses by their corresponding scores
         # to determine the best response to push forward
         # @todo: for now return the first response....later rank by score
         retResponses = (responses + [None])[0]
         return retResponses
 
-    def __processSpeechRules(self, text):
+    def __resumeFilters(self, response, chain, obj, direction,
+                        pluginIndex, filterIndex, responses):
+        '''Continue processing the plugin filters once a filter that did not
+        complete immediately has completed.
+
+        * response -- The response from the filter
+        * chain -- The list of (plugin, filters) tuples
+        * obj -- The object
+        * direction -- The data direction
+        * pluginIndex -- The index of the plugin that owns the filter
+        * filterIndex -- The index of the filter following the filter
+        * responses -- The list of responses from previous plugins
+
+        '''
+        # The plugin ignored the object, so continue with its next filter
+        if response is None:
+            return self.__runFilters(chain, obj, direction, pluginIndex,
+                                     filterIndex, responses)
+        elif response == False:
+            return False
+
+        responses.append(response)
+        return self.__runFilters(chain, obj, direction, pluginIndex + 1, 0,
+                                 responses)
+
+    def __commandApplies(self, plugin, function, obj):
+        '''Determine if a filter which applies to an object is either not a
+        custom command filter, or is the custom command filter of the plugin
+        which handles the command contained in the StartRequest object.
+
+        * plugin -- The plugin
+        * function -- The filter function
+        * obj -- The object
+
+        '''
+        if obj.get('class') != ClassNames.StartRequest:
+            return True
+
+        # A command claimed by more than one plugin is only handled by the
+        # first of them
+        properties = obj.get(Keys.Properties) or {}
+        command = self._commands.get(properties.get(Keys.Utterance))
+        if command is not None and command[1] is function:
+            return True
+
+        return function is not plugin.getCommandFilter()
+
+    def __applyFilter(self, plugin, function, obj, direction):
+        '''Apply the filter function of the plugin to the object, and execute
+        the filter in the pool of threads if it is blocking.
+
+        * plugin -- The plugin
+        * function -- The filter function
+        * obj -- The object
+        * direction -- The data direction
+
+        '''
+        start = time()
+        if isBlocking(function):
+            response = self._threadPool.call(plugin.processFilter, function,
+                                             obj, direction)
+        else:
+            response = plugin.processFilter(function, obj, direction)
+
+        return self.__recordCall(response, start, plugin, function,
+                                 obj.get('class'))
+
+    def __filterFailed(self, failure, plugin, function, objectClass):
+        '''Called in the event that a filter that did not complete
+        immediately failed.
+
+        * failure -- The failure
+        * plugin -- The plugin
+        * function -- The filter function
+        * objectClass -- The class of the object
+
+        '''
+        self.log.error("Error in filter [%s] of plugin [%s]" % \
+                           (function.__name__, plugin.name))
+        self.log.error(failure.getTraceback())
+        self._statistics.recordException(plugin.name, function.__name__,
+                                         objectClass)
+
+        # The failed filter ignores the object
+        return None
+
+    def __filtersFailed(self, failure):
+        '''Called in the event that processing the filters failed.
+
+        * failure -- The failure
+
+        '''
+        self.log.error("Failed processing filters")
+        self.log.error(failure.getTraceback())
+        return None
+
+    def __useFilterResponse(self, response, obj):
+        '''Get the object that should be used given the response from the
+        plugin filters.
+
+        * response -- The response from the filters
+        * obj -- The object
+
+        '''
+        # Determine if the response should be used
+        if response is not None:
+            # If the response is False, then the object should be dropped
+            # If the object has the same class as the original object, then
+            # it should be returning
+            if response == False:
+                obj = None
+            elif response.get('class') == obj.get('class'):
+                obj = response
+
+        return obj
+
+    def __processSpeechRules(self, text, alternatives=None):
         '''Process all the plugin speech rules for this recognized text.
 
         * text -- The recognized text
+        * alternatives -- The list (or iterator) of alternative
+                          interpretations of the recognized text
 
         '''
-        # If a response is waiting, pass it the text
-        if self._response is not None:
+        # If a response of this session is waiting, pass it the text
+        connectionManager = self.__getSession().connectionManager
+        conversation = self._conversations.get(connectionManager)
+        if conversation is not None:
             self.log.debug("Calling yield response function", level=3)
+            self.__continueConversation(conversation)
+
+            if conversation.blocking:
+                self.__sendBlockingResponse(conversation, text)
+                return False
 
             try:
-                self._response.send(text)
+                conversation.response.send(text)
                 return False
             except StopIteration:
                 # Get rid of the response once it is through yielding
-                self._response = None
+                self.__endConversation(conversation)
                 return True
 
-        for plugin in self._pluginMap.values():
-            # If any plugin returns True, then one of its speech rules
-            # matched the given text, otherwise it has not been matched yet
-            response = plugin.processSpeechRules(text)
+        handled = self.__applySpeechRules(text)
+        if handled is not None:
+            return handled
+
+        # Try the alternative interpretations of the recognized speech, in
+        # case the best interpretation was misheard
+        for alternative in islice(alternatives or [],
+                                  self._speechAlternatives):
+            handled = self.__applySpeechRules(alternative)
+            if handled is not None:
+                self.log.info("Speech rule applied to alternative: [%s]" % \
+                                  alternative)
+                return handled
+
+        # None of the plugins had speech rules that applied to this text
+        return False
+
+    def __applySpeechRules(self, text):
+        '''Apply the speech rules which apply to the recognized text. This
+        function returns None if none of the speech rules handled the text,
+        otherwise it returns True if the response from Apple's server should
+        be overridden, and False if it should be used.
+
+        * text -- The recognized text
 
-            # If the speech rule returned True, then we are done, otherwise
-            # it might have returned a response type
-            if response == True:
+        '''
+        # Find the first speech rule that applies to the text, and move on
+        # to the next applicable speech rule in the event that it fails
+        entry = self._speechIndex.match(text)
+        while entry is not None:
+            plugin = entry.plugin
+            response = self.__applySpeechRule(plugin, entry.function, text)
+
+            # The speech rule has not completed yet, but it owns the
+            # recognized speech regardless of how it completes
+            if isinstance(response, Deferred):
+                self.log.info("Plugin [%s] matched the recognized speech." % 
+                              plugin.name)
+                self._matches.append((plugin.name, entry.function.__name__))
+                # Conversations started by the speech rule, and the error
+                # response, are sent to the session of the speech rule
+                if isBlocking(entry.function):
+                    response.addCallback(
+                        bindSession(self.__finishBlockingSpeechRule))
+                else:
+                    response.addCallback(bindSession(self.__finishSpeechRule))
+                response.addErrback(bindSession(self.__speechRuleFailed),
+                                    plugin, entry.function)
+                return True
+            elif response == True:
                 self.log.info("Plugin [%s] matched the recognized speech." % 
                               plugin.name)
+                self._matches.append((plugin.name, entry.function.__name__))
                 return True
             else:
                 # Create the actual response type from the given response
-                self._response = handleResponse(self, response)
+                response = handleResponse(self, response)
 
                 # Stop processing speech rules if one is waiting for a response
-                if self._response is not None:
+                if response is not None:
                     self.log.info("Plugin [%s] matched the recognized " \
                                       "speech." % plugin.name)
-                    break
+                    self._matches.append((plugin.name,
+                                          entry.function.__name__))
+                    self.__startConversation(response, False)
+                    return False
 
-        # None of the plugins had speech rules that applied to this text
-        return False
+            entry = self._speechIndex.match(text, entry.ordinal + 1)
+
+        return None
+
+    def __applySpeechRule(self, plugin, function, text):
+        '''Apply the speech rule function of the plugin to the recognized
+        text, and execute the speech rule in the pool of threads if it is
+        blocking.
+
+        * plugin -- The plugin
+        * function -- The speech rule function
+        * text -- The recognized text
+
+        '''
+        start = time()
+        if isBlocking(function):
+            response = self._threadPool.call(self.__runBlockingSpeechRule,
+                                             plugin, function, text)
+        else:
+            response = plugin.processSpeechRule(function, text)
+
+        return self.__recordCall(response, start, plugin, function, None)
+
+    def __recordCall(self, response, start, plugin, function, objectClass):
+        '''Record the statistics for a call to a filter or speech rule once
+        the call has completed. This function returns the response.
+
+        * response -- The response of the filter or speech rule
+        * start -- The time the call started
+        * plugin -- The plugin
+        * function -- The filter or speech rule function
+        * objectClass -- The class of the object, or None for speech rules
+
+        '''
+        if isinstance(response, Deferred):
+            response.addBoth(self.__finishRecordCall, start, plugin.name,
+                             function.__name__, objectClass)
+        else:
+            self._statistics.recordCall(plugin.name, function.__name__,
+                                        objectClass, time() - start,
+                                        response is not None)
+
+            # Filters match when they do not ignore the object, while speech
+            # rules match once they claim the recognized speech
+            if objectClass is not None and response is not None:
+                self._matches.append((plugin.name, function.__name__))
+
+        return response
+
+    def __finishRecordCall(self, response, start, pluginName, functionName,
+                           objectClass):
+        '''Record the statistics for a call to a filter or speech rule which
+        did not complete immediately. This function returns the response.
+
+        * response -- The response, or failure, of the call
+        * start -- The time the call started
+        * pluginName -- The name of the plugin
+        * functionName -- The name of the filter or speech rule function
+        * objectClass -- The class of the object, or None for speech rules
+
+        '''
+        matched = response is not None and not isinstance(response, Failure)
+        self._statistics.recordCall(pluginName, functionName, objectClass,
+                                    time() - start, matched)
+        if objectClass is not None and matched:
+            self._matches.append((pluginName, functionName))
+        return response
+
+    def __runBlockingSpeechRule(self, plugin, function, text):
+        '''Apply a blocking speech rule function to the recognized text.
+
+        .. note:: This function is executed in the pool of threads when the
+                  reactor is running.
+
+        * plugin -- The plugin
+        * function -- The speech rule function
+        * text -- The recognized text
+
+        '''
+        response = plugin.processSpeechRule(function, text)
+        if response is None:
+            raise Exception("Speech rule [%s] failed" % function.__name__)
+
+        # Start any conversation within this thread so that the blocking
+        # speech rule function is never executed by the reactor
+        if type(response) == GeneratorType:
+            response = handleResponse(self, response)
+
+        return response
+
+    def __finishBlockingSpeechRule(self, response):
+        '''Called when a blocking speech rule completes.
+
+        * response -- The response from the speech rule
+
+        '''
+        if type(response) == GeneratorType:
+            self.__startConversation(response, True)
+
+    def __finishSpeechRule(self, response):
+        '''Called when the Deferred returned by a speech rule fires.
+
+        * response -- The response from the speech rule
+
+        '''
+        # Isolated plugins wait for responses within their worker process
+        if not isinstance(response, RemoteResponse):
+            response = handleResponse(self, response)
+
+        if response is not None:
+            self.__startConversation(response, False)
+
+    def __speechRuleFailed(self, failure, plugin, function):
+        '''Called in the event that a speech rule that did not complete
+        immediately failed.
+
+        * failure -- The failure
+        * plugin -- The plugin
+        * function -- The speech rule function
+
+        '''
+        self.log.error("Error in speech rule of plugin [%s]" % plugin.name)
+        self.log.error(failure.getTraceback())
+
+        # Blocking speech rules record their own exceptions
+        if not isBlocking(function):
+            self._statistics.recordException(plugin.name, function.__name__)
+
+        # Have Siri respond with the the error response
+        self.sayErrorResponse()
+
+    def __sendBlockingResponse(self, conversation, text):
+        '''Send the recognized text to the response waiting on a blocking
+        speech rule. The text is sent in the pool of threads once any text
+        previously sent to the response has been handled.
+
+        * conversation -- The conversation of the blocking speech rule
+        * text -- The recognized text
+
+        '''
+        conversation.chain.addCallback(bindSession(self.__queueBlockingSend),
+                                       conversation, text)
+
+    def __queueBlockingSend(self, _result, conversation, text):
+        '''Send the recognized text to the response in the pool of threads.
+
+        * _result -- The result of the previous send
+        * conversation -- The conversation of the blocking speech rule
+        * text -- The recognized text
+
+        '''
+        sent = maybeDeferred(self._threadPool.call, self.__sendBlocking,
+                             conversation.response, text)
+        sent.addCallback(self.__finishBlockingSend, conversation)
+        sent.addErrback(self.__blockingSendFailed, conversation)
+        return sent
+
+    def __queueBlockingClose(self, _result, response):
+        '''Close the response in the pool of threads.
+
+        * _result -- The result of the previous send
+        * response -- The response waiting on a blocking speech rule
+
+        '''
+        closed = maybeDeferred(self._threadPool.call, response.close)
+        closed.addErrback(self.__blockingCloseFailed)
+        return closed
+
+    def __sendBlocking(self, response, text):
+        '''Send the recognized text to the response.
+
+        .. note:: This function is executed in the pool of threads when the
+                  reactor is running.
+
+        * response -- The response waiting on a blocking speech rule
+        * text -- The recognized text
+
+        '''
+        try:
+            response.send(text)
+            return False
+        except StopIteration:
+            return True
+
+    def __finishBlockingSend(self, finished, conversation):
+        '''Called when sending text to a blocking response completes.
+
+        * finished -- True if the response is through yielding
+        * conversation -- The conversation of the blocking speech rule
+
+        '''
+        # Get rid of the response once it is through yielding
+        if finished:
+            self.__endConversation(conversation)
+
+    def __blockingSendFailed(self, failure, conversation):
+        '''Called in the event that sending text to a blocking response
+        failed.
+
+        * failure -- The failure
+        * conversation -- The conversation of the blocking speech rule
+
+        '''
+        self.log.error("Error in response to blocking speech rule")
+        self.log.error(failure.getTraceback())
+        self.__finishBlockingSend(True, conversation)
+
+    def __blockingCloseFailed(self, failure):
+        '''Called in the event that closing a blocking response failed.
+
+        * failure -- The failure
+
+        '''
+        self.log.error("Error closing response to blocking speech rule")
+        self.log.error(failure.getTraceback())
+
+    def __findConversation(self, response):
+        '''Get the conversation which is waiting on the given response, or
+        None if the response is not waiting.
+
+        * response -- The response
+
+        '''
+        for conversation in self._conversations.values():
+            if conversation.response is response:
+                return conversation
+
+        return None
+
+    def __closeConversation(self, conversation):
+        '''Close a conversation that is waiting for a response from Siri.
+
+        * conversation -- The conversation
+
+        '''
+        if conversation.blocking:
+            # Blocking responses must be closed by the pool of threads once
+            # they are done handling any previously sent text
+            conversation.chain.addCallback(
+                bindSession(self.__queueBlockingClose), conversation.response)
+        else:
+            conversation.response.close()
+
+        self.__endConversation(conversation, finished=False)
+
+    def __startConversation(self, response, blocking):
+        '''Make the given response the conversation which receives the next
+        recognized speech of the current session. Any other conversation of
+        the session that is still waiting for a response is closed, since it
+        can no longer receive speech, and the oldest conversations are closed
+        if too many conversations are waiting.
+
+        * response -- The response waiting for a response from Siri
+        * blocking -- True if the response belongs to a blocking speech rule
+
+        '''
+        connectionManager = self.__getSession().connectionManager
+
+        previous = self._conversations.get(connectionManager)
+        if previous is not None:
+            if previous.response is response:
+                self.__endConversation(previous, finished=False)
+            else:
+                self.log.info("Abandoning the previous conversation")
+                self._conversationCounts["abandoned"] += 1
+                self.__closeConversation(previous)
+
+        conversation = _Conversation(connectionManager, response, blocking)
+        self._conversations[connectionManager] = conversation
+        self._conversationCounts["started"] += 1
+
+        # Make room for the conversation by closing the oldest conversations
+        while len(self._conversations) > max(self._maxConversations, 1):
+            oldest = self._conversations.values()[0]
+            self.log.info("Abandoning the oldest conversation")
+            self._conversationCounts["abandoned"] += 1
+            self.__closeConversation(oldest)
+
+        if self._conversationTimeout > 0 and isReactorRunning():
+            conversation.timer = reactor.callLater(
+                self._conversationTimeout,
+                bindSession(self.__expireConversation), conversation)
+
+    def __continueConversation(self, conversation):
+        '''Called when a conversation receives a response, so that it may
+        wait for another period, and is the last conversation to be
+        abandoned.
+
+        * conversation -- The conversation
+
+        '''
+        if conversation.timer is not None:
+            conversation.timer.reset(self._conversationTimeout)
+
+        del self._conversations[conversation.connectionManager]
+        self._conversations[conversation.connectionManager] = conversation
+
+    def __endConversation(self, conversation, finished=True):
+        '''Forget a conversation which is waiting for a response.
+
+        * conversation -- The conversation
+        * finished -- True if the conversation finished on its own
+
+        '''
+        if conversation.timer is not None:
+            if conversation.timer.active():
+                conversation.timer.cancel()
+            conversation.timer = None
+
+        connectionManager = conversation.connectionManager
+        if self._conversations.get(connectionManager) is conversation:
+            del self._conversations[connectionManager]
+
+            if finished:
+                self._conversationCounts["finished"] += 1
+
+    def __expireConversation(self, conversation):
+        '''Called when a conversation has waited too long for a response.
+
+        * conversation -- The conversation
+
+        '''
+        conversation.timer = None
+
+        connectionManager = conversation.connectionManager
+        if self._conversations.get(connectionManager) is conversation:
+            self.log.info("Closing a conversation which waited more than " \
+                              "%s seconds for a response" % \
+                              self._conversationTimeout)
+            self._conversationCounts["expired"] += 1
+            self.__closeConversation(conversation)
+
+    def __getPluginModules(self, directory):
+        '''Get the dictionary of plugin module names mapped to the last
+        modification time of the module file.
+
+        * directory -- The plugins directory
+
+        '''
+        mtimes = {}
+        for filename in listdir(directory):
+            if not filename.startswith("__") and filename.endswith(".py"):
+                # Get the module name from the filename by removing the
+                # file extension
+                moduleName = splitext(filename)[0]
+
+                try:
+                    mtimes[moduleName] = getmtime(join(directory, filename))
+                except OSError:
+                    # The file was removed while listing the directory
+                    continue
+
+        return mtimes
+
+    def __createPlugins(self, mtimes, unchanged):
+        '''Create the ordered list of plugins for all of the given plugin
+        modules. This function returns a tuple containing the list of plugins
+        and the dictionary of module names mapped to plugins.
+
+        * mtimes -- The dictionary of plugin module names mapped to the
+                    modification time of the module file
+        * unchanged -- The dictionary of module names mapped to plugins
+                       which do not need to be created again
+
+        '''
+        plugins = []
+        pluginMap = {}
+        pluginModules = {}
+
+        # Traverse through all of the plugins
+        for pluginName in sorted(mtimes):
+            plugin = unchanged.get(pluginName)
+
+            if plugin is None:
+                try:
+                    plugin = self.__createPlugin(pluginName,
+                                                 mtimes[pluginName])
+                except:
+                    self.log.error("Failed to load plugin [%s]" % pluginName)
+                    self.log.error(getStackTrace())
+
+                    # Keep using the previous version of a plugin that
+                    # fails to reload
+                    plugin = self._pluginModules.get(pluginName)
+                    if plugin is None:
+                        continue
+
+            # Ensure that all plugins subclass the base plugin
+            if isinstance(plugin, (BasePlugin, LazyPlugin, RemotePlugin)):
+                # Force plugins to have unique names
+                if plugin.name not in pluginMap:
+                    plugins.append(plugin)
+                    pluginMap[plugin.name] = plugin
+                    pluginModules[pluginName] = plugin
+                else:
+                    self.log.error("Plugin in file [%s] has name " \
+                                       "[%s] which already exists!" % \
+                                       (pluginName, plugin.name))
+            else:
+                self.log.error("Plugin [%s] must be a subclass of " \
+                                   "the BasePlugin class!" % plugin.name)
+
+        # Forget the descriptions of plugin modules which no longer exist
+        self._manifest.prune(mtimes.keys())
+        self._manifest.save()
+
+        return plugins, pluginModules
+
+    def __swapPlugins(self, mtimes, plugins, pluginModules):
+        '''Replace the loaded plugins with the given plugins.
+
+        * mtimes -- The dictionary of plugin module names mapped to the
+                    modification time of the module file
+        * plugins -- The ordered list of plugins
+        * pluginModules -- The dictionary of module names mapped to plugins
+
+        '''
+        # Compile the speech rules for all of the plugins before replacing
+        # the loaded plugins so that they are replaced all at once
+        speechIndex = SpeechRuleIndex(plugins, self._speechCache,
+                                      self._intentThreshold)
+        self.log.debug("Indexed %d speech rules" % len(speechIndex),
+                       level=10)
+
+        pluginMap = dict((plugin.name, plugin) for plugin in plugins)
+        filterChain, commands = self.__indexFilters(plugins)
+
+        self._plugins = plugins
+        self._pluginMap = pluginMap
+        self._pluginModules = pluginModules
+        self._pluginMtimes = mtimes
+        self._speechIndex = speechIndex
+        self._filterChain = filterChain
+        self._commands = commands
+
+    def __indexFilters(self, plugins):
+        '''Get the list of (plugin, filters) tuples for the plugins that have
+        filters, and the dictionary of custom command names mapped to the
+        (plugin, filter) tuple which handles the command.
+
+        The custom command filter of a plugin is only kept in the list of
+        its filters if the plugin handles at least one custom command.
+
+        * plugins -- The ordered list of plugins
+
+        '''
+        filterChain = []
+        commands = {}
+
+        for plugin in plugins:
+            commandFilter = plugin.getCommandFilter()
+            handlesCommands = False
+            if commandFilter is not None:
+                for command in plugin.getCustomCommands():
+                    owner = commands.get(command)
+
+                    # The first plugin to handle a command keeps it
+                    if owner is not None:
+                        self.log.error("Custom command [%s] of plugin [%s] " \
+                                           "is already handled by plugin " \
+                                           "[%s]" % (command, plugin.name,
+                                                     owner[0].name))
+                    else:
+                        commands[command] = (plugin, commandFilter)
+                        handlesCommands = True
+
+            filters = [function for function in plugin.getFilterFunctions() \
+                           if handlesCommands or function is not commandFilter]
+            if len(filters) > 0:
+                filterChain.append((plugin, filters))
+
+        return filterChain, commands
+
+    def __watchPlugins(self):
+        '''Start periodically checking the plugins directory for plugin
+        modules which have been added, changed, or removed.
+
+        '''
+        interval = Options.get(Sections.General, Ids.PluginReloadInterval,
+                               self.DefaultPluginReloadInterval)
+
+        if interval > 0 and isReactorRunning():
+            self._watcher = LoopingCall(self.__checkPlugins)
+            self._watcher.start(interval, now=False)
+
+    def __checkPlugins(self):
+        '''Reload any plugins that have changed.'''
+        try:
+            self.reloadPlugins()
+        except:
+            self.log.error("Failed reloading plugins")
+            self.log.error(getStackTrace())
+
+    def __createPlugin(self, pluginName, mtime):
+        '''Create the plugin object for the given plugin module.
+
+        The plugin is hosted by the pool of processes if it is isolated.
+        Otherwise, if the plugin module has not changed since it was
+        described in the manifest, the module is not imported until one of
+        its filters or speech rules is applied.
+
+        * pluginName -- The name of the plugin module
+        * mtime -- The modification time of the plugin module
+
+        '''
+        pluginClass = None
+        description = None
+        if self.__isLazy():
+            description = self._manifest.get(pluginName, mtime)
+
+        if description is None:
+            self.log.debug("Loading plugin [%s]" % pluginName, level=10)
+
+            # Get the plugin class, and describe its filters and speech rules
+            pluginClass = self.__importPlugin(pluginName)
+            if not issubclass(pluginClass, BasePlugin):
+                return pluginClass(self, self._logger)
+
+            description = PluginDescription.fromClass(pluginClass)
+            if self.__isLazy():
+                self._manifest.update(pluginName, mtime, description)
+
+        # Plugins can only be isolated while the reactor is running,
+        # otherwise they are loaded within this process (e.g., for testing)
+        if description.name in self.__getIsolatedPlugins() and \
+                isReactorRunning():
+            self.log.debug("Isolating plugin [%s]" % description.name,
+                           level=10)
+            return RemotePlugin(self, self.__getProcessPool(), description,
+                                pluginName, self._logger)
+        elif pluginClass is None:
+            loader = lambda: self.__importPlugin(pluginName)
+            return LazyPlugin(self, description, loader, self._logger)
+
+        return pluginClass(self, self._logger)
+
+    def __isLazy(self):
+        '''Determine if plugins are only imported once they are used.'''
+        return Options.get(Sections.General, Ids.LazyPlugins,
+                           self.DefaultLazyPlugins)
+
+    def __getIsolatedPlugins(self):
+        '''Get the list of names of plugins which are hosted by the pool of
+        processes.
+
+        '''
+        isolated = Options.get(Sections.General, Ids.IsolatedPlugins, "")
+        return [name.strip() for name in isolated.split(",") if name.strip()]
+
+    def __getProcessPool(self):
+        '''Get the pool of processes which hosts isolated plugins, and
+        create it if it has not been created.
+
+        '''
+        if self._processPool is None:
+            processes = Options.get(Sections.General, Ids.PluginProcesses,
+                                    self.DefaultPluginProcesses)
+            timeout = Options.get(Sections.General, Ids.PluginTimeout,
+                                  self.DefaultPluginTimeout)
+            self._processPool = PluginProcessPool(self.PluginsDirectory,
+                                                  processes, timeout,
+                                                  self._logger)
+
+        return self._processPool
 
     def __addPluginsToPath(self, directory):
         '''Add the plugins directory to the path.
@@ -386,10 +1487,22 @@ class PluginManager:
 
     def __importPlugin(self, pluginName):
         '''Import the plugin with the given name and load the given class.
+        The plugin module is reloaded if it has already been imported.
 
         * pluginName -- The name of the plugin
 
         '''
+        moduleName = '.'.join([self.PluginsDirectoryName, pluginName])
+        if moduleName in modules:
+            # Remove the compiled module, which is not recompiled if the
+            # module changed within the same second it was compiled
+            try:
+                remove(join(self.PluginsDirectory, pluginName + ".pyc"))
+            except OSError:
+                pass
+
+            reload(modules[moduleName])
+
         module = __import__(self.PluginsDirectoryName, fromlist=[pluginName])
         pluginModule = getattr(module, pluginName)
         return getattr(pluginModule, self.PluginClassName)
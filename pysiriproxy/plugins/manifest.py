@@ -0,0 +1,494 @@
+# Copyright (C) 2012 Brett Ponsler, Pete Lamonica
+# This file is part of pysiriproxy.
+#
+# pysiriproxy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pysiriproxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pysiriproxy.  If not, see <http://www.gnu.org/licenses/>.
+'''The manifest module contains classes which describe the filters and
+speech rules of a plugin without needing the plugin to be imported.
+
+The description of every plugin is cached in a manifest file along with the
+modification time of the plugin module. When the module has not changed,
+the :class:`.PluginManager` creates a :class:`LazyPlugin` from its cached
+description, and the plugin module is only imported once one of its filters
+or speech rules is first applied.
+
+'''
+import re
+import json
+from os import rename
+from os.path import exists
+
+from pysiriproxy.constants import Keys
+from pysiriproxy.plugins.execution import _BLOCKING_PROP
+from pysiriproxy.plugins.directions import _DIRECTIONS_PROP
+from pysiriproxy.plugins.objectClasses import _CLASSES_PROP
+from pysiriproxy.plugins.registry import PluginRegistry, getRegistry
+from pysiriproxy.plugins.speechRules import MatchSpeechRule, \
+    RegexSpeechRule, IntentSpeechRule, getSpeechRules, matches, regex, \
+    intent
+from pysiriproxy.plugins.plugin import BasePlugin
+
+from pyamp.logging import Colors
+from pyamp.util import getStackTrace
+
+
+# The name of the property used to store the custom commands handled by the
+# custom command filter of a plugin
+_COMMANDS_PROP = "Commands"
+
+
+def createStub(function, exclude=None):
+    '''Create a function which stands in for the given plugin function, and
+    has all of the same filter and speech rule properties.
+
+    * function -- The plugin function
+    * exclude -- The list of properties not to copy
+
+    '''
+    def stub(*args, **kwargs):
+        '''Plugin functions must be called through their plugin.'''
+        raise Exception("Plugin function stubs cannot be called!")
+
+    stub.__dict__.update(function.__dict__)
+    for prop in exclude or []:
+        stub.__dict__.pop(prop, None)
+
+    stub.__name__ = function.__name__
+    return stub
+
+
+def getCommandFilter(filters):
+    '''Get the stand in for the custom command filter function from the
+    given list of stand in filter functions, or None if there is no such
+    function.
+
+    * filters -- The list of stand in filter functions
+
+    '''
+    for function in filters:
+        if getattr(function, _COMMANDS_PROP, None) is not None:
+            return function
+
+    return None
+
+
+def commandApplies(function, obj):
+    '''Determine if the custom command contained in the given StartRequest
+    object is handled by the given custom command filter function.
+
+    * function -- The filter function
+    * obj -- The object
+
+    '''
+    commands = getattr(function, _COMMANDS_PROP, None)
+    if commands is None:
+        return True
+
+    properties = obj.get(Keys.Properties) or {}
+    return properties.get(Keys.Utterance) in commands
+
+
+class PluginDescription:
+    '''The PluginDescription class describes the name, log color, filters,
+    and speech rules of a plugin class. The filters and speech rules are
+    stand in functions (see :func:`createStub`) which carry all of the
+    properties of the plugin functions, but cannot be called.
+
+    The filters and speech rules are also collected in a
+    :class:`.PluginRegistry` which is shared by the stand in plugins created
+    from the description.
+
+    '''
+
+    def __init__(self, name, logColor, filters, speechRules):
+        '''
+        * name -- The name of the plugin
+        * logColor -- The log color of the plugin
+        * filters -- The ordered list of filter functions
+        * speechRules -- The ordered list of speech rule functions
+
+        '''
+        self.name = name
+        self.logColor = logColor
+        self.filters = filters
+        self.speechRules = speechRules
+        self.registry = PluginRegistry(filters, speechRules)
+
+    @classmethod
+    def fromClass(cls, pluginClass):
+        '''Create the description of a plugin class.
+
+        * pluginClass -- The plugin class
+
+        '''
+        name = getattr(pluginClass, "name", None)
+        if name is None:
+            raise Exception("Plugins must have a 'name' property!")
+
+        logColor = getattr(pluginClass, "logColor", Colors.Foreground.White)
+
+        registry = getRegistry(pluginClass)
+
+        filters = []
+        for function in registry.filters:
+            stub = createStub(function)
+
+            # The custom command filter only applies to the commands
+            # in the custom command map of the plugin
+            if getattr(function, "im_func", None) is \
+                    BasePlugin.customCommand.im_func:
+                commands = sorted(pluginClass.customCommandMap.keys())
+                setattr(stub, _COMMANDS_PROP, commands)
+
+            filters.append(stub)
+
+        speechRules = map(createStub, registry.speechRules)
+
+        return cls(name, logColor, filters, speechRules)
+
+    @classmethod
+    def fromEntry(cls, entry):
+        '''Create the description of a plugin from a manifest entry.
+
+        * entry -- The manifest entry
+
+        '''
+        filters = map(cls.__createFunction, entry["filters"])
+        speechRules = map(cls.__createFunction, entry["speechRules"])
+        return cls(entry["name"], entry["logColor"], filters, speechRules)
+
+    def toEntry(self):
+        '''Get the manifest entry for this description, or None if the
+        description cannot be stored in the manifest (e.g., because the
+        plugin has a custom type of speech rule).
+
+        '''
+        try:
+            return {
+                "name": self.name,
+                "logColor": self.logColor,
+                "filters": map(self.__describeFunction, self.filters),
+                "speechRules": map(self.__describeFunction,
+                                   self.speechRules),
+                }
+        except ValueError:
+            return None
+
+    ##### Private functions #####
+
+    @classmethod
+    def __describeFunction(cls, function):
+        '''Get the manifest entry for a filter or speech rule function.
+
+        * function -- The function
+
+        '''
+        description = {
+            "name": function.__name__,
+            "directions": getattr(function, _DIRECTIONS_PROP, []),
+            "classes": getattr(function, _CLASSES_PROP, []),
+            "commands": getattr(function, _COMMANDS_PROP, None),
+            "blocking": getattr(function, _BLOCKING_PROP, False),
+            "speechRules": [],
+            }
+
+        for speechRule in getSpeechRules(function):
+            # Concrete SpeechRules may override the test function, so only
+            # the exact types of rules can be recreated
+            if speechRule.__class__ is MatchSpeechRule:
+                description["speechRules"].append(["matches",
+                                                   speechRule.text])
+            elif speechRule.__class__ is RegexSpeechRule:
+                # Store all of the flags the pattern was compiled with,
+                # such as re.VERBOSE, and not only whether it ignores case
+                pattern = speechRule.getPattern()
+                description["speechRules"].append(["regex", pattern.pattern,
+                                                   pattern.flags])
+            elif speechRule.__class__ is IntentSpeechRule:
+                description["speechRules"].append(["intent",
+                                                   speechRule.text])
+            else:
+                raise ValueError("Speech rule cannot be described")
+
+        return description
+
+    @classmethod
+    def __createFunction(cls, description):
+        '''Create the stand in function for a filter or speech rule function
+        from its manifest entry.
+
+        * description -- The manifest entry for the function
+
+        '''
+        def function(*args, **kwargs):
+            '''Plugin functions must be called through their plugin.'''
+            raise Exception("Plugin function stubs cannot be called!")
+
+        function.__name__ = str(description["name"])
+        setattr(function, _DIRECTIONS_PROP, list(description["directions"]))
+        setattr(function, _CLASSES_PROP, list(description["classes"]))
+        setattr(function, _BLOCKING_PROP, description["blocking"])
+        if description["commands"] is not None:
+            setattr(function, _COMMANDS_PROP, list(description["commands"]))
+
+        # Apply the speech rule decorators in the order they were applied
+        # to the plugin function
+        for speechRule in description["speechRules"]:
+            if speechRule[0] == "matches":
+                function = matches(speechRule[1])(function)
+            elif speechRule[0] == "intent":
+                function = intent(speechRule[1])(function)
+            else:
+                pattern = re.compile(speechRule[1], speechRule[2])
+                function = regex(pattern, False)(function)
+
+        return function
+
+
+class PluginManifest:
+    '''The PluginManifest class manages the file which caches the
+    descriptions of all of the plugin modules in the plugins directory.
+
+    '''
+
+    # The version of the manifest file format
+    Version = 2
+
+    def __init__(self, filename, pluginsDirectory, logger):
+        '''
+        * filename -- The path to the manifest file
+        * pluginsDirectory -- The directory containing the plugins
+        * logger -- The logger
+
+        '''
+        self.__filename = filename
+        self.__pluginsDirectory = pluginsDirectory
+        self.log = logger.get("PluginManifest")
+
+        self.__entries = {}
+        self.__changed = False
+        self.load()
+
+    def load(self):
+        '''Load the manifest file.'''
+        self.__entries = {}
+
+        if exists(self.__filename):
+            try:
+                manifest = json.load(open(self.__filename))
+
+                # Discard manifests for other directories, or formats
+                if manifest.get("version") == self.Version and \
+                        manifest.get("directory") == self.__pluginsDirectory:
+                    self.__entries = manifest["plugins"]
+            except:
+                self.log.error("Failed to load plugin manifest [%s]" % \
+                                   self.__filename)
+                self.log.error(getStackTrace())
+
+    def save(self):
+        '''Save the manifest file if any of its entries have changed.'''
+        if not self.__changed:
+            return
+
+        manifest = {
+            "version": self.Version,
+            "directory": self.__pluginsDirectory,
+            "plugins": self.__entries,
+            }
+
+        # Replace the manifest all at once so it is never partially written
+        try:
+            temporary = self.__filename + ".tmp"
+            json.dump(manifest, open(temporary, "w"), indent=1,
+                      sort_keys=True)
+            rename(temporary, self.__filename)
+            self.__changed = False
+        except:
+            self.log.error("Failed to save plugin manifest [%s]" % \
+                               self.__filename)
+            self.log.error(getStackTrace())
+
+    def get(self, moduleName, mtime):
+        '''Get the :class:`PluginDescription` of the given plugin module, or
+        None if the module has changed since it was described.
+
+        * moduleName -- The name of the plugin module
+        * mtime -- The modification time of the plugin module
+
+        '''
+        entry = self.__entries.get(moduleName)
+        if entry is None or entry["mtime"] != mtime:
+            return None
+
+        return PluginDescription.fromEntry(entry)
+
+    def update(self, moduleName, mtime, description):
+        '''Store the description of the given plugin module.
+
+        * moduleName -- The name of the plugin module
+        * mtime -- The modification time of the plugin module
+        * description -- The PluginDescription
+
+        '''
+        entry = description.toEntry()
+        if entry is None:
+            self.remove(moduleName)
+        else:
+            entry["mtime"] = mtime
+            self.__entries[moduleName] = entry
+            self.__changed = True
+
+    def remove(self, moduleName):
+        '''Remove the description of the given plugin module.
+
+        * moduleName -- The name of the plugin module
+
+        '''
+        if self.__entries.pop(moduleName, None) is not None:
+            self.__changed = True
+
+    def prune(self, moduleNames):
+        '''Remove the descriptions of all plugin modules which are not in
+        the given list of module names.
+
+        * moduleNames -- The list of plugin module names
+
+        '''
+        for moduleName in self.__entries.keys():
+            if moduleName not in moduleNames:
+                self.remove(moduleName)
+
+
+class LazyPlugin:
+    '''The LazyPlugin class stands in for a plugin that has not been
+    imported yet. It provides the same functions that the
+    :class:`.PluginManager` uses to process the filters and speech rules of a
+    :class:`.BasePlugin`, and imports and creates the plugin the first time
+    one of its filters or speech rules is applied.
+
+    '''
+
+    def __init__(self, manager, description, loader, logger):
+        '''
+        * manager -- The PluginManager object
+        * description -- The PluginDescription
+        * loader -- The function which imports the plugin class
+        * logger -- The logger
+
+        '''
+        self.__manager = manager
+        self.__description = description
+        self.__loader = loader
+        self.__logger = logger
+
+        self.__plugin = None
+        self.__failed = False
+
+        self.name = description.name
+        self.log = logger.get(self.name, color=description.logColor)
+
+    def getName(self):
+        '''Get the name of this Plugin.'''
+        return self.name
+
+    def getFilterFunctions(self):
+        '''Get the list of filter functions for this Plugin in the order
+        in which they are processed.
+
+        '''
+        return list(self.__description.filters)
+
+    def getCommandFilter(self):
+        '''Get the filter function which handles the custom commands of
+        this Plugin, or None if this Plugin overrides the custom command
+        filter.
+
+        '''
+        return getCommandFilter(self.__description.filters)
+
+    def getCustomCommands(self):
+        '''Get the list of custom command names handled by this Plugin.'''
+        function = self.getCommandFilter()
+        return [] if function is None else getattr(function, _COMMANDS_PROP)
+
+    def getSpeechRuleFunctions(self):
+        '''Get the list of speech rule functions for this Plugin in the order
+        in which they are processed.
+
+        '''
+        return list(self.__description.speechRules)
+
+    def filterApplies(self, function, direction, obj):
+        '''Determine if the given filter function applies to either the
+        given direction or the class of the given object.
+
+        * function -- The filter function
+        * direction -- The direction
+        * obj -- The object
+
+        '''
+        registry = self.__description.registry
+        return registry.applies(function, direction, obj.get('class')) and \
+            commandApplies(function, obj)
+
+    def processFilter(self, filterFunction, obj, direction):
+        '''Apply a single filter function to the object, importing the
+        plugin if it has not been imported.
+
+        * filterFunction -- The filter function
+        * obj -- The object
+        * direction -- The direction the object traveled to be received
+
+        '''
+        plugin = self.__getPlugin()
+        if plugin is None:
+            return None
+
+        function = getattr(plugin, filterFunction.__name__)
+        return plugin.processFilter(function, obj, direction)
+
+    def processSpeechRule(self, ruleFunction, text):
+        '''Apply a single speech rule function to the recognized speech,
+        importing the plugin if it has not been imported.
+
+        * ruleFunction -- The speech rule function
+        * text -- The recognized speech text
+
+        '''
+        plugin = self.__getPlugin()
+        if plugin is None:
+            return None
+
+        function = getattr(plugin, ruleFunction.__name__)
+        return plugin.processSpeechRule(function, text)
+
+    ##### Private functions #####
+
+    def __getPlugin(self):
+        '''Get the plugin object, and import and create it if it has not
+        been created.
+
+        '''
+        if self.__plugin is None and not self.__failed:
+            self.log.debug("Importing plugin", level=10)
+
+            try:
+                pluginClass = self.__loader()
+                self.__plugin = pluginClass(self.__manager, self.__logger)
+            except:
+                self.log.error("Failed to import plugin [%s]" % self.name)
+                self.log.error(getStackTrace())
+                self.__failed = True
+
+        return self.__plugin
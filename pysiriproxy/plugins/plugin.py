@@ -19,13 +19,15 @@ functionality from which all plugins will inherit.
 '''
 from types import GeneratorType
 
+from twisted.internet.defer import Deferred
+
 from pysiriproxy.constants import Keys
-from pysiriproxy.plugins.speechRules import isSpeechRule, speechRuleMatches, \
-    matches
-from pysiriproxy.plugins.directions import isDirectionFilter, \
-    directionsMatch, From_iPhone, From_Server
-from pysiriproxy.plugins.objectClasses import isObjectClassFilter, \
-    objectClassesMatch, SpeechPacket, SpeechRecognized, StartRequest
+from pysiriproxy.plugins.speechRules import speechRuleMatches, matches
+from pysiriproxy.plugins.directions import From_iPhone, From_Server
+from pysiriproxy.plugins.objectClasses import SpeechPacket, \
+    SpeechRecognized, StartRequest
+from pysiriproxy.plugins.registry import getRegistry
+from pysiriproxy.plugins.statistics import PluginStatistics
 
 from pyamp.logging import Colors
 from pyamp.util import getStackTrace
@@ -97,6 +99,40 @@ class BasePlugin:
     :func:`.speechRules.createDecorator` function with the 
     :class:`.speechRules.Rule` subclass.
 
+    Filters and speech rules are executed by the twisted reactor, which means
+    that they must not perform slow operations. Filters and speech rules
+    which need to wait on something can return a twisted Deferred, or they
+    can be decorated with the *@blocking* decorator which executes them in a
+    pool of threads.
+
+    Example::
+
+        def Plugin(BasePlugin):
+            @blocking
+            @matches("Turn on the lights")
+            def lightsOn(self, text):
+                slowLightingService.turnOn()
+                self.say("The lights are on")
+                self.completeRequest()
+
+    Responses are sent to the session (the iPhone) whose object or recognized
+    speech the filter or speech rule was called for. Callbacks of a Deferred
+    which respond to Siri must be wrapped with the *bindSession* function, so
+    that their responses are sent to the same session.
+
+    Example::
+
+        def Plugin(BasePlugin):
+            @matches("What is the weather")
+            def weather(self, text):
+                deferred = weatherService.getForecast()
+                deferred.addCallback(bindSession(self.sayForecast))
+                return deferred
+
+            def sayForecast(self, forecast):
+                self.say(forecast)
+                self.completeRequest()
+
     '''
 
     customCommandMap = {}
@@ -126,10 +162,9 @@ class BasePlugin:
                                       Colors.Foreground.White)
 
         self.log = logger.get(name, color=logColor)
-        self.__clearFilters()
-        self.__clearSpeechRules()
 
         # Load the filters and speech rules for this plugin
+        self.__registry = getRegistry(self.__class__)
         self.__loadFiltersAndRules()
 
         self.init()
@@ -168,25 +203,77 @@ class BasePlugin:
         for filterFunction in self.__filters:
             # Determine if this filter function applies to the current
             # object or direction
-            if self.__filterApplies(filterFunction, direction, obj):
+            if self.filterApplies(filterFunction, direction, obj):
                 # Filters return None when they ignore the object, otherwise
                 # they have some effect on the current object
-                try:
-                    filterName = filterFunction.__name__
-                    self.log.debug("Processing filter: %s" % filterName,
-                                   level=10)
-
-                    response = filterFunction(obj, direction)
-                    if response is not None:
-                        return response
-                except:
-                    self.log.error("Error in filter [%s]" % \
-                                       filterFunction.__name__)
-                    self.log.error(getStackTrace())
+                response = self.processFilter(filterFunction, obj, direction)
+                if response is not None:
+                    return response
 
         # Object is ignored by this plugin
         return None
 
+    def processFilter(self, filterFunction, obj, direction):
+        '''Apply a single filter function, which is known to apply to the
+        object, to the object.
+
+        .. note:: This function returns the response of the filter function,
+                  or None if the filter function failed.
+
+        * filterFunction -- The filter function
+        * obj -- The object
+        * direction -- The direction the object traveled to be received
+
+        '''
+        try:
+            filterName = filterFunction.__name__
+            self.log.debug("Processing filter: %s" % filterName, level=10)
+
+            return filterFunction(obj, direction)
+        except:
+            self.log.error("Error in filter [%s]" % filterFunction.__name__)
+            self.log.error(getStackTrace())
+            PluginStatistics().recordException(self.name,
+                                               filterFunction.__name__,
+                                               obj.get('class'))
+
+        return None
+
+    def getFilterFunctions(self):
+        '''Get the list of filter functions for this Plugin in the order
+        in which they are processed.
+
+        '''
+        return list(self.__filters)
+
+    def getCommandFilter(self):
+        '''Get the filter function which handles the custom commands in the
+        customCommandMap, or None if this Plugin overrides the
+        :func:`customCommand` filter.
+
+        '''
+        for function in self.__filters:
+            if getattr(function, "im_func", None) is \
+                    BasePlugin.customCommand.im_func:
+                return function
+
+        return None
+
+    def getCustomCommands(self):
+        '''Get the list of custom command names handled by this Plugin.'''
+        return sorted(self.customCommandMap.keys())
+
+    def filterApplies(self, function, direction, obj):
+        '''Determine if the given filter function applies to either the
+        given direction or the class of the given object.
+
+        * function -- The filter function
+        * direction -- The direction
+        * obj -- The object
+
+        '''
+        return self.__registry.applies(function, direction, obj.get('class'))
+
     @From_iPhone
     @StartRequest
     def customCommand(self, obj, direction):
@@ -226,24 +313,56 @@ class BasePlugin:
             # If the given speech rule applies, then apply
             # it to the given text
             if self.__speechRuleApplies(ruleFunction, text):
-                try:
-                    self.log.debug("Processing speech rule: %s" % \
-                                       ruleFunction.__name__, level=10)
-
-                    # Speech rule functions have no return value, make sure
-                    # to pass it the lowercase version of the text
-                    resp = ruleFunction(text.lower())
+                response = self.processSpeechRule(ruleFunction, text)
 
-                    # Only apply the first matched speech rule
-                    return True if type(resp) != GeneratorType else resp
-                except:
-                    self.log.error("Error in speech rule [%s]" % \
-                                       ruleFunction.__name__)
-                    self.log.error(getStackTrace())
+                # Only apply the first matched speech rule
+                if response is not None:
+                    return response
 
         # The text was not matched by any speech rules
         return False
 
+    def processSpeechRule(self, ruleFunction, text):
+        '''Apply a single speech rule function, which is known to match the
+        recognized speech, to the recognized speech text.
+
+        .. note:: This function returns True if the speech rule was applied,
+                  the generator returned by the speech rule if it is waiting
+                  for a response, the Deferred returned by the speech rule
+                  if it has not finished, or None if the speech rule failed.
+
+        * ruleFunction -- The speech rule function
+        * text -- The recognized speech text
+
+        '''
+        try:
+            self.log.debug("Processing speech rule: %s" % \
+                               ruleFunction.__name__, level=10)
+
+            # Speech rule functions have no return value, make sure
+            # to pass it the lowercase version of the text
+            resp = ruleFunction(text.lower())
+
+            if type(resp) == GeneratorType or isinstance(resp, Deferred):
+                return resp
+
+            return True
+        except:
+            self.log.error("Error in speech rule [%s]" % \
+                               ruleFunction.__name__)
+            self.log.error(getStackTrace())
+            PluginStatistics().recordException(self.name,
+                                               ruleFunction.__name__)
+
+        return None
+
+    def getSpeechRuleFunctions(self):
+        '''Get the list of speech rule functions for this Plugin in the
+        order in which they are processed.
+
+        '''
+        return list(self.__speechRules)
+
     ##### Functions passed through to the PluginManager #####
 
     def showDirections(self, directionsType, source, destination,
@@ -334,55 +453,17 @@ class BasePlugin:
 
     ##### Private functions for loading filters #####
 
-    def __clearFilters(self):
-        '''Clear the filters for this plugin.'''
-        self.__filters = []
-
-    def __clearSpeechRules(self):
-        '''Clear the speech rules for this plugin.'''
-        self.__speechRules = []
-
     def __loadFiltersAndRules(self):
-        '''Load all of the filters and speech rules for this Plugin.'''
-        self.__clearFilters()
-        self.__clearSpeechRules()
-
-        # Traverse all of our functions
-        for function in self.__getFunctions():
-            # Handle a filter, or speech rule function accordingly
-            if isDirectionFilter(function) or isObjectClassFilter(function):
-                self.log.debug("Added filter [%s]" % function.__name__,
-                               level=10)
-                self.__filters.append(function)
-            elif isSpeechRule(function):
-                self.log.debug("Added speech rule [%s]" % function.__name__,
-                               level=10)
-                self.__speechRules.append(function)
-
-    ##### Other private functions #####
-
-    def __getFunctions(self):
-        '''Return all of the functions for this class.'''
-        # Filter out any builtin, and private functions
-        attrs = filter(self.__isNotPrivateOrBuiltin, dir(self))
-
-        # Get the objects for all of the class attributes
-        objs = map(lambda attr: getattr(self, attr, None), attrs)
-
-        # Filter out any non-existing attributes
-        objs = filter(lambda obj: obj is not None, objs)
-
-        # Now return only those that are functions
-        return filter(lambda obj: hasattr(obj, "__call__"), objs)
-
-    def __isNotPrivateOrBuiltin(self, attr):
-        '''Determine if the given attribute is a private or builtin
-        attribute name.
-
-        * attr -- The name of the attribute
+        '''Load all of the filters and speech rules for this Plugin from
+        the registry of its class.
 
         '''
-        return not attr.startswith("_") and not attr.find("__") != -1
+        self.__filters = [getattr(self, function.__name__) \
+                              for function in self.__registry.filters]
+        self.__speechRules = [getattr(self, function.__name__) \
+                                  for function in self.__registry.speechRules]
+
+    ##### Other private functions #####
 
     def __forceProperty(self, propName):
         '''Force the given property to exist.
@@ -406,18 +487,6 @@ class BasePlugin:
         '''
         return getattr(self, propName, default)
 
-    def __filterApplies(self, function, direction, obj):
-        '''Determine if the given filter function applies to either the
-        given direction or the class of the given object.
-
-        * direction -- The direction
-        * obj -- The object
-
-        '''
-        objectClass = obj.get('class')
-        return directionsMatch(function, direction) and \
-            objectClassesMatch(function, objectClass)
-
     def __speechRuleApplies(self, function, text):
         '''Determine if the given speech rule function applies to
         the recognized text.
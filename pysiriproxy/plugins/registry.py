@@ -0,0 +1,134 @@
+# Copyright (C) 2012 Brett Ponsler, Pete Lamonica
+# This file is part of pysiriproxy.
+#
+# pysiriproxy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pysiriproxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pysiriproxy.  If not, see <http://www.gnu.org/licenses/>.
+'''The registry module contains the PluginRegistry class which collects the
+filter and speech rule functions of a plugin class, along with the
+directions and object classes each filter applies to.
+
+The registry of a plugin class is only built once, and is then shared by
+every instance of the class.
+
+'''
+from pysiriproxy.plugins.directions import getDirections, isDirectionFilter
+from pysiriproxy.plugins.objectClasses import getObjectClasses, \
+    isObjectClassFilter
+from pysiriproxy.plugins.speechRules import isSpeechRule
+
+
+# The name of the class attribute used to store the registry of a class
+_REGISTRY_PROP = "_PluginRegistry"
+
+
+def getRegistry(pluginClass):
+    '''Get the :class:`PluginRegistry` for the given plugin class, and build
+    it if it has not been built for the class.
+
+    * pluginClass -- The plugin class
+
+    '''
+    # Only look in the class itself, since a subclass has its own functions
+    registry = pluginClass.__dict__.get(_REGISTRY_PROP)
+    if registry is None:
+        registry = PluginRegistry.fromClass(pluginClass)
+        setattr(pluginClass, _REGISTRY_PROP, registry)
+
+    return registry
+
+
+class FilterEntry:
+    '''The FilterEntry class contains the set of directions, and the set of
+    object classes, that a single filter function applies to. An empty set
+    is stored as None, which applies to everything.
+
+    '''
+
+    def __init__(self, function):
+        '''
+        * function -- The filter function
+
+        '''
+        self.name = function.__name__
+        self.directions = frozenset(getDirections(function) or []) or None
+        self.classes = frozenset(getObjectClasses(function) or []) or None
+
+    def applies(self, direction, objectClass):
+        '''Determine if the filter applies to the given direction and the
+        given class of object.
+
+        * direction -- The direction
+        * objectClass -- The class of the object
+
+        '''
+        return (self.directions is None or direction in self.directions) \
+            and (self.classes is None or objectClass in self.classes)
+
+
+class PluginRegistry:
+    '''The PluginRegistry class contains the ordered filter and speech rule
+    functions of a plugin, and a :class:`FilterEntry` for each filter.
+
+    '''
+
+    def __init__(self, filters, speechRules):
+        '''
+        * filters -- The ordered list of filter functions
+        * speechRules -- The ordered list of speech rule functions
+
+        '''
+        self.filters = tuple(filters)
+        self.speechRules = tuple(speechRules)
+        self.__entries = dict((function.__name__, FilterEntry(function)) \
+                                  for function in self.filters)
+
+    @classmethod
+    def fromClass(cls, pluginClass):
+        '''Create the registry for the given plugin class.
+
+        * pluginClass -- The plugin class
+
+        '''
+        filters = []
+        speechRules = []
+
+        for attr in dir(pluginClass):
+            # Skip any builtin and private functions
+            if attr.startswith("_") or attr.find("__") != -1:
+                continue
+
+            function = getattr(pluginClass, attr, None)
+            if function is None or not hasattr(function, "__call__"):
+                continue
+
+            if isDirectionFilter(function) or isObjectClassFilter(function):
+                filters.append(function)
+            elif isSpeechRule(function):
+                speechRules.append(function)
+
+        return cls(filters, speechRules)
+
+    def applies(self, function, direction, objectClass):
+        '''Determine if the given filter function applies to the given
+        direction and the given class of object.
+
+        * function -- The filter function
+        * direction -- The direction
+        * objectClass -- The class of the object
+
+        '''
+        entry = self.__entries.get(function.__name__)
+        if entry is None:
+            entry = FilterEntry(function)
+
+        return entry.applies(direction, objectClass)
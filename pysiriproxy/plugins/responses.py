@@ -55,7 +55,13 @@ class Response:
 
         # Continue yielding until the callback function is no longer yielding
         while keepYielding:
-            response = yield
+            try:
+                response = yield
+            except GeneratorExit:
+                # The conversation was closed before it finished
+                self.close()
+                raise
+
             try:
                 self.callback(response)
             except StopIteration:
@@ -71,6 +77,11 @@ class Response:
         if self.__callback is not None:
             self.__callback.send(response)
 
+    def close(self):
+        '''Close the callback function, which is waiting for a response.'''
+        if self.__callback is not None:
+            self.__callback.close()
+
 
 class ResponseList(Response):
     '''The ResponseList class manages the logic for commanding Siri to ask
@@ -123,7 +134,13 @@ class ResponseList(Response):
             self.__askQuestion()
 
             # Wait for the response
-            response = yield
+            try:
+                response = yield
+            except GeneratorExit:
+                # The conversation was closed before it finished
+                self.close()
+                raise
+
             response = response.lower()
 
             # Command Siri to notify the user of any unexpected responses
@@ -0,0 +1,426 @@
+# Copyright (C) 2012 Brett Ponsler, Pete Lamonica
+# This file is part of pysiriproxy.
+#
+# pysiriproxy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pysiriproxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pysiriproxy.  If not, see <http://www.gnu.org/licenses/>.
+'''The speechIndex module contains the SpeechRuleIndex class which compiles
+the speech rules of all the loaded plugins into a structure that can quickly
+find the speech rule that applies to a piece of recognized speech.
+
+'''
+import re
+from bisect import bisect_left
+from collections import OrderedDict
+
+from pysiriproxy.plugins.intents import IntentIndex
+from pysiriproxy.plugins.speechRules import getSpeechRules, normalizeSpeech
+
+
+# Regular expressions used to detect patterns which cannot be safely
+# combined with other patterns into a single alternation: back references
+# rely on group numbers, and inline flags apply to the entire expression
+_BACKREF_REGEX = re.compile(r"\\[1-9]|\(\?P=")
+_INLINE_FLAGS_REGEX = re.compile(r"\(\?[iLmsux]+\)")
+
+
+class IndexEntry:
+    '''The IndexEntry class pairs a speech rule function with the plugin that
+    the function belongs to, and the position of the function in the overall
+    speech rule order.
+
+    '''
+
+    def __init__(self, ordinal, plugin, function):
+        '''
+        * ordinal -- The position of the speech rule function
+        * plugin -- The plugin which owns the speech rule function
+        * function -- The speech rule function
+
+        '''
+        self.ordinal = ordinal
+        self.plugin = plugin
+        self.function = function
+
+
+class _CombinedPattern:
+    '''The _CombinedPattern class merges several regular expressions, which
+    share the same flags, into a single alternation where each expression is
+    wrapped in its own group. The group that matched identifies the speech
+    rule function which the matching expression belongs to.
+
+    '''
+
+    # The maximum number of groups a single compiled expression may contain
+    MaxGroups = 99
+
+    def __init__(self, flags):
+        '''
+        * flags -- The flags shared by all of the expressions
+
+        '''
+        self.__flags = flags
+        self.__regex = None
+        self.__patterns = []
+        self.__groups = 0
+
+        # The list of (ordinal, pattern) tuples in ascending ordinal order
+        self.members = []
+
+    def canAdd(self, pattern):
+        '''Determine if the given pattern shares the flags of this alternation
+        and fits within it.
+
+        * pattern -- The compiled pattern
+
+        '''
+        return pattern.flags == self.__flags and \
+            self.__groups + pattern.groups + 1 <= self.MaxGroups
+
+    def add(self, ordinal, pattern):
+        '''Add a pattern to this alternation.
+
+        * ordinal -- The ordinal of the speech rule function
+        * pattern -- The compiled pattern
+
+        '''
+        self.members.append((ordinal, pattern))
+        self.__patterns.append(pattern.pattern)
+        self.__groups += pattern.groups + 1
+
+    def compile(self):
+        '''Compile the alternation of all the added patterns.'''
+        alternatives = []
+        self.__groupMap = {}
+
+        group = 1
+        for (ordinal, pattern), text in zip(self.members, self.__patterns):
+            alternatives.append("(%s)" % text)
+
+            # The outer group is always the last group to close, so it is
+            # reported as the last index of a successful match
+            self.__groupMap[group] = ordinal
+            group += pattern.groups + 1
+
+        self.__regex = re.compile('|'.join(alternatives), self.__flags)
+
+    def first(self):
+        '''Get the lowest ordinal contained in this alternation.'''
+        return self.members[0][0]
+
+    def last(self):
+        '''Get the highest ordinal contained in this alternation.'''
+        return self.members[-1][0]
+
+    def match(self, text, start, stop):
+        '''Get the lowest ordinal, in the range [start, stop), whose pattern
+        matches the given text, or None if there is no such ordinal.
+
+        * text -- The recognized text
+        * start -- The lowest ordinal to consider
+        * stop -- The ordinal at which to stop searching
+
+        '''
+        # The alternation tries its expressions in order, so it can only be
+        # used when every member is within the requested range
+        if start <= self.first():
+            matched = self.__regex.match(text)
+            if matched is not None:
+                ordinal = self.__groupMap[matched.lastindex]
+                return ordinal if ordinal < stop else None
+            return None
+
+        for ordinal, pattern in self.members:
+            if ordinal >= stop:
+                break
+            elif ordinal >= start and pattern.match(text) is not None:
+                return ordinal
+
+        return None
+
+
+class SpeechRuleCache:
+    '''The SpeechRuleCache class is a bounded, least recently used, cache
+    which maps recognized text to the ordinal of the first speech rule that
+    applies to it. The number of lookups which were found in the cache is
+    kept across calls to :func:`clear`.
+
+    '''
+
+    def __init__(self, maxSize):
+        '''
+        * maxSize -- The maximum number of entries in the cache
+
+        '''
+        self.maxSize = maxSize
+        self.hits = 0
+        self.misses = 0
+        self.__entries = OrderedDict()
+
+    def __len__(self):
+        '''Get the number of entries in the cache.'''
+        return len(self.__entries)
+
+    def get(self, key):
+        '''Get the value stored for the given key, or None if the key is not
+        in the cache.
+
+        * key -- The key
+
+        '''
+        value = self.__entries.pop(key, None)
+        if value is None:
+            self.misses += 1
+            return None
+
+        # Move the entry to the end, which is the most recently used
+        self.__entries[key] = value
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        '''Store a value for the given key, and remove the least recently used
+        entry if the cache is full.
+
+        * key -- The key
+        * value -- The value
+
+        '''
+        self.__entries[key] = value
+        if len(self.__entries) > self.maxSize:
+            self.__entries.popitem(last=False)
+
+    def clear(self):
+        '''Remove all of the entries from the cache.'''
+        self.__entries.clear()
+
+    def hitRate(self):
+        '''Get the fraction of lookups that were found in the cache.'''
+        lookups = self.hits + self.misses
+        return float(self.hits) / lookups if lookups > 0 else 0.0
+
+
+class SpeechRuleIndex:
+    '''The SpeechRuleIndex class compiles the speech rules for a list of
+    plugins so that the first speech rule function (in plugin order, and then
+    in speech rule order within each plugin) which applies to recognized text
+    can be found without testing every speech rule.
+
+    The text of all *@matches* speech rules is stored in a dictionary keyed
+    by the normalized text. All *@regex* speech rules are merged into
+    combined alternations. Any other type of speech rule is tested
+    individually, but only when it could win over the best match found so far.
+
+    The template phrases of all *@intent* speech rules are scored against
+    recognized text at once by an :class:`.IntentIndex`. The most similar
+    template phrase applies if its score is at least the intent threshold,
+    and it then competes with the other speech rules by its position in the
+    speech rule order.
+
+    When given a :class:`SpeechRuleCache`, the result of matching the
+    *@matches* and *@regex* speech rules against recognized text is cached.
+    The text is only normalized for the cache if none of the regular
+    expressions are case sensitive. Other types of speech rules are always
+    tested, since their results may change over time.
+
+    '''
+
+    # The default minimum score for an *@intent* speech rule to apply
+    DefaultIntentThreshold = 0.7
+
+    def __init__(self, plugins=None, cache=None, intentThreshold=None):
+        '''
+        * plugins -- The ordered list of plugins to index
+        * cache -- The SpeechRuleCache to use, or None
+        * intentThreshold -- The minimum score for an *@intent* speech rule
+                             to apply, or None to use the default
+
+        '''
+        self.__cache = cache
+        self.__intentThreshold = self.DefaultIntentThreshold \
+            if intentThreshold is None else intentThreshold
+        self.build([] if plugins is None else plugins)
+
+    def __len__(self):
+        '''Get the number of speech rule functions in this index.'''
+        return len(self.__entries)
+
+    def build(self, plugins):
+        '''Compile the speech rules for all of the given plugins.
+
+        * plugins -- The ordered list of plugins to index
+
+        '''
+        self.__entries = []
+        self.__exactMap = {}
+        self.__combined = {}
+        self.__patterns = []
+        self.__rules = []
+        self.__intents = IntentIndex()
+        self.__caseless = True
+
+        # Results of matching the previous speech rules no longer apply
+        if self.__cache is not None:
+            self.__cache.clear()
+
+        for plugin in plugins:
+            for function in plugin.getSpeechRuleFunctions():
+                self.__addFunction(plugin, function)
+
+        # Compile all of the combined alternations
+        for alternations in self.__combined.values():
+            for alternation in alternations:
+                alternation.compile()
+
+        self.__intents.build()
+
+    def match(self, text, start=0):
+        '''Get the first :class:`IndexEntry` (with an ordinal of at least
+        start) whose speech rules apply to the recognized text, or None if
+        no speech rules apply.
+
+        * text -- The recognized text
+        * start -- The lowest ordinal to consider
+
+        '''
+        if start == 0 and self.__cache is not None:
+            key = text.lower() if self.__caseless else text
+
+            best = self.__cache.get(key)
+            if best is None:
+                best = self.__matchPatterns(text, start)
+                self.__cache.put(key, best)
+        else:
+            best = self.__matchPatterns(text, start)
+
+        # Test the remaining rules only if they can win
+        for ordinal, rule in self.__rules:
+            if ordinal >= best:
+                break
+            elif ordinal >= start and rule.test(text):
+                best = ordinal
+                break
+
+        return self.__entries[best] if best < len(self.__entries) else None
+
+    ##### Private functions #####
+
+    def __matchPatterns(self, text, start):
+        '''Get the first ordinal (of at least start) whose *@matches*,
+        *@regex*, or *@intent* speech rules apply to the recognized text, or
+        the number of speech rule functions if none of them apply.
+
+        * text -- The recognized text
+        * start -- The lowest ordinal to consider
+
+        '''
+        best = len(self.__entries)
+
+        # Find the first exact text match
+        ordinals = self.__exactMap.get(normalizeSpeech(text))
+        if ordinals is not None:
+            index = bisect_left(ordinals, start)
+            if index < len(ordinals):
+                best = ordinals[index]
+
+        # Find the first combined regular expression match
+        for alternations in self.__combined.values():
+            for alternation in alternations:
+                if alternation.first() >= best:
+                    break
+                elif alternation.last() < start:
+                    continue
+
+                ordinal = alternation.match(text, start, best)
+                if ordinal is not None:
+                    best = ordinal
+                    break
+
+        # Test the remaining patterns only if they can win
+        for ordinal, pattern in self.__patterns:
+            if ordinal >= best:
+                break
+            elif ordinal >= start and pattern.match(text) is not None:
+                best = ordinal
+                break
+
+        # Find the most similar template phrase
+        if len(self.__intents) > 0:
+            result = self.__intents.match(text, start)
+            if result is not None:
+                ordinal, score = result
+                if score >= self.__intentThreshold and ordinal < best:
+                    best = ordinal
+
+        return best
+
+    def __addFunction(self, plugin, function):
+        '''Add a speech rule function to the index.
+
+        * plugin -- The plugin which owns the function
+        * function -- The speech rule function
+
+        '''
+        ordinal = len(self.__entries)
+        self.__entries.append(IndexEntry(ordinal, plugin, function))
+
+        for speechRule in getSpeechRules(function):
+            indexText = speechRule.getIndexText()
+            pattern = speechRule.getPattern()
+            template = speechRule.getIntent()
+
+            # Recognized text can only be normalized for the cache if all of
+            # the regular expressions ignore case
+            if pattern is not None and not pattern.flags & re.IGNORECASE:
+                self.__caseless = False
+
+            if template is not None:
+                self.__intents.add(ordinal, template)
+            elif indexText is not None:
+                ordinals = self.__exactMap.setdefault(indexText, [])
+                if ordinal not in ordinals:
+                    ordinals.append(ordinal)
+            elif pattern is not None and self.__canCombine(pattern):
+                self.__addToAlternation(ordinal, pattern)
+            elif pattern is not None:
+                self.__patterns.append((ordinal, pattern))
+            else:
+                self.__rules.append((ordinal, speechRule))
+
+    def __addToAlternation(self, ordinal, pattern):
+        '''Add a pattern to the last alternation for its flags, creating a new
+        alternation if the last one is full.
+
+        * ordinal -- The ordinal of the speech rule function
+        * pattern -- The compiled pattern
+
+        '''
+        alternations = self.__combined.setdefault(pattern.flags, [])
+        if len(alternations) == 0 or not alternations[-1].canAdd(pattern):
+            alternations.append(_CombinedPattern(pattern.flags))
+
+        alternations[-1].add(ordinal, pattern)
+
+    def __canCombine(self, pattern):
+        '''Determine if the given pattern can be merged with other patterns.
+
+        * pattern -- The compiled pattern
+
+        '''
+        # Comments in verbose expressions run to the end of the line, and
+        # would swallow the closing parenthesis of the group they are
+        # wrapped in, so verbose expressions are matched on their own
+        return not pattern.flags & re.VERBOSE and \
+            len(pattern.groupindex) == 0 and \
+            pattern.groups + 1 < _CombinedPattern.MaxGroups and \
+            _BACKREF_REGEX.search(pattern.pattern) is None and \
+            _INLINE_FLAGS_REGEX.search(pattern.pattern) is None
@@ -19,6 +19,8 @@ speech rules.
 '''
 import re
 
+from pysiriproxy.plugins.intents import IntentIndex, compileTemplate
+
 from pyamp.patterns import listProperty
 
 
@@ -66,6 +68,34 @@ def speechRuleMatches(function, text):
     return False
 
 
+def getIntentSlots(function, text):
+    '''Get the dictionary of slot names mapped to the text spoken for each
+    slot of the first *@intent* speech rule of the function whose template
+    phrase matches the recognized text, or None if the recognized text does
+    not follow any of the template phrases word for word.
+
+    * function -- The speech rule function
+    * text -- The recognized text
+
+    '''
+    for speechRule in getSpeechRules(function):
+        if speechRule.getIntent() is not None:
+            slots = speechRule.getSlots(text)
+            if slots is not None:
+                return slots
+
+    return None
+
+
+def normalizeSpeech(text):
+    '''Normalize the recognized text so that it can be compared to the
+    text of a :class:`MatchSpeechRule`.
+
+    * text -- The recognized text
+
+    '''
+    return text.strip().lower()
+
 
 def createSpeechRule(ruleClass):
     '''Returns a function to be used as a decorator which creates the given
@@ -120,17 +150,68 @@ class SpeechRule:
         '''
         return False
 
+    def getIndexText(self):
+        '''Get the normalized text that recognized speech must be equal to
+        in order for this SpeechRule to apply, or None if this SpeechRule
+        cannot be matched through a simple text lookup.
+
+        .. note:: Concrete SpeechRules that override the :func:`test`
+                  function of a SpeechRule which provides index text
+                  should also override this function.
+
+        '''
+        return None
+
+    def getPattern(self):
+        '''Get the compiled regular expression which must match recognized
+        speech in order for this SpeechRule to apply, or None if this
+        SpeechRule is not implemented using a regular expression.
+
+        .. note:: Concrete SpeechRules that override the :func:`test`
+                  function of a SpeechRule which provides a pattern
+                  should also override this function.
+
+        '''
+        return None
+
+    def getIntent(self):
+        '''Get the template phrase that recognized speech is scored against
+        in order for this SpeechRule to apply, or None if this SpeechRule is
+        not matched by similarity to a template phrase.
+
+        .. note:: Concrete SpeechRules that override the :func:`test`
+                  function of a SpeechRule which provides a template
+                  phrase should also override this function.
+
+        '''
+        return None
+
 
 class MatchSpeechRule(SpeechRule):
     '''Create a :class:`SpeechRule` to match text exactly.'''
 
+    def __init__(self, text, *args, **kwargs):
+        '''
+        * text -- The expected text for this SpeechRule
+
+        '''
+        SpeechRule.__init__(self, text, *args, **kwargs)
+        self.__indexText = text.lower()
+
     def test(self, text):
         '''Test the text to see if it matches our expected text.
 
         * text -- The recogized speech to test
 
         '''
-        return self.text.lower() == text.strip().lower()
+        return self.__indexText == normalizeSpeech(text)
+
+    def getIndexText(self):
+        '''Get the normalized text that recognized speech must be equal to
+        in order for this SpeechRule to apply.
+
+        '''
+        return self.__indexText
 
 
 class RegexSpeechRule(SpeechRule):
@@ -161,7 +242,72 @@ class RegexSpeechRule(SpeechRule):
         # Determine if the regular expression matches the given text
         return self.text.match(text) is not None
 
+    def getPattern(self):
+        '''Get the compiled regular expression for this SpeechRule.'''
+        return self.text
+
+
+class IntentSpeechRule(SpeechRule):
+    '''Create a :class:`SpeechRule` to match text which is similar to a
+    template phrase. The template phrase can contain named slots, surrounded
+    by braces, which stand in for any words.
+
+    Example::
+
+        @intent("turn on the {room} lights")
+        def lightsOn(self, text):
+            slots = getIntentSlots(self.lightsOn, text)
+
+    '''
+
+    Threshold = 0.7
+    '''The minimum similarity score that recognized speech must have with
+    the template phrase for this SpeechRule to apply when it is tested on
+    its own. Once plugins are loaded, the 'IntentThreshold' property in the
+    'General' section is used instead.
+
+    '''
+
+    def __init__(self, template, *args, **kwargs):
+        '''
+        * template -- The template phrase
+
+        '''
+        SpeechRule.__init__(self, template, *args, **kwargs)
+        self.__regex = compileTemplate(template)
+        self.__index = None
+
+    def test(self, text):
+        '''Test the text to see if it is similar to our template phrase.
+
+        * text -- The recogized speech to test
+
+        '''
+        if self.__index is None:
+            self.__index = IntentIndex()
+            self.__index.add(0, self.text)
+            self.__index.build()
+
+        result = self.__index.match(text)
+        return result is not None and result[1] >= self.Threshold
+
+    def getIntent(self):
+        '''Get the template phrase for this SpeechRule.'''
+        return self.text
+
+    def getSlots(self, text):
+        '''Get the dictionary of slot names mapped to the text spoken for
+        each slot, or None if the text does not follow the template phrase
+        word for word.
+
+        * text -- The recognized speech
+
+        '''
+        matched = self.__regex.match(text)
+        return matched.groupdict() if matched is not None else None
+
 
 # Define all of the decorators for speech rules
 matches = createSpeechRule(MatchSpeechRule)
 regex = createSpeechRule(RegexSpeechRule)
+intent = createSpeechRule(IntentSpeechRule)
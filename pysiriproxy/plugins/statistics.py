@@ -0,0 +1,211 @@
+# Copyright (C) 2012 Brett Ponsler, Pete Lamonica
+# This file is part of pysiriproxy.
+#
+# pysiriproxy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pysiriproxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pysiriproxy.  If not, see <http://www.gnu.org/licenses/>.
+'''The statistics module contains classes which record how long each plugin
+filter and speech rule takes to execute, and how often each one is called,
+matches, and fails.
+
+The statistics are kept in fixed size histograms so that recording a call
+only costs a few operations, and they can be left on all of the time.
+
+'''
+from bisect import bisect_left
+
+from pysiriproxy.plugins.execution import reactorThread
+
+
+class LatencyHistogram:
+    '''The LatencyHistogram class counts durations in buckets whose upper
+    bounds double from 50 microseconds up to roughly 26 seconds, with a
+    final bucket for anything longer.
+
+    '''
+
+    # The upper bound (in seconds) of each bucket
+    Bounds = [0.00005 * (2 ** index) for index in range(20)]
+
+    def __init__(self):
+        self.counts = [0] * (len(self.Bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def record(self, seconds):
+        '''Record a single duration.
+
+        * seconds -- The duration in seconds
+
+        '''
+        self.counts[bisect_left(self.Bounds, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.maximum:
+            self.maximum = seconds
+
+    def mean(self):
+        '''Get the mean duration in seconds.'''
+        return self.total / self.count if self.count > 0 else 0.0
+
+    def percentile(self, percent):
+        '''Get an estimate of the given percentile duration in seconds, which
+        is the upper bound of the bucket containing the percentile.
+
+        * percent -- The percentile (between 0 and 100)
+
+        '''
+        target = self.count * percent / 100.0
+
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count > 0 and seen >= target:
+                if index < len(self.Bounds):
+                    return min(self.Bounds[index], self.maximum)
+                break
+
+        return self.maximum
+
+
+class CallStatistics:
+    '''The CallStatistics class contains the statistics for a single plugin
+    function applied to a single class of object.
+
+    '''
+
+    def __init__(self):
+        self.calls = 0
+        self.matches = 0
+        self.exceptions = 0
+        self.latency = LatencyHistogram()
+
+    def toDict(self):
+        '''Get a dictionary containing these statistics.'''
+        return {
+            "calls": self.calls,
+            "matches": self.matches,
+            "exceptions": self.exceptions,
+            "mean": self.latency.mean(),
+            "p50": self.latency.percentile(50),
+            "p95": self.latency.percentile(95),
+            "p99": self.latency.percentile(99),
+            "max": self.latency.maximum,
+            "buckets": list(self.latency.counts),
+            }
+
+
+class PluginStatistics:
+    '''The PluginStatistics class records the statistics for every plugin
+    filter and speech rule, keyed by the name of the plugin, the name of the
+    function, and the class of the object the function was applied to (None
+    for speech rules).
+
+    Statistics are always recorded by the twisted reactor thread, so calls
+    made from other threads are scheduled to be recorded by the reactor.
+
+    '''
+    # Implement the borg pattern
+    __shared_state = {}
+
+    def __init__(self):
+        self.__dict__ = self.__shared_state
+
+        if getattr(self, "_statistics", None) is None:
+            self._statistics = {}
+
+    @reactorThread
+    def recordCall(self, pluginName, functionName, objectClass, seconds,
+                   matched):
+        '''Record a single call to a plugin function.
+
+        * pluginName -- The name of the plugin
+        * functionName -- The name of the function
+        * objectClass -- The class of the object, or None for speech rules
+        * seconds -- The number of seconds the call took
+        * matched -- True if the function handled the object or speech
+
+        '''
+        statistics = self.__get(pluginName, functionName, objectClass)
+        statistics.calls += 1
+        statistics.latency.record(seconds)
+        if matched:
+            statistics.matches += 1
+
+    @reactorThread
+    def recordException(self, pluginName, functionName, objectClass=None):
+        '''Record an exception raised by a plugin function.
+
+        * pluginName -- The name of the plugin
+        * functionName -- The name of the function
+        * objectClass -- The class of the object, or None for speech rules
+
+        '''
+        self.__get(pluginName, functionName, objectClass).exceptions += 1
+
+    def get(self, pluginName=None):
+        '''Get a dictionary mapping (plugin name, function name, object class)
+        tuples to a dictionary containing the statistics for the function.
+
+        * pluginName -- Only get the statistics for this plugin
+
+        '''
+        return dict((key, statistics.toDict()) for key, statistics in \
+                        self._statistics.items() \
+                        if pluginName is None or key[0] == pluginName)
+
+    def reset(self):
+        '''Clear all of the statistics.'''
+        self._statistics = {}
+
+    def report(self):
+        '''Get the list of lines which summarize the statistics for every
+        plugin function, ordered by the total time spent in each function.
+
+        '''
+        lines = []
+
+        items = sorted(self._statistics.items(),
+                       key=lambda item: item[1].latency.total, reverse=True)
+        for (pluginName, functionName, objectClass), statistics in items:
+            latency = statistics.latency
+            lines.append("%s.%s [%s]: calls=%d matches=%d exceptions=%d " \
+                             "mean=%.2fms p50=%.2fms p95=%.2fms p99=%.2fms " \
+                             "max=%.2fms" % \
+                             (pluginName, functionName, objectClass or "-",
+                              statistics.calls, statistics.matches,
+                              statistics.exceptions, latency.mean() * 1000,
+                              latency.percentile(50) * 1000,
+                              latency.percentile(95) * 1000,
+                              latency.percentile(99) * 1000,
+                              latency.maximum * 1000))
+
+        return lines
+
+    def __get(self, pluginName, functionName, objectClass):
+        '''Get the statistics for the given function, creating them if they
+        do not exist.
+
+        * pluginName -- The name of the plugin
+        * functionName -- The name of the function
+        * objectClass -- The class of the object, or None for speech rules
+
+        '''
+        key = (pluginName, functionName, objectClass)
+
+        statistics = self._statistics.get(key)
+        if statistics is None:
+            statistics = CallStatistics()
+            self._statistics[key] = statistics
+
+        return statistics
@@ -0,0 +1,343 @@
+# Copyright (C) 2012 Brett Ponsler, Pete Lamonica
+# This file is part of pysiriproxy.
+#
+# pysiriproxy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pysiriproxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pysiriproxy.  If not, see <http://www.gnu.org/licenses/>.
+'''The worker module is the entry point of the worker processes created by
+the :class:`.PluginProcessPool`. A worker process loads a set of plugin
+modules, and then handles requests to process filters and speech rules until
+the pysiriproxy process closes its request stream.
+
+Plugin modules are only imported once the worker receives the first
+request for one of their filters or speech rules.
+
+Conversations which have not received a response within the conversation
+timeout are closed once the timeout passes, even while the worker is waiting
+for a request, and the oldest conversation is closed when the worker is
+already hosting the maximum number of conversations. The conversations a
+worker closes on its own are reported to pysiriproxy with its next reply.
+
+Usage::
+
+    python -m pysiriproxy.plugins.worker <plugins directory>
+
+'''
+from sys import argv, path
+from os import fdopen
+from time import time
+from select import select
+from os.path import split
+from types import GeneratorType
+from collections import OrderedDict
+
+from pysiriproxy.options import Options, Ids, Files, Sections
+from pysiriproxy.plugins.isolation import Messages
+from pysiriproxy.plugins.responses import handleResponse
+
+from pyamp.logging import LogData
+from pyamp.util import getStackTrace
+
+
+class _CommandRecorder:
+    '''The _CommandRecorder class stands in for the :class:`.PluginManager`
+    within a worker process. It records the commands issued by the plugins
+    so that they can be executed by pysiriproxy.
+
+    '''
+
+    def __init__(self):
+        self.commands = []
+
+    def __getattr__(self, name):
+        '''Get a function which records a call to the given command.
+
+        * name -- The name of the command
+
+        '''
+        if name not in Messages.Commands:
+            raise AttributeError(name)
+
+        def record(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+
+        return record
+
+
+class PluginWorker:
+    '''The PluginWorker class loads plugins, and handles the requests sent
+    by the :class:`.PluginProcessPool`.
+
+    '''
+
+    # The class name that all plugins must have
+    PluginClassName = "Plugin"
+
+    # The default number of seconds a conversation may wait for a response,
+    # and the default number of conversations that may wait at once
+    DefaultConversationTimeout = 60.0
+    DefaultMaxConversations = 16
+
+    def __init__(self, pluginsDirectory, logger):
+        '''
+        * pluginsDirectory -- The directory containing the plugins
+        * logger -- The logger
+
+        '''
+        self.log = logger.get("PluginWorker")
+        self.__logger = logger
+        self.__recorder = _CommandRecorder()
+
+        self.__plugins = {}
+
+        # The conversations waiting for a response, in the order in which
+        # they last received a response, mapped to the time of that response
+        self.__conversations = OrderedDict()
+        self.__conversationTimeout = Options.get(
+            Sections.General, Ids.ConversationTimeout,
+            self.DefaultConversationTimeout)
+        self.__maxConversations = Options.get(Sections.General,
+                                              Ids.MaxConversations,
+                                              self.DefaultMaxConversations)
+
+        # The list of (conversation id, reason) tuples for the conversations
+        # closed by the worker since its last reply
+        self.__closed = []
+
+        self.__handlers = {
+            Messages.Filter: self.__processFilter,
+            Messages.SpeechRule: self.__processSpeechRule,
+            Messages.Send: self.__send,
+            Messages.Close: self.__close,
+            }
+
+        baseDirectory, self.__directoryName = split(pluginsDirectory)
+        if baseDirectory not in path:
+            path.insert(0, baseDirectory)
+
+    def run(self, requestStream, replyStream):
+        '''Handle requests until the request stream is closed.
+
+        * requestStream -- The stream to read requests from
+        * replyStream -- The stream to write replies to
+
+        '''
+        while True:
+            # Close the conversations which expire while waiting for the
+            # next request, and report them without waiting for a request
+            if not self.__waitForRequest(requestStream):
+                self.__expireConversations()
+                if len(self.__closed) > 0:
+                    self.__reply(replyStream, (None, True, None, []))
+                continue
+
+            message = Messages.read(requestStream)
+            if message is None:
+                break
+
+            callId, messageType, args = message
+            self.__recorder.commands = []
+
+            try:
+                handler = self.__handlers[messageType]
+                succeeded, result = True, handler(callId, *args)
+            except:
+                succeeded, result = False, getStackTrace()
+
+            self.__reply(replyStream, (callId, succeeded, result,
+                                       self.__recorder.commands))
+
+    ##### Private functions #####
+
+    def __waitForRequest(self, requestStream):
+        '''Wait until a request can be read, or until the oldest conversation
+        expires. This function returns True if a request can be read.
+
+        * requestStream -- The stream to read requests from
+
+        '''
+        timeout = None
+        if self.__conversationTimeout > 0 and len(self.__conversations) > 0:
+            lastTime = next(self.__conversations.itervalues())[1]
+            timeout = max(lastTime + self.__conversationTimeout - time(), 0)
+
+        readable = select([requestStream], [], [], timeout)[0]
+        return len(readable) > 0
+
+    def __reply(self, replyStream, reply):
+        '''Write a reply, along with the conversations closed by the worker
+        since its last reply.
+
+        * replyStream -- The stream to write replies to
+        * reply -- The tuple containing: the id of the call, True if the call
+                   succeeded, the result of the call, and the list of
+                   commands issued by the plugin during the call
+
+        '''
+        closed, self.__closed = self.__closed, []
+
+        # A result or command argument which cannot be pickled fails the
+        # call, rather than the worker process
+        try:
+            data = Messages.encode(reply + (closed,))
+        except:
+            data = Messages.encode((reply[0], False, getStackTrace(), [],
+                                    closed))
+
+        replyStream.write(data)
+        replyStream.flush()
+
+    def __getPlugin(self, moduleName):
+        '''Get the plugin contained in the given module, and import the
+        module if it has not been imported.
+
+        * moduleName -- The name of the plugin module
+
+        '''
+        plugin = self.__plugins.get(moduleName)
+        if plugin is None:
+            self.log.debug("Importing plugin [%s]" % moduleName, level=10)
+
+            module = __import__(self.__directoryName, fromlist=[moduleName])
+            pluginModule = getattr(module, moduleName)
+            pluginClass = getattr(pluginModule, self.PluginClassName)
+
+            plugin = pluginClass(self.__recorder, self.__logger)
+            self.__plugins[moduleName] = plugin
+
+        return plugin
+
+    def __processFilter(self, _callId, moduleName, functionName, obj,
+                        direction):
+        '''Process a filter for an object.
+
+        * _callId -- The id of the call
+        * moduleName -- The name of the plugin module
+        * functionName -- The name of the filter function
+        * obj -- The object
+        * direction -- The direction the object traveled to be received
+
+        '''
+        plugin = self.__getPlugin(moduleName)
+        function = getattr(plugin, functionName)
+
+        return plugin.processFilter(function, obj, direction)
+
+    def __processSpeechRule(self, callId, moduleName, functionName, text):
+        '''Process a speech rule for the recognized speech. This function
+        returns the id of the conversation if the speech rule is waiting for
+        a response, otherwise it returns None.
+
+        * callId -- The id of the call
+        * moduleName -- The name of the plugin module
+        * functionName -- The name of the speech rule function
+        * text -- The recognized speech
+
+        '''
+        plugin = self.__getPlugin(moduleName)
+        function = getattr(plugin, functionName)
+
+        response = plugin.processSpeechRule(function, text)
+        if response is None:
+            raise Exception("Speech rule [%s] failed" % functionName)
+        elif type(response) != GeneratorType:
+            return None
+
+        try:
+            response = handleResponse(self.__recorder, response)
+        except StopIteration:
+            return None
+
+        self.__conversations[callId] = (response, time())
+
+        # Make room for the conversation by closing the oldest conversations
+        while len(self.__conversations) > max(self.__maxConversations, 1):
+            oldestId, (oldest, _lastTime) = \
+                self.__conversations.popitem(last=False)
+            self.log.info("Abandoning the oldest conversation")
+            self.__closed.append((oldestId, "abandoned"))
+            oldest.close()
+
+        return callId
+
+    def __send(self, _callId, conversationId, text):
+        '''Send recognized speech to a conversation. This function returns
+        True if the conversation has ended.
+
+        * _callId -- The id of the call
+        * conversationId -- The id of the conversation
+        * text -- The recognized speech
+
+        '''
+        conversation = self.__conversations.pop(conversationId, None)
+        if conversation is None:
+            return True
+
+        response = conversation[0]
+        try:
+            response.send(text)
+        except StopIteration:
+            return True
+
+        self.__conversations[conversationId] = (response, time())
+        return False
+
+    def __close(self, _callId, conversationId):
+        '''Close a conversation.
+
+        * _callId -- The id of the call
+        * conversationId -- The id of the conversation
+
+        '''
+        conversation = self.__conversations.pop(conversationId, None)
+        if conversation is not None:
+            conversation[0].close()
+
+    def __expireConversations(self):
+        '''Close the conversations which have waited longer than the
+        conversation timeout for a response.
+
+        '''
+        if self.__conversationTimeout <= 0:
+            return
+
+        expireTime = time() - self.__conversationTimeout
+        while len(self.__conversations) > 0:
+            conversationId, (response, lastTime) = \
+                next(self.__conversations.iteritems())
+            if lastTime > expireTime:
+                break
+
+            del self.__conversations[conversationId]
+            self.log.info("Closing a conversation which waited more than " \
+                              "%s seconds for a response" % \
+                              self.__conversationTimeout)
+            self.__closed.append((conversationId, "expired"))
+            response.close()
+
+
+if __name__ == '__main__':
+    pluginsDirectory = argv[1]
+
+    # Load the configuration so that plugins have access to their settings
+    options = Options(LogData())
+    options.parse([], Files.ConfigFile)
+
+    logLevel = options.get(Sections.Logging, Ids.LogLevel)
+    debugLevel = options.get(Sections.Logging, Ids.DebugLevel)
+    logger = LogData(logLevel, debugLevel)
+
+    worker = PluginWorker(pluginsDirectory, logger)
+    # Requests are read without buffering, so that waiting for a request
+    # never misses one which has already been read into a buffer
+    worker.run(fdopen(Messages.RequestFd, "rb", 0),
+               fdopen(Messages.ReplyFd, "wb"))
@@ -0,0 +1,212 @@
+# Copyright (C) 2012 Brett Ponsler, Pete Lamonica
+# This file is part of pysiriproxy.
+#
+# pysiriproxy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pysiriproxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pysiriproxy.  If not, see <http://www.gnu.org/licenses/>.
+'''The profiling module contains the Profiler class which profiles a
+running pysiriproxy for a number of seconds, without interrupting its
+connections.
+
+Sending the SIGUSR2 signal to pysiriproxy starts profiling the twisted
+reactor thread with :mod:`cProfile` for 'ProfileSeconds' seconds (in the
+'Debug' section of the configuration file). Once the time is up, the
+statistics are written to the *profiles* directory in the configuration
+directory, where they can be read with the :mod:`pstats` module.
+
+When the 'ProfileStacks' property is True the stack of the reactor thread is
+also sampled every few milliseconds of CPU time, and the number of times each
+stack was sampled is written in the collapsed stack format used by
+flamegraph.pl (one stack per line, with the functions separated by
+semicolons, followed by the number of samples).
+
+'''
+import signal
+from os import getpid, makedirs
+from time import strftime
+from cProfile import Profile
+from os.path import basename, exists, join
+
+from twisted.internet import reactor
+
+from pysiriproxy.options.options import Options
+from pysiriproxy.options.config import Directories, Ids, Sections
+
+
+class Profiler:
+    '''The Profiler class profiles the twisted reactor thread for a
+    number of seconds, and then writes the results to files.
+
+    .. note:: The profiler must be started and stopped by the twisted reactor
+              thread, which must be the main thread of the process so that it
+              can receive the signals used to sample its stack.
+
+    '''
+    # Implement the borg pattern
+    __shared_state = {}
+
+    DefaultSeconds = 30.0
+    '''The default number of seconds to profile for.'''
+
+    SampleInterval = 0.005
+    '''The number of seconds of CPU time between samples of the stack.'''
+
+    def __init__(self, logger=None):
+        '''
+        * logger -- The logger
+
+        '''
+        self.__dict__ = self.__shared_state
+
+        if getattr(self, "_profile", None) is None:
+            self._profile = None
+            self._samples = None
+            self._stopCall = None
+            self._previousHandler = None
+
+        if logger is not None:
+            self.log = logger.get("Profiler")
+
+    def isRunning(self):
+        '''Determine if the profiler is running.'''
+        return self._profile is not None
+
+    def start(self, seconds=DefaultSeconds, sampleStacks=True):
+        '''Start profiling, unless the profiler is already running.
+
+        * seconds -- The number of seconds to profile for
+        * sampleStacks -- True to sample the stack of the reactor thread
+
+        '''
+        if self.isRunning():
+            self.log.info("Already profiling")
+            return
+
+        self.log.info("Profiling for %.1f seconds" % seconds)
+
+        if sampleStacks:
+            self._samples = {}
+            self._previousHandler = signal.signal(signal.SIGPROF,
+                                                  self.__sample)
+
+            # Restart any system calls interrupted by a sample so that
+            # sampling does not cause reads and writes to fail
+            signal.siginterrupt(signal.SIGPROF, False)
+            signal.setitimer(signal.ITIMER_PROF, self.SampleInterval,
+                             self.SampleInterval)
+
+        self._profile = Profile()
+        self._profile.enable()
+
+        self._stopCall = reactor.callLater(seconds, self.stop)
+
+    def stop(self):
+        '''Stop profiling, and write the results to files in the profiles
+        directory. Returns the list of paths to the files that were written.
+
+        '''
+        if not self.isRunning():
+            return []
+
+        self._profile.disable()
+
+        if self._stopCall is not None and self._stopCall.active():
+            self._stopCall.cancel()
+        self._stopCall = None
+
+        if self._samples is not None:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            signal.signal(signal.SIGPROF,
+                          self._previousHandler or signal.SIG_DFL)
+
+        paths = self.__write(self._profile, self._samples)
+
+        self._profile = None
+        self._samples = None
+        self._previousHandler = None
+
+        for path in paths:
+            self.log.info("Wrote profile: %s" % path)
+
+        return paths
+
+    ##### Private functions #####
+
+    def __sample(self, _signalNumber, frame):
+        '''Sample the stack which was running when the signal was received.
+
+        * _signalNumber -- The number of the signal
+        * frame -- The frame which was running
+
+        '''
+        functions = []
+        while frame is not None:
+            code = frame.f_code
+            functions.append("%s (%s:%d)" % (code.co_name,
+                                             basename(code.co_filename),
+                                             code.co_firstlineno))
+            frame = frame.f_back
+
+        functions.reverse()
+        stack = ';'.join(functions)
+        self._samples[stack] = self._samples.get(stack, 0) + 1
+
+    def __write(self, profile, samples):
+        '''Write the profile statistics, and the sampled stacks, to files in
+        the profiles directory.
+
+        * profile -- The profile
+        * samples -- The dictionary mapping stacks to the number of times
+                     they were sampled, or None
+
+        '''
+        if not exists(Directories.Profiles):
+            makedirs(Directories.Profiles)
+
+        prefix = join(Directories.Profiles, "profile-%s-%d" % \
+                          (strftime("%Y%m%d-%H%M%S"), getpid()))
+
+        statsPath = prefix + ".prof"
+        profile.dump_stats(statsPath)
+        paths = [statsPath]
+
+        if samples is not None:
+            stacksPath = prefix + ".collapsed"
+            with open(stacksPath, "w") as stacksFile:
+                for stack, count in sorted(samples.items()):
+                    stacksFile.write("%s %d\n" % (stack, count))
+            paths.append(stacksPath)
+
+        return paths
+
+
+def install(logger):
+    '''Start the profiler each time the SIGUSR2 signal is received.
+
+    * logger -- The logger
+
+    '''
+    profiler = Profiler(logger)
+
+    seconds = Options.get(Sections.Debug, Ids.ProfileSeconds,
+                          Profiler.DefaultSeconds)
+    sampleStacks = Options.get(Sections.Debug, Ids.ProfileStacks, True)
+
+    def handleSignal(_signalNumber, _frame):
+        '''Start the profiler once the reactor is free to do so.'''
+        reactor.callFromThread(profiler.start, seconds, sampleStacks)
+
+    signal.signal(signal.SIGUSR2, handleSignal)
+    signal.siginterrupt(signal.SIGUSR2, False)
+
+    # Write the profile if pysiriproxy exits while profiling
+    reactor.addSystemEventTrigger("before", "shutdown", profiler.stop)
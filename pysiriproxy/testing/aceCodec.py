@@ -0,0 +1,156 @@
+# Copyright (C) 2012 Brett Ponsler, Pete Lamonica
+# This file is part of pysiriproxy.
+#
+# pysiriproxy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pysiriproxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pysiriproxy.  If not, see <http://www.gnu.org/licenses/>.
+'''The aceCodec module contains classes which encode and decode the stream
+of data sent between Siri on the iPhone and Apple's server, for the tools
+which stand in for either end of a pysiriproxy connection.
+
+After the HTTP headers, each end of the connection sends the four byte
+0xAACCEE02 prefix followed by a zlib stream, which is flushed with a sync
+flush after every frame. Each decompressed frame starts with a one byte
+type and a four byte big endian value: objects (0x02) are followed by a
+binary plist whose length is the value, while pings (0x03) and pongs (0x04)
+carry a sequence number.
+
+'''
+import zlib
+from struct import Struct
+
+from pysiriproxy.plist import Plist
+
+
+class AceFrames:
+    '''The AceFrames class contains the values used to frame the ACE
+    stream.
+
+    '''
+
+    Prefix = "\xaa\xcc\xee\x02"
+    '''The bytes sent before the zlib stream.'''
+
+    Object = 0x02
+    '''The type of a frame containing a binary plist.'''
+
+    Ping = 0x03
+    '''The type of a ping frame.'''
+
+    Pong = 0x04
+    '''The type of a pong frame.'''
+
+    ClearContext = 0xff
+    '''The type of a frame which clears the context.'''
+
+    Header = Struct(">BI")
+    '''The type and value at the start of every frame.'''
+
+
+class AceEncoder:
+    '''The AceEncoder class encodes objects, pings, and pongs into the
+    compressed ACE stream.
+
+    '''
+
+    def __init__(self, logger):
+        '''
+        * logger -- The logger used to convert objects into binary plists
+
+        '''
+        self.__logger = logger
+        self.__compStream = zlib.compressobj()
+
+    def encodeObject(self, obj):
+        '''Get the compressed data for an object.
+
+        * obj -- The dictionary or :class:`.SiriObject`
+
+        '''
+        objectData = Plist.toBinary(obj, self.__logger)
+        return self.encodeFrame(AceFrames.Header.pack(AceFrames.Object,
+                                                      len(objectData)) + \
+                                    objectData)
+
+    def encodePing(self, sequence):
+        '''Get the compressed data for a ping.
+
+        * sequence -- The sequence number of the ping
+
+        '''
+        return self.encodeFrame(AceFrames.Header.pack(AceFrames.Ping,
+                                                      sequence))
+
+    def encodePong(self, sequence):
+        '''Get the compressed data for a pong.
+
+        * sequence -- The sequence number of the ping being answered
+
+        '''
+        return self.encodeFrame(AceFrames.Header.pack(AceFrames.Pong,
+                                                      sequence))
+
+    def encodeFrame(self, frame):
+        '''Get the compressed data for an uncompressed frame.
+
+        * frame -- The uncompressed frame
+
+        '''
+        return self.__compStream.compress(frame) + \
+            self.__compStream.flush(zlib.Z_SYNC_FLUSH)
+
+
+class AceDecoder:
+    '''The AceDecoder class decodes the compressed ACE stream into frames.
+    Data may be given to the decoder in chunks of any size, and frames which
+    are split across chunks are kept until the rest of the frame arrives.
+
+    '''
+
+    def __init__(self):
+        self.__zipStream = zlib.decompressobj()
+        self.__unzipped = ""
+
+    def decode(self, data):
+        '''Decode a chunk of the compressed stream, and get the list of
+        (frame type, value) tuples for the frames which were completed by
+        it. The value of an object frame is the decoded object, and the value
+        of any other frame is the number which follows its type.
+
+        * data -- The chunk of compressed data
+
+        '''
+        self.__unzipped += self.__zipStream.decompress(data)
+
+        frames = []
+        offset = 0
+        headerSize = AceFrames.Header.size
+
+        while len(self.__unzipped) - offset >= headerSize:
+            frameType, value = AceFrames.Header.unpack_from(self.__unzipped,
+                                                            offset)
+            if frameType != AceFrames.Object:
+                frames.append((frameType, value))
+                offset += headerSize
+                continue
+
+            end = offset + headerSize + value
+            if end > len(self.__unzipped):
+                break
+
+            objectData = self.__unzipped[offset + headerSize:end]
+            frames.append((frameType, Plist.convert(objectData)))
+            offset = end
+
+        self.__unzipped = self.__unzipped[offset:]
+
+        return frames
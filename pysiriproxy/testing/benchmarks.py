@@ -0,0 +1,544 @@
+# Copyright (C) 2012 Brett Ponsler, Pete Lamonica
+# This file is part of pysiriproxy.
+#
+# pysiriproxy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pysiriproxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pysiriproxy.  If not, see <http://www.gnu.org/licenses/>.
+'''The benchmarks module contains functions which measure how long
+pysiriproxy takes to perform common operations.
+
+Along with the time taken to create views and ids, each stage of the path
+taken by the data passing through pysiriproxy is measured separately:
+
+  * connection -- A :class:`.Connection` receiving a compressed frame,
+    parsing it, running the configured plugin filters, and forwarding it
+
+  * inflate -- Decompressing a frame with zlib
+
+  * deflate -- Compressing a frame with zlib, with a sync flush after each
+    frame as the connections do
+
+  * convert -- Converting a binary plist into an object with
+    :func:`.Plist.convert`
+
+  * toBinary -- Converting an object into a binary plist with
+    :func:`.Plist.toBinary`
+
+  * toDict -- Converting a :class:`.SiriObject` into a dictionary
+
+  * speechRecognized -- Extracting the recognized speech from an object
+    with :func:`.Interpreter.speechRecognized`
+
+The stages are measured against the corpus of frames in the *corpus*
+directory next to this module. Each file in the corpus contains a single
+uncompressed ACE frame: a ping, a SpeechPacket containing audio, a
+SpeechRecognized object, and a large AddViews object. The corpus contains no
+personal data, and can be recreated with :func:`writeCorpus`, which creates
+the same frames every time.
+
+Each measurement is repeated a number of times, and the fastest and median
+times are reported. The benchmarks can be run from the command line, and the
+results can be written as JSON so that they can be compared between
+releases::
+
+    python -m pysiriproxy.testing.benchmarks [options] [answers] [lines] \\
+        [iterations]
+
+'''
+import json
+import zlib
+from time import time
+from copy import deepcopy
+from random import Random
+from itertools import cycle
+from sys import argv, exit, stdout
+from os import listdir, makedirs
+from platform import python_version
+from optparse import OptionParser
+from collections import OrderedDict
+from os.path import dirname, exists, join, splitext
+
+from pysiriproxy.plist import Plist
+from pysiriproxy.objects.views import Views
+from pysiriproxy.interpreter import Interpreter
+from pysiriproxy.options.config import Files
+from pysiriproxy.options.options import Options
+from pysiriproxy.constants import ClassNames, Directions, Keys
+from pysiriproxy.objects.factory import ResponseFactory
+from pysiriproxy.testing.aceCodec import AceFrames
+from pysiriproxy.testing.fakeServer import speechRecognized
+from pysiriproxy.objects.dataObjects import DataObjects
+from pysiriproxy.connections.connection import Connection
+from pysiriproxy.connections.manager import ConnectionManager
+from pysiriproxy.objects.identifiers import randomAceId, randomRefId, \
+    seedIds
+
+from pyamp.logging import LogData, LogLevel
+
+CorpusDirectory = join(dirname(__file__), "corpus")
+'''The directory containing the corpus of frames.'''
+
+CorpusExtension = ".ace"
+'''The extension of the files in the corpus.'''
+
+# The direction each frame of the corpus is received from by the
+# connection stage
+_CorpusDirections = {
+    "ping": Directions.From_iPhone,
+    "speechPacket": Directions.From_iPhone,
+    "speechRecognized": Directions.From_Server,
+    "addViews": Directions.From_Server,
+    }
+
+
+def createAnswerSnippet(numAnswers, numLines):
+    '''Create an answer snippet containing the given number of answers, each
+    of which contains the given number of lines.
+
+    * numAnswers -- The number of answers
+    * numLines -- The number of lines in each answer
+
+    '''
+    answers = []
+    for answerIndex in range(numAnswers):
+        lines = [DataObjects.create(DataObjects.AnswerLine,
+                                    text="Answer %d, line %d" % \
+                                        (answerIndex, lineIndex))
+                 for lineIndex in range(numLines)]
+        answers.append(DataObjects.create(DataObjects.Answer,
+                                          title="Answer %d" % answerIndex,
+                                          lines=lines))
+
+    return Views.create(Views.AnswerSnippet, answers=answers)
+
+
+def benchmarkView(numAnswers=20, numLines=50, iterations=200):
+    '''Measure the number of seconds :func:`.ResponseFactory.view` takes to
+    create a view containing a large answer snippet.
+
+    * numAnswers -- The number of answers in the snippet
+    * numLines -- The number of lines in each answer
+    * iterations -- The number of views to create
+
+    '''
+    snippet = createAnswerSnippet(numAnswers, numLines)
+
+    start = time()
+    for _ in range(iterations):
+        ResponseFactory.view("BENCHMARK", [snippet])
+
+    return (time() - start) / iterations
+
+
+def benchmarkIds(iterations=100000):
+    '''Measure the number of seconds taken to create a random refId.
+
+    * iterations -- The number of refIds to create
+
+    '''
+    start = time()
+    for _ in range(iterations):
+        randomRefId()
+
+    return (time() - start) / iterations
+
+
+def benchmarkToDict(numAnswers=20, numLines=50, iterations=200, repeat=5):
+    '''Measure the time taken to convert a view containing a large answer
+    snippet into a dictionary, and get the result.
+
+    * numAnswers -- The number of answers in the snippet
+    * numLines -- The number of lines in each answer
+    * iterations -- The number of conversions in each measurement
+    * repeat -- The number of measurements
+
+    '''
+    view = ResponseFactory.view("BENCHMARK",
+                                [createAnswerSnippet(numAnswers, numLines)],
+                                asObject=True)
+
+    return _getResult("toDict", "answerSnippet", None,
+                      _measure(view.toDict, iterations, repeat), iterations)
+
+
+def benchmarkStages(corpus, logger, iterations=200, repeat=5, seconds=0.2):
+    '''Measure the time taken by each stage of the data path for every
+    frame of the corpus the stage applies to, and get the list of results.
+
+    Slow operations are measured fewer times, so that each measurement takes
+    roughly the given number of seconds.
+
+    * corpus -- The dictionary mapping the name of each frame to the frame
+    * logger -- The logger
+    * iterations -- The largest number of operations in each measurement
+    * repeat -- The number of measurements
+    * seconds -- The number of seconds each measurement should take
+
+    '''
+    results = []
+    for stage, createOperation in _Stages:
+        for name, frame in corpus.items():
+            operation = createOperation(name, frame, logger,
+                                        iterations * repeat + 1)
+            if operation is None:
+                continue
+
+            # Time a first operation, which also warms up any caches
+            start = time()
+            operation()
+            elapsed = time() - start
+
+            count = iterations
+            if elapsed > 0:
+                count = max(1, min(iterations, int(seconds / elapsed)))
+
+            results.append(_getResult(stage, name, len(frame),
+                                      _measure(operation, count, repeat),
+                                      count))
+
+    return results
+
+
+def loadCorpus(directory=CorpusDirectory):
+    '''Load the corpus of frames, and get the dictionary mapping the name
+    of each frame to the frame.
+
+    * directory -- The directory containing the corpus
+
+    '''
+    corpus = OrderedDict()
+    for filename in sorted(listdir(directory)):
+        name, extension = splitext(filename)
+        if extension == CorpusExtension:
+            with open(join(directory, filename), "rb") as frameFile:
+                corpus[name] = frameFile.read()
+
+    return corpus
+
+
+def writeCorpus(directory=CorpusDirectory):
+    '''Create the corpus of frames. The same frames are created every time.
+
+    * directory -- The directory the corpus is written to
+
+    '''
+    # Create the same ids and audio every time
+    seedIds(0)
+    random = Random(0)
+    logger = LogData(LogLevel.ERROR, 0)
+
+    requestId = randomAceId()
+    group = "com.apple.ace.speech"
+    audio = [''.join(chr(random.randint(0, 255)) for _ in range(80)) \
+                 for _ in range(8)]
+
+    objects = OrderedDict([
+            ("speechPacket", {Keys.Class: ClassNames.SpeechPacket,
+                              Keys.Group: group,
+                              Keys.AceId: randomAceId(),
+                              Keys.RefId: requestId,
+                              Keys.Properties: {"packetNumber": 3,
+                                                "packets": audio}}),
+            ("speechRecognized",
+             speechRecognized(requestId, "How tall is the Eiffel Tower")),
+            ("addViews", ResponseFactory.view(requestId,
+                                              [createAnswerSnippet(10, 20)])),
+            ])
+
+    frames = [("ping", AceFrames.Header.pack(AceFrames.Ping, 1))]
+    for name, obj in objects.items():
+        objectData = Plist.toBinary(obj, logger)
+        frames.append((name, AceFrames.Header.pack(AceFrames.Object,
+                                                   len(objectData)) + \
+                           objectData))
+
+    if not exists(directory):
+        makedirs(directory)
+
+    for name, frame in frames:
+        with open(join(directory, name + CorpusExtension), "wb") as outFile:
+            outFile.write(frame)
+
+
+class _NullTransport:
+    '''The _NullTransport class stands in for the transport of the
+    connections measured by the connection stage.
+
+    '''
+    disconnecting = False
+
+    def write(self, data):
+        '''Discard the data written to the transport.
+
+        * data -- The data
+
+        '''
+        pass
+
+    def loseConnection(self):
+        '''Disconnect the transport.'''
+        self.disconnecting = True
+
+
+def _measure(operation, iterations, repeat):
+    '''Get the list of the number of seconds taken by a single operation in
+    each measurement.
+
+    * operation -- The function which performs the operation
+    * iterations -- The number of operations in each measurement
+    * repeat -- The number of measurements
+
+    '''
+    times = []
+    for _ in range(repeat):
+        start = time()
+        for _ in xrange(iterations):
+            operation()
+        times.append((time() - start) / iterations)
+
+    return times
+
+
+def _getResult(stage, sample, size, times, iterations):
+    '''Get the dictionary containing the result of a benchmark.
+
+    * stage -- The name of the stage
+    * sample -- The name of the sample
+    * size -- The number of bytes in the sample, or None
+    * times -- The list of the number of seconds taken by a single operation
+               in each measurement
+    * iterations -- The number of operations in each measurement
+
+    '''
+    ordered = sorted(times)
+    return OrderedDict([("stage", stage), ("sample", sample),
+                        ("bytes", size), ("iterations", iterations),
+                        ("repeat", len(times)), ("best", ordered[0]),
+                        ("median", ordered[len(ordered) // 2])])
+
+
+def _compressFrames(frame, count):
+    '''Get the list of compressed chunks of a stream in which a frame is
+    repeated, with a sync flush after each frame.
+
+    * frame -- The frame
+    * count -- The number of times the frame is repeated
+
+    '''
+    compStream = zlib.compressobj()
+    return [compStream.compress(frame) + \
+                compStream.flush(zlib.Z_SYNC_FLUSH) for _ in xrange(count)]
+
+
+def _getObject(frame):
+    '''Get the object contained in a frame, or None if the frame does not
+    contain an object.
+
+    * frame -- The frame
+
+    '''
+    frameType, _length = AceFrames.Header.unpack_from(frame)
+    if frameType != AceFrames.Object:
+        return None
+
+    return Plist.convert(frame[AceFrames.Header.size:])
+
+
+def _connectionStage(name, frame, logger, count):
+    '''Create the operation which gives the next chunk of the compressed
+    stream to a connection.
+
+    * name -- The name of the frame
+    * frame -- The frame
+    * logger -- The logger
+    * count -- The number of operations
+
+    '''
+    direction = _CorpusDirections.get(name, Directions.From_iPhone)
+    forwardDirection = Directions.From_Server \
+        if direction == Directions.From_iPhone else Directions.From_iPhone
+
+    # The connections have their own manager so that they never forward data
+    # to the connections of the proxy
+    manager = ConnectionManager(logger, shared=False)
+    connection = Connection("Benchmark", direction, logger,
+                            connectionManager=manager)
+    destination = Connection("Destination", forwardDirection, logger,
+                             connectionManager=manager)
+    connection.transport = _NullTransport()
+    destination.transport = _NullTransport()
+
+    # Finish the headers, and send the ACE prefix
+    connection.lineReceived("")
+    connection.dataReceived(AceFrames.Prefix)
+
+    chunks = iter(_compressFrames(frame, count))
+    return lambda: connection.dataReceived(next(chunks))
+
+
+def _inflateStage(_name, frame, _logger, count):
+    '''Create the operation which decompresses the next chunk of the
+    compressed stream.
+
+    * _name -- The name of the frame
+    * frame -- The frame
+    * _logger -- The logger
+    * count -- The number of operations
+
+    '''
+    chunks = iter(_compressFrames(frame, count))
+    zipStream = zlib.decompressobj()
+    return lambda: zipStream.decompress(next(chunks))
+
+
+def _deflateStage(_name, frame, _logger, _count):
+    '''Create the operation which compresses a frame.
+
+    * _name -- The name of the frame
+    * frame -- The frame
+    * _logger -- The logger
+    * _count -- The number of operations
+
+    '''
+    compStream = zlib.compressobj()
+    return lambda: compStream.compress(frame) + \
+        compStream.flush(zlib.Z_SYNC_FLUSH)
+
+
+def _convertStage(_name, frame, _logger, _count):
+    '''Create the operation which converts the binary plist of a frame into
+    an object, or None if the frame does not contain an object.
+
+    * _name -- The name of the frame
+    * frame -- The frame
+    * _logger -- The logger
+    * _count -- The number of operations
+
+    '''
+    if _getObject(frame) is None:
+        return None
+
+    objectData = frame[AceFrames.Header.size:]
+    return lambda: Plist.convert(objectData)
+
+
+def _toBinaryStage(_name, frame, logger, _count):
+    '''Create the operation which converts the object of a frame into a
+    binary plist, or None if the frame does not contain an object.
+
+    * _name -- The name of the frame
+    * frame -- The frame
+    * logger -- The logger
+    * _count -- The number of operations
+
+    '''
+    obj = _getObject(frame)
+    if obj is None:
+        return None
+
+    return lambda: Plist.toBinary(obj, logger)
+
+
+def _speechRecognizedStage(_name, frame, _logger, _count):
+    '''Create the operation which extracts the recognized speech from the
+    object of a frame, or None if the frame does not contain a
+    SpeechRecognized object.
+
+    * _name -- The name of the frame
+    * frame -- The frame
+    * _logger -- The logger
+    * _count -- The number of operations
+
+    '''
+    obj = _getObject(frame)
+    if obj is None or obj.get(Keys.Class) != ClassNames.SpeechRecognized:
+        return None
+
+    # The Interpreter remembers the speech of the most recent objects, so
+    # cycle through more copies of the object than it remembers
+    copies = cycle([deepcopy(obj) for _ in range(Interpreter.CacheSize * 2)])
+    return lambda: Interpreter.speechRecognized(next(copies))
+
+
+# The name of each stage measured against the corpus, and the function
+# which creates the operation for a frame
+_Stages = [
+    ("connection", _connectionStage),
+    ("inflate", _inflateStage),
+    ("deflate", _deflateStage),
+    ("convert", _convertStage),
+    ("toBinary", _toBinaryStage),
+    ("speechRecognized", _speechRecognizedStage),
+    ]
+
+
+if __name__ == '__main__':
+    parser = OptionParser(usage="%prog [options] [answers] [lines] " \
+                              "[iterations]")
+    parser.add_option("-n", "--iterations", type="int", default=200,
+                      help="The largest number of operations in each " \
+                          "measurement of a stage")
+    parser.add_option("-s", "--seconds", type="float", default=0.2,
+                      help="The number of seconds each measurement of a " \
+                          "stage should take")
+    parser.add_option("-r", "--repeat", type="int", default=5,
+                      help="The number of measurements of each stage")
+    parser.add_option("-o", "--output",
+                      help="Write the results to this JSON file ('-' for " \
+                          "the standard output)")
+    parser.add_option("--write-corpus", action="store_true", default=False,
+                      dest="writeCorpus", help="Recreate the corpus and exit")
+    options, args = parser.parse_args(argv[1:])
+
+    if options.writeCorpus:
+        writeCorpus()
+        exit(0)
+
+    numAnswers, numLines, iterations = \
+        ([int(arg) for arg in args[:3]] + [20, 50, 200][len(args[:3]):])
+
+    # The connection stage runs the configured plugin filters
+    logger = LogData(LogLevel.CRITICAL, 0)
+    Options(logger).parse([], Files.ConfigFile)
+
+    # Create the same ids on every run
+    seedIds(0)
+
+    results = [
+        _getResult("view", "answerSnippet", None,
+                   [benchmarkView(numAnswers, numLines, iterations)],
+                   iterations),
+        _getResult("randomRefId", None, None, [benchmarkIds()], 100000),
+        benchmarkToDict(numAnswers, numLines, iterations, options.repeat),
+        ]
+    results.extend(benchmarkStages(loadCorpus(), logger, options.iterations,
+                                   options.repeat, options.seconds))
+
+    if options.output == "-":
+        json.dump({"python": python_version(), "results": results}, stdout,
+                  indent=4)
+        print
+        exit(0)
+
+    print "ResponseFactory.view (%d answers x %d lines): %.3fms" % \
+        (numAnswers, numLines, results[0]["best"] * 1000)
+    print "Random refId: %.3fus" % (results[1]["best"] * 1000000)
+
+    for result in results[2:]:
+        print "%-16s %-16s %8s bytes: best %10.3fus, median %10.3fus" % \
+            (result["stage"], result["sample"], result["bytes"] or "-",
+             result["best"] * 1000000, result["median"] * 1000000)
+
+    if options.output is not None:
+        with open(options.output, "w") as outFile:
+            json.dump({"python": python_version(), "results": results},
+                      outFile, indent=4)
@@ -0,0 +1,501 @@
+# Copyright (C) 2012 Brett Ponsler, Pete Lamonica
+# This file is part of pysiriproxy.
+#
+# pysiriproxy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pysiriproxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pysiriproxy.  If not, see <http://www.gnu.org/licenses/>.
+'''The fakeServer module contains a server which stands in for Apple's
+server, so that pysiriproxy can be tested from end to end without a
+connection to the internet.
+
+The fake server accepts TLS connections using a self-signed certificate,
+answers the HTTP headers sent by pysiriproxy, and then speaks the same
+compressed ACE stream as Apple's server. Pings are answered with pongs, and
+the objects received are answered with the responses of a :class:`Script`.
+
+By default, the end of a speech request (the FinishSpeech object) is
+answered with a SpeechRecognized object containing the next utterance of the
+script, followed by an AddViews object repeating the utterance and a
+RequestCompleted object. A StartRequest object is answered by the same
+AddViews and RequestCompleted objects for its utterance. Scripts can change
+the responses to any utterance, or to any class of object.
+
+To use the fake server, point the 'Host' and 'Port' properties in the
+'Server' section of the configuration file at it, and run it from the
+command line::
+
+    python -m pysiriproxy.testing.fakeServer [options]
+
+'''
+import zlib
+import json
+from sys import argv
+from os import makedirs
+from time import strftime
+from random import randint
+from os.path import exists, join
+from optparse import OptionParser
+
+from twisted.internet import protocol, reactor
+from twisted.protocols.basic import LineReceiver
+from twisted.internet.ssl import DefaultOpenSSLContextFactory
+
+from pysiriproxy.objects.views import Views
+from pysiriproxy.options.config import Directories
+from pysiriproxy.constants import ClassNames, Keys
+from pysiriproxy.objects.factory import ResponseFactory
+from pysiriproxy.objects.identifiers import randomAceId
+from pysiriproxy.testing.aceCodec import AceDecoder, AceEncoder, AceFrames
+
+from pyamp.logging import Colors, LogData, LogLevel
+
+
+class Script:
+    '''The Script class contains the responses the fake server sends for
+    each object it receives.
+
+    Each response is a dictionary whose 'class' entry names the class of the
+    response, and whose optional 'delay' entry is the number of seconds to
+    wait after the previous response before sending it. The following
+    classes are created from the rest of the entries in the dictionary:
+
+      * SpeechRecognized -- Recognizes the 'text' entry, or the utterance
+        of the request
+
+      * AddViews -- Displays and speaks the 'text' entry, or repeats the
+        utterance of the request
+
+      * RequestCompleted -- Completes the request
+
+    A response of any other class is sent as it is given, except that its
+    aceId and refId are set for the request.
+
+    '''
+
+    DefaultUtterance = "Testing"
+    '''The utterance recognized when a script contains no utterances.'''
+
+    DefaultResponses = {
+        ClassNames.FinishSpeech: [
+            {Keys.Class: ClassNames.SpeechRecognized},
+            {Keys.Class: Views.AddViews},
+            {Keys.Class: ClassNames.RequestCompleted},
+            ],
+        ClassNames.StartRequest: [
+            {Keys.Class: Views.AddViews},
+            {Keys.Class: ClassNames.RequestCompleted},
+            ],
+        }
+    '''The responses sent for each class of object when the script does not
+    contain responses for the object.
+
+    '''
+
+    def __init__(self, delay=0.0, utterances=None):
+        '''
+        * delay -- The default number of seconds to wait before each response
+        * utterances -- The list of utterances recognized for each speech
+                        request, in turn
+
+        '''
+        self.delay = delay
+
+        self.__utterances = utterances or [self.DefaultUtterance]
+        self.__nextUtterance = 0
+
+        self.__classResponses = {}
+        self.__utteranceResponses = {}
+
+    @classmethod
+    def load(cls, filename):
+        '''Load a script from a JSON file containing a dictionary with the
+        optional 'delay', 'utterances', 'classes', and 'responses' entries.
+        The 'classes' entry maps the class of an object to its responses, and
+        the 'responses' entry maps an utterance to its responses.
+
+        * filename -- The JSON file
+
+        '''
+        with open(filename) as scriptFile:
+            contents = json.load(scriptFile)
+
+        script = cls(contents.get("delay", 0.0), contents.get("utterances"))
+
+        for className, responses in contents.get("classes", {}).items():
+            script.respondToClass(className, responses)
+
+        for utterance, responses in contents.get("responses", {}).items():
+            script.respondToUtterance(utterance, responses)
+
+        return script
+
+    def respondToClass(self, className, responses):
+        '''Set the responses to every object of the given class.
+
+        * className -- The class of the object
+        * responses -- The list of responses
+
+        '''
+        self.__classResponses[className] = responses
+
+    def respondToUtterance(self, utterance, responses):
+        '''Set the responses to a request for the given utterance. A
+        SpeechRecognized object is always sent before the responses to a
+        speech request.
+
+        * utterance -- The utterance
+        * responses -- The list of responses
+
+        '''
+        self.__utteranceResponses[utterance.lower()] = responses
+
+    def getResponses(self, obj):
+        '''Get the utterance of the request, and the list of (delay,
+        response) tuples to send, for a received object.
+
+        * obj -- The received object
+
+        '''
+        className = obj.get(Keys.Class)
+
+        utterance = None
+        if className == ClassNames.FinishSpeech:
+            utterance = self.__utterances[self.__nextUtterance]
+            self.__nextUtterance = (self.__nextUtterance + 1) % \
+                len(self.__utterances)
+        elif className == ClassNames.StartRequest:
+            properties = obj.get(Keys.Properties) or {}
+            utterance = properties.get(Keys.Utterance)
+
+        responses = self.__utteranceResponses.get((utterance or "").lower())
+        if responses is not None:
+            if className == ClassNames.FinishSpeech:
+                responses = [{Keys.Class: ClassNames.SpeechRecognized}] + \
+                    list(responses)
+        else:
+            responses = self.__classResponses.get(
+                className, self.DefaultResponses.get(className, []))
+
+        return utterance, [(response.get("delay", self.delay), response) \
+                               for response in responses]
+
+
+class _FakeConnection(LineReceiver):
+    '''The _FakeConnection class answers a single connection from
+    pysiriproxy.
+
+    '''
+
+    def __init__(self, script, logger):
+        '''
+        * script -- The script
+        * logger -- The logger
+
+        '''
+        self.__script = script
+        self.__logger = logger
+        self.log = logger.get("FakeConnection", color=Colors.Foreground.Cyan)
+
+        self.__encoder = AceEncoder(logger)
+        self.__decoder = AceDecoder()
+
+        self.__prefix = ""
+        self.__pending = []
+
+    def connectionMade(self):
+        '''Called when the connection has been made.'''
+        self.log.debug("Connection made", level=2)
+        self.factory.connections += 1
+
+    def connectionLost(self, reason):
+        '''Called when the connection has been lost.
+
+        * reason -- The reason the connection was lost
+
+        '''
+        self.log.debug("Connection lost: %s" % reason, level=2)
+
+        # Forget the responses which have not been sent
+        for call in self.__pending:
+            if call.active():
+                call.cancel()
+        self.__pending = []
+
+    def lineReceived(self, line):
+        '''Called when a line of the HTTP headers has been received.
+
+        * line -- The line
+
+        '''
+        self.log.debug("[Header]: %s" % line, level=5)
+
+        # Answer the headers once the empty line ending them is received
+        if line == "":
+            self.setRawMode()
+            self.transport.write(
+                "HTTP/1.0 200 OK\r\n" \
+                    "Server: Apache-Coyote/1.1\r\n" \
+                    "Date: %s\r\n" \
+                    "Connection: close\r\n\r\n" % \
+                    strftime("%a, %d %b %Y %H:%M:%S GMT") + \
+                    AceFrames.Prefix)
+
+    def rawDataReceived(self, data):
+        '''Called when part of the ACE stream has been received.
+
+        * data -- The data
+
+        '''
+        if len(self.__prefix) < len(AceFrames.Prefix):
+            needed = len(AceFrames.Prefix) - len(self.__prefix)
+            self.__prefix += data[:needed]
+            data = data[needed:]
+
+            if self.__prefix != AceFrames.Prefix[:len(self.__prefix)]:
+                self.log.error("Invalid ACE prefix")
+                self.transport.loseConnection()
+                return
+
+        try:
+            frames = self.__decoder.decode(data)
+        except zlib.error, e:
+            self.log.error("Invalid ACE stream: %s" % e)
+            self.transport.loseConnection()
+            return
+
+        for frameType, value in frames:
+            if frameType == AceFrames.Ping:
+                self.transport.write(self.__encoder.encodePong(value))
+            elif frameType == AceFrames.Object:
+                self.__respond(value)
+
+    ##### Private functions #####
+
+    def __respond(self, obj):
+        '''Schedule the responses to a received object.
+
+        * obj -- The received object
+
+        '''
+        className = obj.get(Keys.Class)
+        self.log.debug("Received object: [%s]" % className, level=2)
+
+        # Responses refer to the object which started the request
+        if className in (ClassNames.StartRequest,
+                         ClassNames.StartSpeechRequest):
+            refId = obj.get(Keys.AceId)
+            self.factory.requests += 1
+        else:
+            refId = obj.get(Keys.RefId) or obj.get(Keys.AceId)
+
+        utterance, responses = self.__script.getResponses(obj)
+
+        delay = 0.0
+        for responseDelay, response in responses:
+            delay += responseDelay
+            self.__pending.append(reactor.callLater(delay, self.__send,
+                                                    response, refId,
+                                                    utterance))
+
+    def __send(self, response, refId, utterance):
+        '''Send a response.
+
+        * response -- The response
+        * refId -- The refId of the request
+        * utterance -- The utterance of the request, or None
+
+        '''
+        self.__pending = [call for call in self.__pending if call.active()]
+
+        obj = createResponse(response, refId, utterance)
+        self.log.debug("Sending object: [%s]" % obj.get(Keys.Class), level=2)
+        self.transport.write(self.__encoder.encodeObject(obj))
+
+
+class FakeServerFactory(protocol.Factory):
+    '''The FakeServerFactory class creates the connections to the fake
+    server, and counts the connections and requests it has received.
+
+    '''
+
+    def __init__(self, script, logger):
+        '''
+        * script -- The script
+        * logger -- The logger
+
+        '''
+        self.__script = script
+        self.__logger = logger
+
+        self.connections = 0
+        self.requests = 0
+
+    def buildProtocol(self, _addr):
+        '''Build the protocol for a connection.
+
+        * _addr -- The address
+
+        '''
+        connection = _FakeConnection(self.__script, self.__logger)
+        connection.factory = self
+
+        return connection
+
+
+def createResponse(response, refId, utterance):
+    '''Create the object for a response.
+
+    * response -- The response dictionary
+    * refId -- The refId of the request
+    * utterance -- The utterance of the request, or None
+
+    '''
+    className = response.get(Keys.Class)
+    text = response.get(Keys.Text, utterance or Script.DefaultUtterance)
+
+    if className == ClassNames.SpeechRecognized:
+        return speechRecognized(refId, text)
+    elif className == Views.AddViews:
+        if Keys.Text not in response:
+            text = "You said: %s" % text
+        return ResponseFactory.utterance(refId, text, text)
+    elif className == ClassNames.RequestCompleted:
+        return ResponseFactory.requestCompleted(refId)
+
+    obj = dict((key, value) for key, value in response.items() \
+                   if key != "delay")
+    obj[Keys.AceId] = randomAceId()
+    obj[Keys.RefId] = refId
+
+    return obj
+
+
+def speechRecognized(refId, text, confidence=1000):
+    '''Create a SpeechRecognized object which recognizes a single
+    interpretation of the given text.
+
+    * refId -- The refId of the speech request
+    * text -- The recognized text
+    * confidence -- The confidence score of each word
+
+    '''
+    group = "com.apple.ace.speech"
+    tokens = [{Keys.Class: "Token", Keys.Group: group,
+               Keys.Properties: {Keys.Text: word,
+                                 Keys.ConfidenceScore: confidence,
+                                 Keys.RemoveSpaceBefore: False,
+                                 Keys.RemoveSpaceAfter: False}} \
+                  for word in text.split()]
+
+    interpretation = {Keys.Class: "Interpretation", Keys.Group: group,
+                      Keys.Properties: {Keys.Tokens: tokens}}
+    phrase = {Keys.Class: "Phrase", Keys.Group: group,
+              Keys.Properties: {Keys.Interpretations: [interpretation]}}
+    recognition = {Keys.Class: "Recognition", Keys.Group: group,
+                   Keys.Properties: {Keys.Phrases: [phrase]}}
+
+    return {Keys.Class: ClassNames.SpeechRecognized, Keys.Group: group,
+            Keys.AceId: randomAceId(), Keys.RefId: refId,
+            Keys.Properties: {Keys.Recognition: recognition}}
+
+
+def createCertificate(keyFile, certFile, commonName="guzzoni.apple.com"):
+    '''Create a private key and a self-signed certificate for the fake
+    server.
+
+    * keyFile -- The file the private key is written to
+    * certFile -- The file the certificate is written to
+    * commonName -- The host name the certificate is issued to
+
+    '''
+    from OpenSSL import crypto
+
+    key = crypto.PKey()
+    key.generate_key(crypto.TYPE_RSA, 2048)
+
+    certificate = crypto.X509()
+    certificate.get_subject().CN = commonName
+    certificate.set_serial_number(randint(1, 2 ** 31))
+    certificate.gmtime_adj_notBefore(0)
+    certificate.gmtime_adj_notAfter(10 * 365 * 24 * 60 * 60)
+    certificate.set_issuer(certificate.get_subject())
+    certificate.set_pubkey(key)
+    certificate.sign(key, "sha256")
+
+    with open(keyFile, "w") as outFile:
+        outFile.write(crypto.dump_privatekey(crypto.FILETYPE_PEM, key))
+    with open(certFile, "w") as outFile:
+        outFile.write(crypto.dump_certificate(crypto.FILETYPE_PEM,
+                                              certificate))
+
+
+def listen(logger, port=0, host="127.0.0.1", script=None, keyFile=None,
+           certFile=None):
+    '''Start the fake server, and return the listening port. The number of
+    the port can be found with getHost().port when the given port is zero.
+
+    * logger -- The logger
+    * port -- The port to listen on, or zero for any free port
+    * host -- The interface to listen on
+    * script -- The script, or None to use the default responses
+    * keyFile -- The private key file, or None to use the key created in
+                 the fakeServer directory
+    * certFile -- The certificate file, or None to use the certificate
+                  created in the fakeServer directory
+
+    '''
+    if keyFile is None or certFile is None:
+        keyFile = join(Directories.FakeServer, "server.key")
+        certFile = join(Directories.FakeServer, "server.crt")
+
+        if not exists(keyFile) or not exists(certFile):
+            if not exists(Directories.FakeServer):
+                makedirs(Directories.FakeServer)
+            createCertificate(keyFile, certFile)
+
+    if script is None:
+        script = Script()
+
+    authentication = DefaultOpenSSLContextFactory(keyFile, certFile)
+    factory = FakeServerFactory(script, logger)
+
+    return reactor.listenSSL(port, factory, authentication, interface=host)
+
+
+if __name__ == '__main__':
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("-p", "--port", type="int", default=443,
+                      help="The port to listen on")
+    parser.add_option("-H", "--host", default="127.0.0.1",
+                      help="The interface to listen on")
+    parser.add_option("-s", "--script",
+                      help="The JSON file containing the script")
+    parser.add_option("-d", "--delay", type="float", default=0.0,
+                      help="The number of seconds to wait before each " \
+                          "response of the default script")
+    parser.add_option("-u", "--utterance", action="append",
+                      dest="utterances", help="The utterance recognized " \
+                          "for each speech request (may be given more than " \
+                          "once, to recognize each in turn)")
+    options, _args = parser.parse_args(argv[1:])
+
+    if options.script is not None:
+        script = Script.load(options.script)
+    else:
+        script = Script(options.delay, options.utterances)
+
+    logger = LogData(LogLevel.INFO, 0)
+    listening = listen(logger, options.port, options.host, script)
+
+    print "Fake server listening on %s:%d" % (options.host,
+                                              listening.getHost().port)
+    reactor.run()
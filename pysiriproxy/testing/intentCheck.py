@@ -0,0 +1,119 @@
+# Copyright (C) 2012 Brett Ponsler, Pete Lamonica
+# This file is part of pysiriproxy.
+#
+# pysiriproxy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pysiriproxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pysiriproxy.  If not, see <http://www.gnu.org/licenses/>.
+'''The intentCheck module checks that the scores given by the
+:class:`.IntentIndex` keep *@intent* speech rules from claiming speech
+which is not meant for them.
+
+A set of template phrases is scored against utterances which should match
+one of the templates, and against off topic utterances (which share words
+with the templates, or leave out their slots) which should score below the
+intent threshold. The check can be run from the command line, and exits with
+a non-zero status if any utterance is scored on the wrong side of the
+threshold::
+
+    python -m pysiriproxy.testing.intentCheck [threshold]
+
+'''
+from sys import argv, exit
+
+from pysiriproxy.plugins.intents import IntentIndex
+from pysiriproxy.plugins.speechIndex import SpeechRuleIndex
+
+
+Templates = [
+    "turn on the {room} lights",
+    "turn off the {room} lights",
+    "what is the weather in {city}",
+    ]
+'''The template phrases which are checked.'''
+
+OnTopic = [
+    ("turn on the kitchen lights", 0),
+    ("turn off the living room lights", 1),
+    ("please turn on the bedroom lights", 0),
+    ("what is the weather in new york", 2),
+    ("What is the weather in Paris?", 2),
+    ]
+'''The list of (utterance, template index) tuples for the utterances which
+should match a template phrase.
+
+'''
+
+OffTopic = [
+    "turn on the oven",
+    "turn off the alarm",
+    "turn on",
+    "on the",
+    "play some music on the radio",
+    "what is the time",
+    "call mom",
+    ]
+'''The utterances which should not match any template phrase.'''
+
+
+def checkIntents(threshold=SpeechRuleIndex.DefaultIntentThreshold):
+    '''Score the utterances against the template phrases, and get the list
+    of messages describing the utterances which were scored on the wrong
+    side of the threshold.
+
+    * threshold -- The intent threshold
+
+    '''
+    index = IntentIndex()
+    for ordinal, template in enumerate(Templates):
+        index.add(ordinal, template)
+    index.build()
+
+    failures = []
+    for utterance, expected in OnTopic:
+        ordinal, score = index.match(utterance) or (None, 0.0)
+        if ordinal != expected or score < threshold:
+            failures.append("[%s] scored %.3f for [%s], expected [%s]" % \
+                                (utterance, score, _getTemplate(ordinal),
+                                 Templates[expected]))
+
+    for utterance in OffTopic:
+        ordinal, score = index.match(utterance) or (None, 0.0)
+        if score >= threshold:
+            failures.append("[%s] scored %.3f for [%s], expected no " \
+                                "match" % (utterance, score,
+                                           _getTemplate(ordinal)))
+
+    return failures
+
+
+##### Private functions #####
+
+def _getTemplate(ordinal):
+    '''Get the template phrase for an ordinal, or None.
+
+    * ordinal -- The ordinal of the template phrase, or None
+
+    '''
+    return Templates[ordinal] if ordinal is not None else None
+
+
+if __name__ == '__main__':
+    threshold = float(argv[1]) if len(argv) > 1 \
+        else SpeechRuleIndex.DefaultIntentThreshold
+
+    failures = checkIntents(threshold)
+    for failure in failures:
+        print failure
+
+    print "%d of %d utterances scored on the wrong side of %.2f" % \
+        (len(failures), len(OnTopic) + len(OffTopic), threshold)
+    exit(1 if failures else 0)
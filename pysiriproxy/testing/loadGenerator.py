@@ -0,0 +1,724 @@
+# Copyright (C) 2012 Brett Ponsler, Pete Lamonica
+# This file is part of pysiriproxy.
+#
+# pysiriproxy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pysiriproxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pysiriproxy.  If not, see <http://www.gnu.org/licenses/>.
+'''The loadGenerator module contains the LoadGenerator class which
+simulates a number of iPhones using pysiriproxy at once, and measures how
+well pysiriproxy keeps up with them.
+
+Each simulated iPhone repeatedly opens a session: it connects to pysiriproxy
+with TLS, sends the HTTP headers and the ACE stream, and pings pysiriproxy
+every second. During a session the iPhone makes a number of speech requests
+at a configured rate, each of which streams SpeechPacket objects containing
+audio and then waits for the request to be completed. The latency of a
+request is the time between sending the FinishSpeech object and receiving
+the RequestCompleted object.
+
+The load generator reports the number of sessions and frames per second,
+the percentiles of the request latency, and the CPU time and resident memory
+of the pysiriproxy process (or of the load generator's own process, when its
+process id is not given). Results can be written to a JSON file, and compared
+with the results of a previous version to fail when the throughput or
+latency has regressed. It can be run from the command line::
+
+    python -m pysiriproxy.testing.loadGenerator [options]
+
+With the --local option, the load generator runs pysiriproxy and the
+:mod:`.fakeServer` in its own process, using the 'Server' and 'iPhone'
+sections of the configuration file, so that it can be run without a
+connection to the internet.
+
+Each iPhone connected to pysiriproxy has its own connection to Apple's
+server, so every simulated device is expected to complete its requests.
+
+'''
+import json
+from os import getpid, sysconf, urandom
+from time import time
+from sys import argv, exit
+from resource import getrusage, RUSAGE_SELF
+from optparse import OptionParser
+
+from twisted.internet import defer, protocol, reactor, ssl, task
+
+from pysiriproxy.constants import ClassNames, Keys
+from pysiriproxy.options.options import Options
+from pysiriproxy.options.config import Files, Ids, Sections
+from pysiriproxy.objects.identifiers import randomAceId
+from pysiriproxy.testing.aceCodec import AceDecoder, AceEncoder, AceFrames
+
+from pyamp.logging import LogData, LogLevel
+
+
+class LoadGenerator:
+    '''The LoadGenerator class simulates a number of iPhones connected to
+    pysiriproxy for a number of seconds, and records the results.
+
+    '''
+
+    PingInterval = 1.0
+    '''The number of seconds between the pings sent by each device.'''
+
+    AudioPackets = 64
+    '''The number of different packets of random audio sent by the devices,
+    which keeps zlib from compressing the audio more than it would compress
+    real audio.
+
+    '''
+
+    def __init__(self, logger, host, port, devices=1, duration=10.0,
+                 rate=1.0, requests=1, packets=10, packetSize=640,
+                 packetInterval=0.0, timeout=10.0, pid=None):
+        '''
+        * logger -- The logger
+        * host -- The host pysiriproxy is listening on
+        * port -- The port pysiriproxy is listening on
+        * devices -- The number of simulated iPhones
+        * duration -- The number of seconds to start new sessions for
+        * rate -- The number of requests per second made by each device
+                  during a session, or zero to make them as fast as possible
+        * requests -- The number of requests made in each session
+        * packets -- The number of SpeechPacket objects sent for each request
+        * packetSize -- The number of bytes of audio in each SpeechPacket
+        * packetInterval -- The number of seconds between SpeechPackets
+        * timeout -- The number of seconds to wait for a request to complete
+        * pid -- The id of the pysiriproxy process, or None if pysiriproxy
+                 is running in this process
+
+        '''
+        self.log = logger.get("LoadGenerator")
+        self.logger = logger
+
+        self.host = host
+        self.port = port
+        self.devices = devices
+        self.duration = duration
+        self.rate = rate
+        self.requests = requests
+        self.packets = packets
+        self.packetInterval = packetInterval
+        self.timeout = timeout
+
+        self.audio = [urandom(packetSize) for _ in range(self.AudioPackets)]
+
+        self.__usage = _ProcessUsage(pid)
+
+        self.sessions = 0
+        self.failures = 0
+        self.framesSent = 0
+        self.framesReceived = 0
+        self.latencies = []
+
+        self.__started = None
+        self.__finished = None
+        self.__deadline = None
+
+    def start(self):
+        '''Start simulating the devices, and return a Deferred which is
+        called with the results once every device has finished.
+
+        '''
+        self.log.info("Simulating %d devices for %.1f seconds" % \
+                          (self.devices, self.duration))
+
+        self.__started = time()
+        self.__deadline = self.__started + self.duration
+        self.__usage.start()
+
+        deferreds = [_Device(self, index).start() \
+                         for index in range(self.devices)]
+
+        return defer.gatherResults(deferreds).addCallback(self.__finish)
+
+    def isRunning(self):
+        '''Determine if new sessions should still be started.'''
+        return time() < self.__deadline
+
+    def getResults(self):
+        '''Get the dictionary of results.'''
+        elapsed = (self.__finished or time()) - self.__started
+        frames = self.framesSent + self.framesReceived
+        latencies = sorted(self.latencies)
+        cpuSeconds, rss = self.__usage.get()
+
+        return {
+            "devices": self.devices,
+            "elapsed": elapsed,
+            "sessions": self.sessions,
+            "sessionsPerSecond": self.sessions / elapsed,
+            "requests": len(latencies),
+            "failures": self.failures,
+            "framesSent": self.framesSent,
+            "framesReceived": self.framesReceived,
+            "framesPerSecond": frames / elapsed,
+            "latency": {
+                "p50": _percentile(latencies, 0.50),
+                "p95": _percentile(latencies, 0.95),
+                "p99": _percentile(latencies, 0.99),
+                "max": latencies[-1] if len(latencies) > 0 else None,
+                },
+            "cpuSeconds": cpuSeconds,
+            "cpuPercent": cpuSeconds * 100.0 / elapsed,
+            "rssBytes": rss,
+            }
+
+    ##### Private functions #####
+
+    def __finish(self, _results):
+        '''Called once every device has finished.
+
+        * _results -- The list of results of the devices
+
+        '''
+        self.__finished = time()
+        self.__usage.stop()
+
+        return self.getResults()
+
+
+class _Device:
+    '''The _Device class simulates a single iPhone, which opens sessions
+    one after another until the load generator stops.
+
+    '''
+
+    def __init__(self, generator, index):
+        '''
+        * generator -- The LoadGenerator
+        * index -- The index of the device
+
+        '''
+        self.generator = generator
+        self.index = index
+        self.__deferred = defer.Deferred()
+
+    def start(self):
+        '''Start the first session, and return a Deferred which is called
+        once the device has finished.
+
+        '''
+        self.__connect()
+        return self.__deferred
+
+    def sessionEnded(self, completed):
+        '''Called when a session has ended, to start the next session.
+
+        * completed -- True if every request of the session completed
+
+        '''
+        if completed:
+            self.generator.sessions += 1
+
+        if self.generator.isRunning():
+            self.__connect()
+        else:
+            self.__deferred.callback(self.index)
+
+    ##### Private functions #####
+
+    def __connect(self):
+        '''Connect a new session to pysiriproxy.'''
+        factory = _SessionFactory(self)
+        reactor.connectSSL(self.generator.host, self.generator.port, factory,
+                           ssl.ClientContextFactory())
+
+
+class _Session(protocol.Protocol):
+    '''The _Session class speaks to pysiriproxy as an iPhone during a
+    single session.
+
+    '''
+
+    def __init__(self, device):
+        '''
+        * device -- The _Device
+
+        '''
+        self.__device = device
+        self.__generator = device.generator
+
+        self.__encoder = AceEncoder(self.__generator.logger)
+        self.__decoder = AceDecoder()
+
+        # The headers and prefix sent by pysiriproxy before the ACE stream
+        self.__header = ""
+        self.__receivedPrefix = False
+
+        self.__pings = None
+        self.__pingSequence = 0
+
+        self.__requestsMade = 0
+        self.__requestId = None
+        self.__requestStarted = None
+        self.__finishSent = None
+        self.__nextCall = None
+        self.__timeoutCall = None
+
+        self.__completed = False
+        self.__ended = False
+
+    def connectionMade(self):
+        '''Called when the connection to pysiriproxy has been made.'''
+        self.transport.write(
+            "ACE /ace HTTP/1.0\r\n" \
+                "Host: guzzoni.apple.com\r\n" \
+                "User-Agent: Assistant(iPhone/iPhone4,1; " \
+                "iPhone OS/5.1/9B179) Ace/1.0\r\n" \
+                "Content-Length: 2000000000\r\n" \
+                "X-Ace-Host: %s\r\n\r\n" % randomAceId() + \
+                AceFrames.Prefix)
+
+        self.__pings = task.LoopingCall(self.__ping)
+        self.__pings.start(LoadGenerator.PingInterval, now=False)
+
+        self.__startRequest()
+
+    def connectionLost(self, reason):
+        '''Called when the connection to pysiriproxy has been lost.
+
+        * reason -- The reason the connection was lost
+
+        '''
+        if self.__completed:
+            self.__end()
+        else:
+            self.__fail("Connection lost: %s" % reason.getErrorMessage())
+
+    def dataReceived(self, data):
+        '''Called when data has been received from pysiriproxy.
+
+        * data -- The data
+
+        '''
+        if not self.__receivedPrefix:
+            self.__header += data
+
+            end = self.__header.find("\r\n\r\n")
+            if end == -1 or len(self.__header) < end + 8:
+                return
+
+            if self.__header[end + 4:end + 8] != AceFrames.Prefix:
+                self.__fail("Invalid ACE prefix")
+                return
+
+            data = self.__header[end + 8:]
+            self.__header = ""
+            self.__receivedPrefix = True
+
+        for frameType, value in self.__decoder.decode(data):
+            self.__generator.framesReceived += 1
+
+            if frameType == AceFrames.Object and \
+                    value.get(Keys.Class) == ClassNames.RequestCompleted and \
+                    value.get(Keys.RefId) == self.__requestId:
+                self.__requestCompleted()
+
+    ##### Private functions #####
+
+    def __send(self, obj):
+        '''Send an object to pysiriproxy.
+
+        * obj -- The object
+
+        '''
+        self.transport.write(self.__encoder.encodeObject(obj))
+        self.__generator.framesSent += 1
+
+    def __ping(self):
+        '''Send a ping to pysiriproxy.'''
+        self.__pingSequence += 1
+        self.transport.write(self.__encoder.encodePing(self.__pingSequence))
+        self.__generator.framesSent += 1
+
+    def __startRequest(self):
+        '''Start a speech request, and stream its audio.'''
+        self.__nextCall = None
+        self.__requestsMade += 1
+        self.__requestId = randomAceId()
+        self.__requestStarted = time()
+
+        self.__send({Keys.Class: ClassNames.StartSpeechRequest,
+                     Keys.Group: "com.apple.ace.speech",
+                     Keys.AceId: self.__requestId,
+                     Keys.Properties: {"codec": "Speex_WB_Quality8",
+                                       "audioSource": "BuiltInMic"}})
+
+        self.__timeoutCall = reactor.callLater(self.__generator.timeout,
+                                               self.__fail,
+                                               "Request timed out")
+        self.__sendPacket(0)
+
+    def __sendPacket(self, packetNumber):
+        '''Send a SpeechPacket, and then either schedule the next one, or
+        finish the speech.
+
+        * packetNumber -- The number of the packet
+
+        '''
+        self.__nextCall = None
+        generator = self.__generator
+
+        if packetNumber == generator.packets:
+            self.__send({Keys.Class: ClassNames.FinishSpeech,
+                         Keys.Group: "com.apple.ace.speech",
+                         Keys.AceId: randomAceId(),
+                         Keys.RefId: self.__requestId,
+                         Keys.Properties: {"packetCount": packetNumber}})
+            self.__finishSent = time()
+            return
+
+        audio = generator.audio[packetNumber % len(generator.audio)]
+        self.__send({Keys.Class: ClassNames.SpeechPacket,
+                     Keys.Group: "com.apple.ace.speech",
+                     Keys.AceId: randomAceId(),
+                     Keys.RefId: self.__requestId,
+                     Keys.Properties: {"packetNumber": packetNumber,
+                                       "packets": [audio]}})
+
+        if generator.packetInterval > 0:
+            self.__nextCall = reactor.callLater(generator.packetInterval,
+                                                self.__sendPacket,
+                                                packetNumber + 1)
+        else:
+            self.__sendPacket(packetNumber + 1)
+
+    def __requestCompleted(self):
+        '''Called when the current request has been completed, to start the
+        next request, or end the session.
+
+        '''
+        generator = self.__generator
+        generator.latencies.append(time() - self.__finishSent)
+
+        self.__requestId = None
+        self.__timeoutCall.cancel()
+        self.__timeoutCall = None
+
+        if self.__requestsMade == generator.requests:
+            self.__completed = True
+            self.transport.loseConnection()
+            return
+
+        # Keep to the rate of requests, unless the device has fallen behind
+        delay = 0.0
+        if generator.rate > 0:
+            delay = max(0.0, self.__requestStarted + 1.0 / generator.rate - \
+                            time())
+        self.__nextCall = reactor.callLater(delay, self.__startRequest)
+
+    def __fail(self, reason):
+        '''Fail the session.
+
+        * reason -- The reason the session failed
+
+        '''
+        if self.__ended:
+            return
+
+        self.__generator.log.debug("Device %d failed: %s" % \
+                                       (self.__device.index, reason), level=2)
+        self.__generator.failures += 1
+        self.transport.loseConnection()
+        self.__end()
+
+    def __end(self):
+        '''End the session once, and tell the device.'''
+        if self.__ended:
+            return
+        self.__ended = True
+
+        if self.__pings is not None and self.__pings.running:
+            self.__pings.stop()
+        for call in (self.__nextCall, self.__timeoutCall):
+            if call is not None and call.active():
+                call.cancel()
+
+        self.__device.sessionEnded(self.__completed)
+
+
+class _SessionFactory(protocol.ClientFactory):
+    '''The _SessionFactory class creates the session of a device.'''
+
+    def __init__(self, device):
+        '''
+        * device -- The _Device
+
+        '''
+        self.__device = device
+
+    def buildProtocol(self, _addr):
+        '''Build the protocol for the session.
+
+        * _addr -- The address
+
+        '''
+        return _Session(self.__device)
+
+    def clientConnectionFailed(self, connector, reason):
+        '''Called when the device could not connect to pysiriproxy.
+
+        * connector -- The connector
+        * reason -- The reason the connection failed
+
+        '''
+        generator = self.__device.generator
+        generator.log.error("Device %d could not connect: %s" % \
+                                (self.__device.index,
+                                 reason.getErrorMessage()))
+        generator.failures += 1
+
+        # Wait before trying again, so that a missing proxy is not
+        # connected to as fast as possible
+        reactor.callLater(1.0, self.__device.sessionEnded, False)
+
+
+class _ProcessUsage:
+    '''The _ProcessUsage class measures the CPU time used by a process, and
+    the largest amount of memory it was seen to be using.
+
+    '''
+
+    def __init__(self, pid=None):
+        '''
+        * pid -- The id of the process, or None for this process
+
+        '''
+        self.__pid = pid or getpid()
+        self.__ticks = sysconf("SC_CLK_TCK")
+        self.__sampler = task.LoopingCall(self.__sample)
+
+        self.__startCpu = None
+        self.__cpu = None
+        self.__rss = 0
+
+    def start(self):
+        '''Start measuring the process.'''
+        self.__startCpu = self.__getCpu()
+        self.__cpu = None
+        self.__rss = 0
+        self.__sampler.start(1.0)
+
+    def stop(self):
+        '''Stop measuring the process.'''
+        self.__sample()
+        self.__cpu = self.__getCpu()
+        if self.__sampler.running:
+            self.__sampler.stop()
+
+    def get(self):
+        '''Get the (CPU seconds, resident set size in bytes) tuple.'''
+        cpu = self.__cpu if self.__cpu is not None else self.__getCpu()
+        return cpu - self.__startCpu, self.__rss
+
+    ##### Private functions #####
+
+    def __sample(self):
+        '''Record the current resident set size of the process.'''
+        self.__rss = max(self.__rss, self.__getRss())
+
+    def __getCpu(self):
+        '''Get the number of seconds of CPU time used by the process.'''
+        try:
+            with open("/proc/%d/stat" % self.__pid) as statFile:
+                # The command name may contain spaces, so split the fields
+                # after the closing parenthesis
+                fields = statFile.read().rsplit(")", 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / float(self.__ticks)
+        except IOError:
+            usage = getrusage(RUSAGE_SELF)
+            return usage.ru_utime + usage.ru_stime
+
+    def __getRss(self):
+        '''Get the resident set size of the process in bytes.'''
+        try:
+            with open("/proc/%d/status" % self.__pid) as statusFile:
+                for line in statusFile:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except IOError:
+            pass
+
+        return getrusage(RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _percentile(values, fraction):
+    '''Get a percentile of a sorted list of values, or None if the list is
+    empty.
+
+    * values -- The sorted list of values
+    * fraction -- The percentile as a fraction between zero and one
+
+    '''
+    if len(values) == 0:
+        return None
+
+    index = int(round(fraction * (len(values) - 1)))
+    return values[index]
+
+
+def report(results):
+    '''Get the list of lines describing the results of a load test.
+
+    * results -- The dictionary of results
+
+    '''
+    latency = results["latency"]
+
+    def toMilliseconds(seconds):
+        '''Format a latency in milliseconds.'''
+        return "-" if seconds is None else "%.1fms" % (seconds * 1000)
+
+    return [
+        "Devices: %d, elapsed: %.1fs" % (results["devices"],
+                                         results["elapsed"]),
+        "Sessions: %d (%.2f/s), requests: %d, failures: %d" % \
+            (results["sessions"], results["sessionsPerSecond"],
+             results["requests"], results["failures"]),
+        "Frames: %d sent, %d received (%.1f/s)" % \
+            (results["framesSent"], results["framesReceived"],
+             results["framesPerSecond"]),
+        "Latency: p50 %s, p95 %s, p99 %s, max %s" % \
+            (toMilliseconds(latency["p50"]), toMilliseconds(latency["p95"]),
+             toMilliseconds(latency["p99"]), toMilliseconds(latency["max"])),
+        "CPU: %.2fs (%.1f%%), RSS: %.1fMB" % \
+            (results["cpuSeconds"], results["cpuPercent"],
+             results["rssBytes"] / (1024.0 * 1024.0)),
+        ]
+
+
+def compare(results, baseline, tolerance=0.1):
+    '''Compare the results of a load test with the results of a previous
+    run, and get the list of regressions. A regression is a failed request,
+    a rate of sessions or frames more than the tolerance below the baseline,
+    or a p99 latency more than the tolerance above the baseline.
+
+    * results -- The dictionary of results
+    * baseline -- The dictionary of results of the previous run
+    * tolerance -- The fraction by which the results may be worse
+
+    '''
+    regressions = []
+
+    if results["failures"] > baseline["failures"]:
+        regressions.append("%d requests failed (baseline %d)" % \
+                               (results["failures"], baseline["failures"]))
+
+    for name in ("sessionsPerSecond", "framesPerSecond"):
+        if results[name] < baseline[name] * (1.0 - tolerance):
+            regressions.append("%s fell from %.2f to %.2f" % \
+                                   (name, baseline[name], results[name]))
+
+    p99 = results["latency"]["p99"]
+    baselineP99 = baseline["latency"]["p99"]
+    if p99 is not None and baselineP99 is not None and \
+            p99 > baselineP99 * (1.0 + tolerance):
+        regressions.append("p99 latency rose from %.1fms to %.1fms" % \
+                               (baselineP99 * 1000, p99 * 1000))
+
+    return regressions
+
+
+def _startLocal(logger):
+    '''Start pysiriproxy and the fake server in this process, using the
+    configured 'Server' and 'iPhone' sections.
+
+    * logger -- The logger
+
+    '''
+    from pysiriproxy.connections import iphone
+    from pysiriproxy.testing import fakeServer
+
+    fakeServer.listen(logger, Options.get(Sections.Server, Ids.Port),
+                      Options.get(Sections.Server, Ids.Host))
+    iphone.connect(logger)
+
+
+if __name__ == '__main__':
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("-H", "--host", default="127.0.0.1",
+                      help="The host pysiriproxy is listening on")
+    parser.add_option("-p", "--port", type="int",
+                      help="The port pysiriproxy is listening on (defaults " \
+                          "to the configured iPhone port)")
+    parser.add_option("-n", "--devices", type="int", default=1,
+                      help="The number of simulated iPhones")
+    parser.add_option("-t", "--duration", type="float", default=10.0,
+                      help="The number of seconds to start sessions for")
+    parser.add_option("-r", "--rate", type="float", default=1.0,
+                      help="The number of requests per second made by each " \
+                          "device, or zero for as fast as possible")
+    parser.add_option("-q", "--requests", type="int", default=1,
+                      help="The number of requests made in each session")
+    parser.add_option("-k", "--packets", type="int", default=10,
+                      help="The number of SpeechPackets in each request")
+    parser.add_option("-b", "--packet-size", type="int", default=640,
+                      dest="packetSize",
+                      help="The number of bytes of audio in each SpeechPacket")
+    parser.add_option("-i", "--packet-interval", type="float", default=0.0,
+                      dest="packetInterval",
+                      help="The number of seconds between SpeechPackets")
+    parser.add_option("--timeout", type="float", default=10.0,
+                      help="The number of seconds to wait for a request")
+    parser.add_option("--pid", type="int",
+                      help="The id of the pysiriproxy process to measure")
+    parser.add_option("-l", "--local", action="store_true", default=False,
+                      help="Run pysiriproxy and the fake server in this " \
+                          "process")
+    parser.add_option("-o", "--output",
+                      help="Write the results to this JSON file")
+    parser.add_option("-c", "--baseline",
+                      help="Fail if the results are worse than the results " \
+                          "in this JSON file")
+    parser.add_option("--tolerance", type="float", default=0.1,
+                      help="The fraction by which the results may be worse " \
+                          "than the baseline")
+    options, _args = parser.parse_args(argv[1:])
+
+    logger = LogData(LogLevel.ERROR, 0)
+    Options(logger).parse([], Files.ConfigFile)
+
+    if options.local:
+        _startLocal(logger)
+
+    port = options.port or Options.get(Sections.iPhone, Ids.Port)
+    generator = LoadGenerator(logger, options.host, port, options.devices,
+                              options.duration, options.rate,
+                              options.requests, options.packets,
+                              options.packetSize, options.packetInterval,
+                              options.timeout, options.pid)
+
+    regressions = []
+
+    def finished(results):
+        '''Report the results, and stop the reactor.'''
+        for line in report(results):
+            print line
+
+        if options.output is not None:
+            with open(options.output, "w") as outFile:
+                json.dump(results, outFile, indent=4, sort_keys=True)
+
+        if options.baseline is not None:
+            with open(options.baseline) as baselineFile:
+                regressions.extend(compare(results, json.load(baselineFile),
+                                           options.tolerance))
+            for regression in regressions:
+                print "Regression: %s" % regression
+
+        reactor.stop()
+
+    reactor.callWhenRunning(lambda: generator.start().addCallback(finished))
+    reactor.run()
+
+    exit(1 if len(regressions) > 0 else 0)
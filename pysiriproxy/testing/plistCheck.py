@@ -0,0 +1,127 @@
+# Copyright (C) 2012 Brett Ponsler, Pete Lamonica
+# This file is part of pysiriproxy.
+#
+# pysiriproxy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pysiriproxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pysiriproxy.  If not, see <http://www.gnu.org/licenses/>.
+'''The plistCheck module checks that writing a :class:`.SiriObject`
+directly into a binary plist creates the same data as writing the
+dictionary created by its toDict function.
+
+Each sample object is written both ways with :func:`.Plist.toBinary`, and
+both binary plists are read back with :func:`.Plist.convert` and compared.
+The samples include views created by the :class:`.ResponseFactory`, a view
+class which does not declare its properties, and a class which provides its
+own toDict function. The check can be run from the command line, and exits
+with a non-zero status if any sample is written differently::
+
+    python -m pysiriproxy.testing.plistCheck
+
+'''
+from sys import exit
+
+from pysiriproxy.plist import Plist
+from pysiriproxy.constants import Keys
+from pysiriproxy.objects.views import Views
+from pysiriproxy.objects.baseObject import SiriObject
+from pysiriproxy.objects.factory import ResponseFactory
+from pysiriproxy.objects.dataObjects import DataObjects
+
+from pyamp.logging import LogData
+
+
+class _UndeclaredView(SiriObject):
+    '''The _UndeclaredView class is a view which does not declare its
+    properties, and stores them as attributes instead.
+
+    '''
+
+    def __init__(self, text, items):
+        '''
+        * text -- The text of the view
+        * items -- The list of SiriObjects shown by the view
+
+        '''
+        SiriObject.__init__(self, "UndeclaredView", "com.apple.ace.assistant")
+        self.text = text
+        self.items = items
+        self._hidden = "Not a property"
+
+
+class _ConvertedView(SiriObject):
+    '''The _ConvertedView class is a view which provides its own toDict
+    function.
+
+    '''
+    Properties = ["text"]
+
+    def __init__(self, text):
+        '''
+        * text -- The text of the view
+
+        '''
+        SiriObject.__init__(self, "ConvertedView", "com.apple.ace.assistant")
+        self.text = text
+
+    def toDict(self):
+        '''Convert this object into a Python dictionary.'''
+        return {Keys.Class: self.getClassName(),
+                Keys.Group: "com.apple.ace.assistant",
+                Keys.Properties: {"text": self.text.upper()}}
+
+
+def createSamples():
+    '''Get the list of (name, SiriObject) tuples for the sample objects.'''
+    lines = [DataObjects.create(DataObjects.AnswerLine, text="Line %d" % n)
+             for n in range(3)]
+    answer = DataObjects.create(DataObjects.Answer, title="Answer",
+                                lines=lines)
+    snippet = Views.create(Views.AnswerSnippet, answers=[answer])
+
+    return [
+        ("utterance", ResponseFactory.utterance("REFID", "Hello",
+                                                asObject=True)),
+        ("answerSnippet", ResponseFactory.view("REFID", [snippet],
+                                               asObject=True)),
+        ("undeclaredView", ResponseFactory.view(
+                "REFID", [_UndeclaredView("Text", lines)], asObject=True)),
+        ("convertedView", ResponseFactory.view(
+                "REFID", [_ConvertedView("Text")], asObject=True)),
+        ]
+
+
+def checkPlists(logger):
+    '''Write each sample object into a binary plist both directly, and as a
+    dictionary, and get the list of names of the samples whose binary plists
+    contain different data.
+
+    * logger -- The logger
+
+    '''
+    failures = []
+    for name, obj in createSamples():
+        direct = Plist.convert(Plist.toBinary(obj, logger))
+        converted = Plist.convert(Plist.toBinary(obj.toDict(), logger))
+        if direct != converted:
+            failures.append(name)
+
+    return failures
+
+
+if __name__ == '__main__':
+    failures = checkPlists(LogData())
+    for failure in failures:
+        print "[%s] was written differently from its dictionary" % failure
+
+    print "%d of %d samples were written differently" % \
+        (len(failures), len(createSamples()))
+    exit(1 if failures else 0)
@@ -18,9 +18,43 @@
 '''The pluginTester module contains a class that provides the ability
 to test the object filters and speech rules.
 
+Besides testing a single utterance given on the command line, the module can
+test a corpus of utterances and objects, given as a file containing one JSON
+object per line, with the --corpus option::
+
+    {"id": "call-1", "utterance": "call mom",
+     "expect": {"plugin": "Calls", "rule": "callMom"}}
+    {"object": {"class": "StartRequest", ...}, "direction": "iPhone"}
+
+Each line contains either an 'utterance', or an 'object' and the
+'direction' it was received from ('iPhone' or 'Server'). The optional 'id'
+is copied to the results, and the optional 'expect' gives the plugin and
+rule (the name of the speech rule or filter function) expected to match the
+item, or null if nothing should match it. The rule may be left out to only
+check the plugin.
+
+The corpus is read as it is tested, and is divided into batches of lines
+which are tested by a pool of processes. The result for each item (the
+plugins and rules which matched it, and the time it took) can be written as
+a line of JSON, in the order of the corpus, and a summary of the number of
+items tested per second, the number of items matched by each plugin, and
+the items which did not match what was expected is printed once the corpus
+is tested.
+
+.. note:: The twisted reactor does not run while the corpus is tested, so
+          the time taken by blocking and isolated plugins is not measured
+          beyond the time taken to start them, though the plugin which
+          matched the item is still reported.
+
 '''
-from sys import argv, stdout
+import json
+from time import time
+from itertools import islice
+from sys import argv, exit, stderr, stdin, stdout
+from optparse import OptionParser
+from multiprocessing import Pool
 
+from pysiriproxy.constants import Directions
 from pysiriproxy.options.config import Files
 from pysiriproxy.options.options import Options
 from pysiriproxy.plugins.manager import PluginManager
@@ -47,10 +81,13 @@ class PluginTester:
 
     '''
 
-    def __init__(self, logData=None, logColor=Colors.Foreground.Green):
+    def __init__(self, logData=None, logColor=Colors.Foreground.Green,
+                 args=None):
         '''
         * logData -- The LogData object
         * logColor -- The color to use for the Logger
+        * args -- The command line arguments used to parse the options, or
+                  None to use the arguments given to the process
 
         '''
         # Create a logger just for the options loading
@@ -60,10 +97,10 @@ class PluginTester:
 
         # Parse the siri proxy configuration options object
         options = Options(logData)
-        options.parse(argv, Files.ConfigFile)
+        options.parse(argv if args is None else args, Files.ConfigFile)
 
         # Set the callback for the iPhone, and Server connections
-        Server.Callback = self.iPhoneCallback
+        iPhone.Callback = self.iPhoneCallback
         Server.Callback = self.serverCallback
 
         # Create the connection manager, and connect the iPhone and
@@ -102,6 +139,39 @@ class PluginTester:
         self.__log.debug("Testing speech: [%s]" % speech, 2)
         return self.__pluginManager.processSpeechRules(speech)
 
+    def testItem(self, item):
+        '''Test a single item of a corpus, and get the dictionary of results
+        for it. The context is reset after the item is tested so that
+        conversations started by one item do not capture the next.
+
+        * item -- The dictionary describing the item (see the module)
+
+        '''
+        result = {"id": item.get("id")}
+
+        start = time()
+        if "utterance" in item:
+            result["utterance"] = item["utterance"]
+            self.testSpeech(item["utterance"])
+        else:
+            direction = _getDirection(item.get("direction"))
+            result["direction"] = direction
+            response = self.testFilters(item["object"], direction)
+            result["dropped"] = response == False
+        result["seconds"] = time() - start
+
+        matches = self.__pluginManager.getMatches()
+        self.__pluginManager.resetContext()
+
+        result["matches"] = [list(match) for match in matches]
+        result["plugin"], result["rule"] = matches[0] if matches \
+            else (None, None)
+
+        if "expect" in item:
+            result["ok"] = _isExpected(item["expect"], matches)
+
+        return result
+
     ##### Callback methods #####
 
     def iPhoneCallback(self, cls, obj):
@@ -123,11 +193,263 @@ class PluginTester:
         self.__log.info(obj)
 
 
+class CorpusTester(PluginTester):
+    '''The CorpusTester class is a :class:`PluginTester` which tests a
+    corpus of items without logging the objects sent by the plugins.
+
+    '''
+
+    def iPhoneCallback(self, cls, obj):
+        '''Ignore objects sent from the iPhone.'''
+        pass
+
+    def serverCallback(self, cls, obj):
+        '''Ignore objects sent from the server.'''
+        pass
+
+
+class CorpusSummary:
+    '''The CorpusSummary class counts the results of testing a corpus as
+    they are produced, so that the results do not need to be kept.
+
+    '''
+
+    def __init__(self):
+        self.__start = time()
+        self.__items = 0
+        self.__seconds = 0.0
+        self.__errors = []
+        self.__failures = []
+        self.__plugins = {}
+
+    def add(self, result):
+        '''Count the result for an item of the corpus.
+
+        * result -- The dictionary of results for the item
+
+        '''
+        self.__items += 1
+
+        if "error" in result:
+            self.__errors.append(result)
+            return
+
+        self.__seconds += result["seconds"]
+        plugin = result["plugin"]
+        self.__plugins[plugin] = self.__plugins.get(plugin, 0) + 1
+
+        if result.get("ok") == False:
+            self.__failures.append(result)
+
+    def get(self):
+        '''Get the dictionary summarizing the results counted so far.'''
+        elapsed = time() - self.__start
+        return {
+            "items": self.__items,
+            "elapsed": elapsed,
+            "itemsPerSecond": self.__items / elapsed if elapsed > 0 else 0.0,
+            "seconds": self.__seconds,
+            "plugins": self.__plugins,
+            "errors": self.__errors,
+            "failures": self.__failures,
+            }
+
+    def write(self, output):
+        '''Write the summary to an output file.
+
+        * output -- The file object
+
+        '''
+        summary = self.get()
+        tested = summary["items"] - len(summary["errors"])
+
+        output.write("Tested %d items in %.3f seconds (%.1f items/s)\n" % \
+                         (summary["items"], summary["elapsed"],
+                          summary["itemsPerSecond"]))
+        if tested > 0:
+            output.write("Average time in plugins: %.3fms\n" % \
+                             (summary["seconds"] * 1000 / tested))
+
+        for plugin, count in sorted(summary["plugins"].items()):
+            output.write("  %-30s %d\n" % (plugin or "(no match)", count))
+
+        for result in summary["errors"]:
+            output.write("Error on line %d: %s\n" % (result["line"],
+                                                     result["error"]))
+
+        for result in summary["failures"]:
+            output.write("Unexpected match on line %d (%s): %s.%s\n" % \
+                             (result["line"], result["id"], result["plugin"],
+                              result["rule"]))
+
+
+def testCorpus(corpusFile, processes=1, batchSize=100, logLevel=None):
+    '''Test each item of a corpus, and yield the dictionary of results for
+    each item in the order of the corpus.
+
+    * corpusFile -- The file object containing one JSON item per line
+    * processes -- The number of processes to test the corpus with
+    * batchSize -- The number of lines each process tests at a time
+    * logLevel -- The log level, or None to use the default log level
+
+    '''
+    batches = _readBatches(corpusFile, batchSize)
+
+    if processes <= 1:
+        _startWorker(logLevel)
+        for batch in batches:
+            for result in _testBatch(batch):
+                yield result
+        return
+
+    # The plugins are loaded by each process when it starts
+    pool = Pool(processes, _startWorker, (logLevel,))
+    try:
+        for results in pool.imap(_testBatch, batches):
+            for result in results:
+                yield result
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+##### Private functions #####
+
+# The CorpusTester used by this process to test batches of the corpus
+_tester = None
+
+
+def _startWorker(logLevel):
+    '''Create the CorpusTester used by this process.
+
+    * logLevel -- The log level, or None to use the default log level
+
+    '''
+    global _tester
+
+    logData = LogData() if logLevel is None else LogData(logLevel, 0)
+    _tester = CorpusTester(logData, args=[])
+
+
+def _testBatch(batch):
+    '''Test a batch of lines of the corpus, and get the list of results.
+
+    * batch -- The list of (line number, line) tuples
+
+    '''
+    results = []
+    for lineNumber, line in batch:
+        item = {}
+        try:
+            item = json.loads(line)
+            result = _tester.testItem(item)
+        except Exception, e:
+            result = {"id": item.get("id"),
+                      "error": "%s: %s" % (e.__class__.__name__, e)}
+        result["line"] = lineNumber
+        results.append(result)
+
+    return results
+
+
+def _readBatches(corpusFile, batchSize):
+    '''Read the corpus in batches of (line number, line) tuples, skipping
+    blank lines.
+
+    * corpusFile -- The file object containing one JSON item per line
+    * batchSize -- The number of lines in each batch
+
+    '''
+    lines = ((lineNumber, line) for lineNumber, line in
+             enumerate(corpusFile, 1) if line.strip())
+
+    while True:
+        batch = list(islice(lines, batchSize))
+        if len(batch) == 0:
+            break
+        yield batch
+
+
+def _getDirection(name):
+    '''Get the direction for the name given in the corpus.
+
+    * name -- The name of the direction
+
+    '''
+    directions = {
+        "iPhone": Directions.From_iPhone,
+        "Server": Directions.From_Server,
+        Directions.From_iPhone: Directions.From_iPhone,
+        Directions.From_Server: Directions.From_Server,
+        }
+
+    if name not in directions:
+        raise Exception("Unknown direction: [%s]" % name)
+
+    return directions[name]
+
+
+def _isExpected(expect, matches):
+    '''Determine if the matches for an item are what was expected.
+
+    * expect -- The dictionary containing the expected plugin and rule, or
+                None if nothing was expected to match
+    * matches -- The list of (plugin name, function name) tuples
+
+    '''
+    if expect is None:
+        return len(matches) == 0
+
+    for plugin, rule in matches:
+        if plugin == expect.get("plugin") and \
+                expect.get("rule") in (None, rule):
+            return True
+
+    return False
+
+
 if __name__ == '__main__':
-    args = argv[1:]
-    if len(args) == 0:
-        print "Syntax: %s [the text to test as speech]"
-        exit(1)
+    parser = OptionParser(usage="%prog [options] [the text to test as " \
+                              "speech]")
+    parser.add_option("-c", "--corpus",
+                      help="Test each line of this JSON lines file ('-' " \
+                          "for the standard input)")
+    parser.add_option("-p", "--processes", type="int", default=1,
+                      help="The number of processes used to test the corpus")
+    parser.add_option("-b", "--batch-size", type="int", default=100,
+                      dest="batchSize",
+                      help="The number of lines each process tests at a time")
+    parser.add_option("-o", "--output",
+                      help="Write the result for each item of the corpus " \
+                          "to this JSON lines file ('-' for the standard " \
+                          "output)")
+    options, args = parser.parse_args(argv[1:])
+
+    if options.corpus is None:
+        if len(args) == 0:
+            parser.print_usage()
+            exit(1)
+
+        tester = PluginTester(args=[])
+        tester.testSpeech(' '.join(args))
+        exit(0)
+
+    corpusFile = stdin if options.corpus == "-" else open(options.corpus)
+
+    output = None
+    if options.output == "-":
+        output = stdout
+    elif options.output is not None:
+        output = open(options.output, "w")
+
+    # Write the summary where it will not be mixed with the results
+    summary = CorpusSummary()
+    for result in testCorpus(corpusFile, options.processes,
+                             options.batchSize, LogLevel.ERROR):
+        summary.add(result)
+        if output is not None:
+            output.write(json.dumps(result) + "\n")
+
+    summary.write(stderr if output is stdout else stdout)
 
-    tester = PluginTester()
-    tester.testSpeech(' '.join(argv[1:]))
+    exit(1 if summary.get()["failures"] or summary.get()["errors"] else 0)
@@ -18,6 +18,7 @@ to aid the process of writing test modules for pysiriproxy.
 
 '''
 from pysiriproxy.constants import Directions
+from pysiriproxy.objects.baseObject import SiriObject
 
 from pyamp.logging import LogData, LogLevel, Colors
 
@@ -66,6 +67,10 @@ class Connection:
         * obj -- The object to inject to the output stream
 
         '''
+        # Show the same dictionary that would be sent
+        if SiriObject.isSiriObject(obj):
+            obj = obj.toDict()
+
         if cls.Callback is not None:
             # Have to pass an instance of the Connection to the callback
             # function in order for it to work
@@ -73,6 +78,11 @@ class Connection:
         else:
             cls.__log(obj)
 
+    @classmethod
+    def reset(cls):
+        '''Reset this Connection.'''
+        pass
+
     @classmethod
     def getDirection(cls):
         '''Get the data direction for this Connection.'''
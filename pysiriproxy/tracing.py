@@ -0,0 +1,412 @@
+# Copyright (C) 2012 Brett Ponsler, Pete Lamonica
+# This file is part of pysiriproxy.
+#
+# pysiriproxy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pysiriproxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pysiriproxy.  If not, see <http://www.gnu.org/licenses/>.
+'''The tracing module contains the Tracer class which traces each Siri
+request from the object which starts it on the iPhone to the
+RequestCompleted object which is forwarded back to the iPhone.
+
+A request is started by a StartSpeechRequest or StartRequest object received
+from the iPhone, and every other object belonging to the request refers to the
+aceId of that object with its refId. A trace records the time the request
+started, the time each object of the request was received and forwarded,
+the time the first object of the request was received from Apple's server
+(the upstream first byte), the time the plugins decided whether to handle the
+recognized speech, and the time the RequestCompleted (or CommandFailed)
+object was forwarded to the iPhone (the last byte to the client).
+
+Tracing is enabled by setting the 'TraceFile' property in the 'Debug'
+section of the configuration file. Finished traces are written by a
+background thread, either as one JSON object per line, or in the Chrome
+trace event format (which can be opened with chrome://tracing) when the
+'TraceFormat' property is 'chrome'.
+
+'''
+import json
+from os import getpid
+from Queue import Queue
+from threading import Thread
+from collections import OrderedDict
+
+from twisted.internet import reactor
+
+from pysiriproxy.constants import ClassNames, Directions
+from pysiriproxy.options.options import Options
+from pysiriproxy.options.config import Ids, Sections
+
+
+class TraceFormats:
+    '''The TraceFormats class contains the formats traces can be written
+    in.
+
+    '''
+
+    Chrome = "chrome"
+    '''Write traces in the Chrome trace event format.'''
+
+    Json = "jsonl"
+    '''Write each trace as a JSON object on a single line.'''
+
+
+class Trace:
+    '''The Trace class contains the times recorded for a single request.'''
+
+    def __init__(self, traceId, className, started):
+        '''
+        * traceId -- The aceId of the object which started the request
+        * className -- The class of the object which started the request
+        * started -- The time the request started
+
+        '''
+        self.traceId = traceId
+        self.className = className
+        self.started = started
+
+        # The list of (time, event, direction, class name) tuples
+        self.events = []
+
+        self.upstreamFirstByte = None
+        self.pluginDecision = None
+        self.handled = None
+        self.lastByte = None
+
+    def toDict(self):
+        '''Get a dictionary containing this trace, where all times are the
+        number of seconds since the request started.
+
+        '''
+        return {
+            "id": self.traceId,
+            "class": self.className,
+            "started": self.started,
+            "upstreamFirstByte": self.__offset(self.upstreamFirstByte),
+            "pluginDecision": self.__offset(self.pluginDecision),
+            "handled": self.handled,
+            "lastByteToClient": self.__offset(self.lastByte),
+            "complete": self.lastByte is not None,
+            "events": [[self.__offset(when), event, direction, className] \
+                           for when, event, direction, className in \
+                           self.events],
+            }
+
+    def toChromeEvents(self, threadId):
+        '''Get the list of Chrome trace events for this trace.
+
+        * threadId -- The thread id used to give each trace its own row
+
+        '''
+        pid = getpid()
+        ended = self.lastByte
+        if ended is None:
+            ended = self.events[-1][0] if len(self.events) > 0 \
+                else self.started
+
+        events = [_chromeSpan("%s %s" % (self.className, self.traceId),
+                              self.started, ended, pid, threadId,
+                              {"complete": self.lastByte is not None})]
+
+        if self.upstreamFirstByte is not None:
+            events.append(_chromeSpan("upstream first byte", self.started,
+                                      self.upstreamFirstByte, pid, threadId))
+        if self.pluginDecision is not None:
+            events.append(_chromeInstant("plugin decision",
+                                         self.pluginDecision, pid, threadId,
+                                         {"handled": self.handled}))
+
+        for when, event, direction, className in self.events:
+            events.append(_chromeInstant("%s %s" % (event, className), when,
+                                         pid, threadId,
+                                         {"direction": direction}))
+
+        return events
+
+    def __offset(self, when):
+        '''Get the number of seconds between the start of the request and
+        the given time.
+
+        * when -- The time, or None
+
+        '''
+        return None if when is None else when - self.started
+
+
+class Tracer:
+    '''The Tracer class keeps the traces of the requests which have not
+    completed yet, and hands finished traces to the writer thread.
+
+    Requests which never complete are written as incomplete traces once more
+    than MaxOpenTraces requests are waiting to complete.
+
+    '''
+    # Implement the borg pattern
+    __shared_state = {}
+
+    MaxOpenTraces = 64
+    '''The maximum number of requests traced at once.'''
+
+    StartClasses = frozenset([ClassNames.StartSpeechRequest,
+                              ClassNames.StartRequest])
+    '''The classes of the objects which start a request.'''
+
+    FinishClasses = frozenset([ClassNames.RequestCompleted,
+                               ClassNames.CommandFailed])
+    '''The classes of the objects which complete a request.'''
+
+    def __init__(self):
+        self.__dict__ = self.__shared_state
+
+        if getattr(self, "enabled", None) is None:
+            self.enabled = False
+            self._writer = None
+            self._traces = OrderedDict()
+
+    def start(self, filename, traceFormat=TraceFormats.Json):
+        '''Start tracing requests.
+
+        * filename -- The file the traces are written to
+        * traceFormat -- The format of the traces
+
+        '''
+        self.stop()
+
+        self._writer = _TraceWriter(filename, traceFormat)
+        self.enabled = True
+
+    def stop(self):
+        '''Stop tracing requests, and write the traces which have not
+        completed yet.
+
+        '''
+        if self._writer is None:
+            return
+
+        for trace in self._traces.values():
+            self._writer.write(trace)
+        self._traces.clear()
+
+        self.enabled = False
+        self._writer.close()
+        self._writer = None
+
+    def received(self, obj, direction, when):
+        '''Record an object received from the iPhone or from Apple's server.
+
+        * obj -- The received object
+        * direction -- The direction of the connection which received it
+        * when -- The time the data containing the object was received
+
+        '''
+        className = obj.get("class")
+        if className in self.StartClasses:
+            self.__begin(obj.get("aceId"), className, when)
+            return
+
+        trace = self.__get(obj.get("refId"))
+        if trace is not None:
+            trace.events.append((when, "received", direction, className))
+
+            # Objects received from Apple's server refer to the request
+            # with their refId
+            if trace.upstreamFirstByte is None and \
+                    direction == Directions.From_Server:
+                trace.upstreamFirstByte = when
+
+    def decided(self, refId, handled, when):
+        '''Record the time the plugins decided whether they handle the
+        recognized speech of a request.
+
+        * refId -- The refId of the request
+        * handled -- True if a plugin handled the speech
+        * when -- The time of the decision
+
+        '''
+        trace = self.__get(refId)
+        if trace is not None:
+            trace.pluginDecision = when
+            trace.handled = handled
+
+    def forwarded(self, refId, className, direction, when):
+        '''Record an object forwarded to the iPhone or to Apple's server,
+        and finish the trace of its request if the object completes it.
+
+        * refId -- The refId of the object
+        * className -- The class of the object
+        * direction -- The direction of the connection which forwarded it
+        * when -- The time the object was forwarded
+
+        '''
+        trace = self.__get(refId)
+        if trace is None:
+            return
+
+        trace.events.append((when, "forwarded", direction, className))
+
+        if className in self.FinishClasses and \
+                direction == Directions.From_Server:
+            trace.lastByte = when
+            del self._traces[refId]
+            self._writer.write(trace)
+
+    ##### Private functions #####
+
+    def __begin(self, traceId, className, when):
+        '''Begin the trace of a request.
+
+        * traceId -- The aceId of the object which started the request
+        * className -- The class of the object which started the request
+        * when -- The time the request started
+
+        '''
+        if traceId is None:
+            return
+
+        self._traces[traceId] = Trace(traceId, className, when)
+
+        # Write the oldest requests which have not completed
+        while len(self._traces) > self.MaxOpenTraces:
+            _traceId, trace = self._traces.popitem(last=False)
+            self._writer.write(trace)
+
+    def __get(self, refId):
+        '''Get the trace of the request with the given refId, or None if
+        the request is not traced.
+
+        * refId -- The refId
+
+        '''
+        if refId is None:
+            return None
+
+        return self._traces.get(refId)
+
+
+class _TraceWriter:
+    '''The _TraceWriter class writes traces to a file from a background
+    thread, so writing a trace never blocks the reactor.
+
+    '''
+
+    def __init__(self, filename, traceFormat):
+        '''
+        * filename -- The file the traces are written to
+        * traceFormat -- The format of the traces
+
+        '''
+        self.__filename = filename
+        self.__format = traceFormat
+        self.__queue = Queue()
+
+        self.__thread = Thread(target=self.__run, name="TraceWriter")
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def write(self, trace):
+        '''Write a trace.
+
+        * trace -- The trace
+
+        '''
+        self.__queue.put(trace)
+
+    def close(self):
+        '''Write the remaining traces and close the file.'''
+        self.__queue.put(None)
+        self.__thread.join()
+
+    ##### Private functions #####
+
+    def __run(self):
+        '''Write traces until the writer is closed.'''
+        chrome = self.__format == TraceFormats.Chrome
+
+        # JSON lines from each run can be appended to the same file, but a
+        # Chrome trace is a single list of events, so it is replaced for
+        # each run rather than starting a second list in the same file
+        mode = "w" if chrome else "a"
+
+        with open(self.__filename, mode) as traceFile:
+            # The Chrome trace event format allows the closing bracket of the
+            # list of events to be missing, so only the opening bracket needs
+            # to be written for events to be added as they are traced
+            if chrome:
+                traceFile.write("[\n")
+
+            threadId = 0
+            while True:
+                trace = self.__queue.get()
+                if trace is None:
+                    break
+
+                if chrome:
+                    threadId += 1
+                    for event in trace.toChromeEvents(threadId):
+                        traceFile.write(json.dumps(event) + ",\n")
+                else:
+                    traceFile.write(json.dumps(trace.toDict()) + "\n")
+
+                traceFile.flush()
+
+
+def _chromeSpan(name, started, ended, pid, threadId, args=None):
+    '''Create a Chrome trace event for a span of time.
+
+    * name -- The name of the span
+    * started -- The time the span started
+    * ended -- The time the span ended
+    * pid -- The process id
+    * threadId -- The thread id
+    * args -- The dictionary of arguments for the event
+
+    '''
+    return {"name": name, "ph": "X", "ts": started * 1000000,
+            "dur": (ended - started) * 1000000, "pid": pid, "tid": threadId,
+            "args": args or {}}
+
+
+def _chromeInstant(name, when, pid, threadId, args=None):
+    '''Create a Chrome trace event for an instant in time.
+
+    * name -- The name of the event
+    * when -- The time of the event
+    * pid -- The process id
+    * threadId -- The thread id
+    * args -- The dictionary of arguments for the event
+
+    '''
+    return {"name": name, "ph": "i", "s": "t", "ts": when * 1000000,
+            "pid": pid, "tid": threadId, "args": args or {}}
+
+
+def start(logger):
+    '''Start tracing requests, if the 'TraceFile' property in the 'Debug'
+    section is not empty.
+
+    * logger -- The logger
+
+    '''
+    filename = Options.get(Sections.Debug, Ids.TraceFile, "")
+    traceFormat = Options.get(Sections.Debug, Ids.TraceFormat,
+                              TraceFormats.Json)
+
+    if filename is None or len(filename.strip()) == 0:
+        return
+
+    log = logger.get("Tracer")
+    log.info("Tracing requests to %s" % filename)
+
+    tracer = Tracer()
+    tracer.start(filename, traceFormat)
+
+    # Write the requests which have not completed when pysiriproxy exits
+    reactor.addSystemEventTrigger("before", "shutdown", tracer.stop)
@@ -62,4 +62,7 @@ setup(name='pysiriproxy',
         "twisted==12.1.0",
         "pyamp>=1.2",
         ],
+      extras_require={
+        "intents": ["numpy"],
+        },
       )